@@ -5,44 +5,131 @@ This script parses Gherkin feature files using Behave's parser and generates
 Python step definition stubs with proper type hints and existing step detection.
 """
 
+from __future__ import annotations
+
 import argparse
-import ast
+import heapq
+import mmap
+import os
 import re
+import struct
 import sys
-from dataclasses import dataclass, field
-from difflib import SequenceMatcher
+import time
+import zlib
+from collections.abc import Callable, Iterable, Iterator
 from pathlib import Path
-from typing import Any
+
+# Modules that are slow to import (ast, dataclasses, difflib, hashlib,
+# sqlite3, typing and the optional backends) are imported by the code paths
+# that use them; test_generate_stubs.py enforces the startup budget
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import sqlite3
+    from typing import Any
+
+
+class Record:
+    """Base for plain value records, compared and printed field by field.
+
+    Stands in for dataclasses, whose import pulls in inspect and ast and
+    adds about 10 ms to every start. Subclasses list their fields in
+    __slots__ and assign every one of them in __init__.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    __hash__ = None  # type: ignore[assignment]
 
 
-@dataclass
-class Step:
+class Step(Record):
     """Represents a Gherkin step."""
 
-    step_type: str  # 'given', 'when', 'then'
-    text: str  # Original step text
-    pattern: str  # Regex pattern for matching
-    params: list[str]  # Parameter names
-    param_types: dict[str, str] = field(default_factory=dict)  # Parameter types
-    has_table: bool = False  # Has data table
-    has_docstring: bool = False  # Has doc string
-    docstring_content_type: str | None = None  # Doc string content type
+    __slots__ = (
+        "step_type",  # 'given', 'when', 'then'
+        "text",  # Original step text
+        "pattern",  # Regex pattern for matching
+        "params",  # Parameter names
+        "param_types",  # Parameter types
+        "has_table",  # Has data table
+        "has_docstring",  # Has doc string
+        "docstring_content_type",  # Doc string content type
+    )
+
+    def __init__(
+        self,
+        step_type: str,
+        text: str,
+        pattern: str,
+        params: list[str],
+        param_types: dict[str, str] | None = None,
+        has_table: bool = False,
+        has_docstring: bool = False,
+        docstring_content_type: str | None = None,
+    ) -> None:
+        self.step_type = step_type
+        self.text = text
+        self.pattern = pattern
+        self.params = params
+        self.param_types = {} if param_types is None else param_types
+        self.has_table = has_table
+        self.has_docstring = has_docstring
+        self.docstring_content_type = docstring_content_type
 
 
-@dataclass
-class ExistingStepDef:
+class ExistingStepDef(Record):
     """Represents an existing step definition."""
 
-    step_type: str
-    pattern: str
-    function_name: str
-    file_path: Path
-    line_number: int
+    __slots__ = ("step_type", "pattern", "function_name", "file_path", "line_number")
+
+    def __init__(
+        self,
+        step_type: str,
+        pattern: str,
+        function_name: str,
+        file_path: Path,
+        line_number: int,
+    ) -> None:
+        self.step_type = step_type
+        self.pattern = pattern
+        self.function_name = function_name
+        self.file_path = file_path
+        self.line_number = line_number
+
+
+class StepConflict(Record):
+    """Two step definitions behave cannot tell apart."""
+
+    __slots__ = (
+        "kind",  # 'duplicate' or 'ambiguous'
+        "first",  # earlier in scan order
+        "second",
+    )
+
+    def __init__(
+        self, kind: str, first: ExistingStepDef, second: ExistingStepDef
+    ) -> None:
+        self.kind = kind
+        self.first = first
+        self.second = second
 
 
 class TypeInferencer:
     """Infer parameter types from patterns and names."""
 
+    # Bump when inferred types change (FeatureCache)
+    VERSION = 1
+
     INT_NAMES = {
         "count",
         "number",
@@ -210,698 +297,4935 @@ class TypeInferencer:
         return words
 
 
-class ExistingStepScanner:
-    """Scans for existing step definitions in Python files."""
+class StepCatalog:
+    """Existing step definitions bucketed by step type.
+
+    Each bucket holds (normalized_pattern, step) pairs in scan order, so
+    similarity lookups neither re-normalize patterns nor skip over steps of
+    other types. Built once per run and shared by the scanner, the
+    similarity engines and the generator.
+    """
+
+    STEP_TYPES = ("given", "when", "then")
+
+    # A "{name}" or "{name:format}" placeholder; group 1 is ":format"
+    PLACEHOLDER_RE = re.compile(r"\{[^{}:]*((?::[^{}]*)?)\}")
 
-    def scan_directory(self, steps_dir: Path) -> list[ExistingStepDef]:
+    def __init__(
+        self,
+        existing_steps: Iterable[ExistingStepDef] = (),
+        prebuilt: "CompiledStepIndex | None" = None,
+    ) -> None:
         """
-        Scan all Python files in steps directory.
+        Build the catalog.
 
         Args:
-            steps_dir: Directory containing step definition files
+            existing_steps: Existing step definitions, in scan order
+            prebuilt: Compiled step index whose definitions come first; its
+                precomputed trigram postings are reused by TrigramIndex
+        """
+        self.prebuilt = prebuilt
+        self.steps: list[ExistingStepDef] = []
+        self.buckets: dict[str, list[tuple[str, ExistingStepDef]]] = {
+            step_type: [] for step_type in self.STEP_TYPES
+        }
+        self.canonical: dict[tuple[str, str], ExistingStepDef] = {}
 
-        Returns:
-            List of existing step definitions
+        if prebuilt is not None:
+            for existing in prebuilt:
+                self.add(existing)
+        for existing in existing_steps:
+            self.add(existing)
+
+    def close(self) -> None:
+        """Close the compiled step index the catalog was built on, if any."""
+        if self.prebuilt is not None:
+            self.prebuilt.close()
+
+    @classmethod
+    def wrap(
+        cls, existing_steps: "StepCatalog | Iterable[ExistingStepDef]"
+    ) -> "StepCatalog":
+        """Return existing_steps as a catalog, building one only if needed."""
+        if isinstance(existing_steps, cls):
+            return existing_steps
+        return cls(existing_steps)
+
+    @staticmethod
+    def normalize(pattern: str) -> str:
+        """Normalize a pattern for similarity comparison."""
+        return pattern.lower()
+
+    @classmethod
+    def canonicalize(cls, pattern: str) -> str:
         """
-        if not steps_dir.exists() or not steps_dir.is_dir():
-            return []
+        Get the canonical form of a pattern for exact matching.
 
-        existing_steps: list[ExistingStepDef] = []
+        Placeholder names are dropped and only their format is kept, so
+        'a user named "{name}"' and 'a user named "{username}"' are the same
+        step, while '{count:d}' and '{count}' are not.
 
-        for py_file in steps_dir.glob("**/*.py"):
-            if py_file.name.startswith("_"):
-                continue
+        Args:
+            pattern: Step pattern
 
-            try:
-                existing_steps.extend(self._parse_file(py_file))
-            except Exception:
-                # Skip files that can't be parsed
-                continue
+        Returns:
+            Canonical pattern
+        """
+        return cls.PLACEHOLDER_RE.sub(r"{\1}", pattern)
 
-        return existing_steps
+    def add(self, existing: ExistingStepDef) -> None:
+        """
+        Add a step definition to the catalog.
 
-    def _parse_file(self, file_path: Path) -> list[ExistingStepDef]:
+        Args:
+            existing: Existing step definition
         """
-        Parse a Python file for step definitions using AST.
+        self.steps.append(existing)
+        self.buckets.setdefault(existing.step_type, []).append(
+            (self.normalize(existing.pattern), existing)
+        )
+        # First definition wins, like behave's step registry
+        self.canonical.setdefault(
+            (existing.step_type, self.canonicalize(existing.pattern)), existing
+        )
+
+    def find_exact(self, step: Step) -> ExistingStepDef | None:
+        """
+        Find an existing definition with the same canonical pattern as a step.
 
         Args:
-            file_path: Path to Python file
+            step: New step
 
         Returns:
-            List of step definitions found in file
+            Matching step definition, or None
         """
-        steps: list[ExistingStepDef] = []
+        return self.canonical.get((step.step_type, self.canonicalize(step.pattern)))
 
-        try:
-            tree = ast.parse(file_path.read_text(encoding="utf-8"))
-        except SyntaxError:
-            return steps
+    def bucket(self, step_type: str) -> list[tuple[str, ExistingStepDef]]:
+        """
+        Get the (normalized_pattern, step) pairs of one step type.
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                # Look for @given/@when/@then decorators
-                for decorator in node.decorator_list:
-                    if isinstance(decorator, ast.Call):
-                        if hasattr(decorator.func, "id"):
-                            decorator_name = decorator.func.id
-                            if decorator_name in ("given", "when", "then"):
-                                # Extract pattern from first argument
-                                if decorator.args:
-                                    pattern_node = decorator.args[0]
-                                    if isinstance(pattern_node, ast.Constant):
-                                        pattern = pattern_node.value
-                                        steps.append(
-                                            ExistingStepDef(
-                                                step_type=decorator_name,
-                                                pattern=pattern,
-                                                function_name=node.name,
-                                                file_path=file_path,
-                                                line_number=node.lineno,
-                                            )
-                                        )
+        Args:
+            step_type: 'given', 'when' or 'then'
 
-        return steps
+        Returns:
+            Pairs in scan order
+        """
+        return self.buckets.get(step_type, [])
 
-    def find_similar_steps(
-        self,
-        new_step: Step,
-        existing_steps: list[ExistingStepDef],
-        threshold: float = 0.6,
-    ) -> list[tuple[float, ExistingStepDef]]:
+    def fingerprint(self) -> str:
         """
-        Find existing steps similar to new step.
+        Get a version fingerprint of the catalog contents.
 
-        Args:
-            new_step: New step to match
-            existing_steps: List of existing step definitions
-            threshold: Similarity threshold (0.0-1.0)
+        Any added, removed, moved or edited definition changes it.
 
         Returns:
-            List of (similarity, step) tuples, sorted by similarity
+            Hex digest over every definition, in scan order
         """
-        similar: list[tuple[float, ExistingStepDef]] = []
+        import hashlib
 
-        for existing in existing_steps:
-            if existing.step_type != new_step.step_type:
-                continue
+        digest = hashlib.sha256()
+        for existing in self.steps:
+            digest.update(
+                f"{existing.step_type}\0{existing.pattern}\0{existing.function_name}"
+                f"\0{existing.file_path}\0{existing.line_number}\n".encode()
+            )
+        return digest.hexdigest()
 
-            # Compare patterns
-            similarity = SequenceMatcher(
-                None, new_step.pattern.lower(), existing.pattern.lower()
-            ).ratio()
+    def __len__(self) -> int:
+        return len(self.steps)
 
-            if similarity >= threshold:
-                similar.append((similarity, existing))
+    def __iter__(self) -> Iterator[ExistingStepDef]:
+        return iter(self.steps)
 
-        # Sort by similarity (highest first)
-        similar.sort(reverse=True, key=lambda x: x[0])
-        return similar
 
+class SqliteStepCatalog(StepCatalog):
+    """StepCatalog mirrored into SQLite with an FTS5 trigram-tokenized column.
 
-class GherkinParser:
-    """Parses Gherkin feature files using Behave's parser."""
+    The definitions are written to a `steps` full-text table on first query,
+    so similar-step candidates (FtsSimilarityEngine) and "which steps
+    mention X" lookups (search()) are indexed queries. With a path, the
+    database is kept on disk keyed on the catalog fingerprint: a process
+    finding an up-to-date file opens it read-only, so concurrent generator
+    runs share one copy, and a stale file is rebuilt next to it and swapped
+    in with a rename. Without a path it lives in memory.
+    """
 
-    PARAM_PATTERNS = [
-        (r'"([^"]*)"', "string"),  # Quoted strings
-        (r"'([^']*)'", "string"),  # Single quoted strings
-        (r"<([^>]+)>", "param"),  # Scenario outline parameters
-        (r"\{([^}]+)\}", "param"),  # Already parameterized steps
-        (r"\b(\d+(?:\.\d+)?)\b", "number"),  # Numbers (int or float)
-    ]
+    FILENAME = "catalog.sqlite3"
 
-    def __init__(self) -> None:
-        """Initialize parser."""
-        self.type_inferencer = TypeInferencer()
+    # Bump when the schema changes
+    VERSION = 2
 
-    def parse_file(self, file_path: Path) -> list[Step]:
+    # Candidates taken per lookup, best bm25 rank first. Lookups are
+    # approximate: a best match outside this cut is never scored.
+    CANDIDATE_LIMIT = 32
+
+    def __init__(
+        self,
+        existing_steps: Iterable[ExistingStepDef] = (),
+        prebuilt: "CompiledStepIndex | None" = None,
+        path: Path | None = None,
+    ) -> None:
         """
-        Parse a feature file using Behave's parser.
+        Build the catalog.
 
         Args:
-            file_path: Path to the .feature file
+            existing_steps: Existing step definitions, in scan order
+            prebuilt: Compiled step index whose definitions come first
+            path: Database file; None keeps the database in memory
+        """
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        self.short_positions: dict[str, list[int]] = {}
+        super().__init__(existing_steps, prebuilt=prebuilt)
+
+    def add(self, existing: ExistingStepDef) -> None:
+        """Add a step definition (see StepCatalog); the database is rebuilt later."""
+        super().add(existing)
+        self.disconnect()
+        self.short_positions.clear()
+
+    def database(self) -> sqlite3.Connection:
+        """
+        Get the connection to an up-to-date database, building it if needed.
 
         Returns:
-            List of unique Step objects
+            Connection to the database (read-only when stored on disk)
 
         Raises:
-            FileNotFoundError: If file doesn't exist
-            ValueError: If file is not a .feature file
+            sqlite3.Error: If the database cannot be built or opened
+            OSError: If the database file cannot be written
         """
-        if not file_path.exists():
-            raise FileNotFoundError(f"Feature file not found: {file_path}")
+        import sqlite3
 
-        if file_path.suffix != ".feature":
-            raise ValueError(f"Expected .feature file, got: {file_path.suffix}")
+        if self.connection is not None:
+            return self.connection
+
+        fingerprint = self.fingerprint()
+        if self.path is None:
+            self.connection = sqlite3.connect(":memory:")
+            self._populate(self.connection, fingerprint)
+            return self.connection
 
+        if self.path.exists():
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                version = connection.execute("PRAGMA user_version").fetchone()[0]
+                stored = connection.execute("SELECT fingerprint FROM meta").fetchone()
+            except sqlite3.Error:
+                version, stored = None, None
+            if version == self.VERSION and stored == (fingerprint,):
+                self.connection = connection
+                return connection
+            connection.close()
+
+        # Build next to the target and rename, so readers never see half a file
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        partial.unlink(missing_ok=True)
+        connection = sqlite3.connect(partial)
         try:
-            from behave.parser import parse_file as behave_parse_file
+            self._populate(connection, fingerprint)
+        finally:
+            connection.close()
+        os.replace(partial, self.path)
+
+        self.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return self.connection
+
+    def _populate(self, connection: sqlite3.Connection, fingerprint: str) -> None:
+        """Create the schema and write every definition."""
+        with connection:
+            connection.execute(f"PRAGMA user_version = {self.VERSION}")
+            connection.execute("CREATE TABLE meta (fingerprint TEXT)")
+            connection.execute("INSERT INTO meta VALUES (?)", (fingerprint,))
+            connection.execute(
+                "CREATE VIRTUAL TABLE steps USING fts5("
+                "pattern, step_type UNINDEXED, position UNINDEXED, "
+                "sequence UNINDEXED, function_name UNINDEXED, path UNINDEXED, "
+                "line UNINDEXED, tokenize='trigram')"
+            )
+            connection.executemany(
+                "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?)", self._rows()
+            )
 
-            feature = behave_parse_file(str(file_path))
-        except ImportError:
-            # Fallback to regex-based parsing if behave not available
-            print(
-                "Warning: behave not installed, using fallback parser",
-                file=sys.stderr,
+    def _rows(self) -> Iterator[tuple]:
+        """Yield a `steps` row per definition, with its bucket position and index."""
+        positions: dict[str, int] = {}
+        for sequence, existing in enumerate(self.steps):
+            position = positions.get(existing.step_type, 0)
+            positions[existing.step_type] = position + 1
+            yield (
+                existing.pattern,
+                existing.step_type,
+                position,
+                sequence,
+                existing.function_name,
+                str(existing.file_path),
+                existing.line_number,
             )
-            return self._parse_file_fallback(file_path)
 
-        return self._extract_steps_from_feature(feature)
+    @staticmethod
+    def _phrase(text: str) -> str:
+        """Quote text as an FTS5 phrase."""
+        return '"' + text.replace('"', '""') + '"'
 
-    def _extract_steps_from_feature(self, feature: Any) -> list[Step]:
+    def candidate_positions(self, step_type: str, text: str) -> list[int]:
         """
-        Extract steps from Behave feature object.
+        Get the bucket positions of the definitions sharing most trigrams with text.
 
         Args:
-            feature: Behave Feature object
+            step_type: 'given', 'when' or 'then'
+            text: Normalized pattern
 
         Returns:
-            List of Step objects
+            Up to CANDIDATE_LIMIT positions by bm25 rank, plus patterns too
+            short to have trigrams, in bucket order
         """
-        steps: list[Step] = []
+        if step_type not in self.short_positions:
+            self.short_positions[step_type] = [
+                position
+                for position, (pattern, _) in enumerate(self.bucket(step_type))
+                if len(pattern) < 3
+            ]
+
+        trigrams = dict.fromkeys(text[i : i + 3] for i in range(len(text) - 2))
+        if not trigrams:
+            return list(range(len(self.bucket(step_type))))
+
+        rows = self.database().execute(
+            "SELECT position FROM steps WHERE steps MATCH ? AND step_type = ? "
+            "ORDER BY rank LIMIT ?",
+            (
+                " OR ".join(map(self._phrase, trigrams)),
+                step_type,
+                self.CANDIDATE_LIMIT,
+            ),
+        )
+        positions = {position for (position,) in rows}
+        positions.update(self.short_positions[step_type])
+        return sorted(positions)
 
-        # Process Background steps
-        if hasattr(feature, "background") and feature.background:
-            previous_step_type: str | None = None
-            for behave_step in feature.background.steps:
-                step = self._convert_behave_step(behave_step, previous_step_type)
-                steps.append(step)
-                previous_step_type = step.step_type
+    def search(self, text: str, step_type: str | None = None) -> list[ExistingStepDef]:
+        """
+        Find the definitions whose pattern contains text (case-insensitive).
 
-        # Process Scenario steps (top-level scenarios)
-        if hasattr(feature, "scenarios"):
-            for scenario in feature.scenarios:
-                if hasattr(scenario, "steps"):
-                    # Reset previous_step_type for each scenario
-                    previous_step_type = None
-                    for behave_step in scenario.steps:
-                        step = self._convert_behave_step(behave_step, previous_step_type)
-                        steps.append(step)
-                        previous_step_type = step.step_type
+        Args:
+            text: Substring to look for
+            step_type: Only return definitions of this type
 
-        # Process Rule blocks (scenarios nested under rules)
-        if hasattr(feature, "rules"):
-            for rule in feature.rules:
-                # Process Rule background (if any)
-                if hasattr(rule, "background") and rule.background:
-                    previous_step_type = None
-                    for behave_step in rule.background.steps:
-                        step = self._convert_behave_step(behave_step, previous_step_type)
-                        steps.append(step)
-                        previous_step_type = step.step_type
+        Returns:
+            Matching definitions, in scan order
+        """
+        if len(text) >= 3:
+            query = "SELECT sequence FROM steps WHERE steps MATCH ?"
+            parameters = [f"pattern : {self._phrase(text)}"]
+        else:
+            # Shorter than a trigram; LIKE still filters without the index
+            query = "SELECT sequence FROM steps WHERE pattern LIKE ? ESCAPE '\\'"
+            escaped = re.sub(r"([%_\\])", r"\\\1", text)
+            parameters = [f"%{escaped}%"]
+        if step_type is not None:
+            query += " AND step_type = ?"
+            parameters.append(step_type)
+        query += " ORDER BY sequence"
+
+        return [
+            self.steps[sequence]
+            for (sequence,) in self.database().execute(query, parameters)
+        ]
 
-                # Process scenarios in the rule
-                if hasattr(rule, "scenarios"):
-                    for scenario in rule.scenarios:
-                        if hasattr(scenario, "steps"):
-                            # Reset previous_step_type for each scenario
-                            previous_step_type = None
-                            for behave_step in scenario.steps:
-                                step = self._convert_behave_step(behave_step, previous_step_type)
-                                steps.append(step)
-                                previous_step_type = step.step_type
+    def disconnect(self) -> None:
+        """Close the database connection; the next query reopens it."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
 
-        return self._deduplicate_steps(steps)
+    def close(self) -> None:
+        """Close the database connection and the compiled step index."""
+        self.disconnect()
+        super().close()
 
-    def _convert_behave_step(
-        self, behave_step: Any, previous_step_type: str | None = None
-    ) -> Step:
+
+class TrigramIndex:
+    """Character-trigram inverted index over a step catalog.
+
+    Used to pick out the existing steps worth scoring with SequenceMatcher,
+    so a lookup only touches definitions that share trigrams with the new
+    pattern instead of the whole catalog. The Dice cutoff is a heuristic,
+    not a bound on the SequenceMatcher ratio: a step matching the new
+    pattern in many short runs can be dropped, so lookups through the index
+    are approximate.
+    """
+
+    # Minimum trigram Dice coefficient for a candidate to be scored exactly.
+    # On the gherkin-examples corpus this keeps about a third of the pairs
+    # and drops one of the 427 best matches scoring >= 0.6.
+    MIN_DICE = 0.2
+
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
         """
-        Convert Behave step to our Step dataclass.
+        Build the index.
 
         Args:
-            behave_step: Behave Step object
-            previous_step_type: Step type from previous step (for And/But/* inheritance)
+            catalog: Existing step definitions to index
+        """
+        self.catalog = StepCatalog.wrap(catalog)
+        self.trigram_counts: dict[str, list[int]] = {}
+        self.postings: dict[str, dict[str, list[tuple[int, int]]]] = {}
+        # Patterns shorter than a trigram can only be found by a full scan
+        self.short_positions: dict[str, list[int]] = {}
+
+        prebuilt = self.catalog.prebuilt
+        for step_type, bucket in self.catalog.buckets.items():
+            trigram_counts = self.trigram_counts[step_type] = []
+            postings = self.postings[step_type] = {}
+            short_positions = self.short_positions[step_type] = []
+
+            # The prebuilt index covers the head of each bucket
+            start = 0
+            if prebuilt is not None and step_type in prebuilt.sections:
+                start = prebuilt.bucket_length(step_type)
+                trigram_counts.extend(prebuilt.trigram_counts(step_type))
+                short_positions.extend(prebuilt.short_positions(step_type))
+
+            for position in range(start, len(bucket)):
+                pattern = bucket[position][0]
+                counts = self._trigrams(pattern)
+                trigram_counts.append(sum(counts.values()))
+                if not counts:
+                    short_positions.append(position)
+                for trigram, count in counts.items():
+                    postings.setdefault(trigram, []).append((position, count))
+
+    @staticmethod
+    def _trigrams(text: str) -> dict[str, int]:
+        """Count the character trigrams in text."""
+        counts: dict[str, int] = {}
+        for i in range(len(text) - 2):
+            trigram = text[i : i + 3]
+            counts[trigram] = counts.get(trigram, 0) + 1
+        return counts
+
+    def candidates(self, new_step: Step) -> list[tuple[str, ExistingStepDef]]:
+        """
+        Get existing steps that share enough trigrams with a new step.
+
+        Args:
+            new_step: New step to match
 
         Returns:
-            Step object
+            (normalized_pattern, step) pairs of the same type, in scan order
         """
-        # Normalize step type
-        step_type = behave_step.keyword.lower().strip()
-        if step_type in ("and", "but", "*"):
-            # And/But/* inherit step type from previous step
-            # If no previous step, default to 'given'
-            step_type = previous_step_type if previous_step_type else "given"
+        step_type = new_step.step_type
+        bucket = self.catalog.bucket(step_type)
+        query = self._trigrams(StepCatalog.normalize(new_step.pattern))
+        query_count = sum(query.values())
+
+        # Too short to have trigrams: every same-type step is a candidate
+        if not query_count:
+            return list(bucket)
+
+        postings = self.postings.get(step_type, {})
+        prebuilt = self.catalog.prebuilt
+        shared: dict[int, int] = {}
+        for trigram, count in query.items():
+            matches = postings.get(trigram, [])
+            if prebuilt is not None:
+                matches = prebuilt.postings(step_type, trigram) + matches
+            for position, existing_count in matches:
+                shared[position] = shared.get(position, 0) + min(count, existing_count)
+
+        trigram_counts = self.trigram_counts.get(step_type, [])
+        positions = [
+            position
+            for position, count in shared.items()
+            if 2 * count >= self.MIN_DICE * (query_count + trigram_counts[position])
+        ]
+        positions.extend(self.short_positions.get(step_type, ()))
+        positions.sort()
 
-        # Extract parameters and create pattern
-        pattern, params = self._extract_parameters(behave_step.name)
+        return [bucket[position] for position in positions]
 
-        # Infer parameter types
-        param_types = {
-            param: self.type_inferencer.infer_type(param, pattern)
-            for param in params
-        }
 
-        # Check for data table
-        has_table = hasattr(behave_step, "table") and behave_step.table is not None
+class BehaveStepMatcher:
+    """Matches step text against existing definitions the way behave does.
 
-        # Check for doc string
-        has_docstring = hasattr(behave_step, "text") and behave_step.text is not None
-        docstring_content_type = None
-        if has_docstring:
-            docstring_content_type = getattr(
-                behave_step.text, "content_type", None
-            )
+    Each pattern is compiled with behave's parse matcher and filed in a trie
+    keyed on its leading literal words (the words before the first
+    placeholder). A step text is only tested against the definitions whose
+    literal prefix it starts with, instead of against the whole catalog.
+    Patterns are compiled lazily, the first time they are tested.
+    """
 
-        return Step(
-            step_type=step_type,
-            text=behave_step.name,
-            pattern=pattern,
-            params=params,
-            param_types=param_types,
-            has_table=has_table,
-            has_docstring=has_docstring,
-            docstring_content_type=docstring_content_type,
-        )
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
+        """
+        Build the trie.
 
-    def _parse_file_fallback(self, file_path: Path) -> list[Step]:
+        Args:
+            catalog: Existing step definitions to match against
+
+        Raises:
+            ImportError: If behave is not installed
         """
-        Fallback parser using regex (when Behave not available).
+        from behave.matchers import ParseMatcher
+
+        self.matcher_class = ParseMatcher
+        self.catalog = StepCatalog.wrap(catalog)
+        self.roots: dict[str, dict[str, Any]] = {}
+        # Compiled matchers by catalog position; None if the pattern is invalid
+        self.matchers: dict[int, Any] = {}
+
+        for position, existing in enumerate(self.catalog.steps):
+            node = self.roots.setdefault(existing.step_type, self._new_node())
+            for word in self.literal_prefix(existing.pattern):
+                node = node["children"].setdefault(word, self._new_node())
+            node["positions"].append(position)
+
+    @staticmethod
+    def _new_node() -> dict[str, Any]:
+        """Create an empty trie node."""
+        return {"children": {}, "positions": []}
+
+    @staticmethod
+    def literal_prefix(pattern: str) -> list[str]:
+        """
+        Get the complete literal words a pattern starts with.
 
         Args:
-            file_path: Path to feature file
+            pattern: Step pattern
 
         Returns:
-            List of Step objects
+            Words before the first placeholder; a word directly attached to
+            the placeholder (like the quote in '"{name}"') is left out
         """
-        content = file_path.read_text(encoding="utf-8")
-        return self._parse_content_fallback(content)
+        brace = pattern.find("{")
+        if brace == -1:
+            return pattern.split()
+
+        prefix = pattern[:brace]
+        words = prefix.split()
+        if words and not prefix[-1].isspace():
+            words.pop()
+        return words
 
-    def _parse_content_fallback(self, content: str) -> list[Step]:
+    def _compiled(self, position: int) -> Any:
+        """Get the compiled parse matcher for a catalog position."""
+        if position not in self.matchers:
+            existing = self.catalog.steps[position]
+            matcher = self.matcher_class(None, existing.pattern, existing.step_type)
+            try:
+                # Unknown custom types only surface when the parser compiles
+                matcher.compile()
+            except ValueError:
+                matcher = None
+            self.matchers[position] = matcher
+        return self.matchers[position]
+
+    def match(self, step_type: str, text: str) -> ExistingStepDef | None:
         """
-        Parse Gherkin content using regex fallback.
+        Find the definition behave would run for a step.
 
         Args:
-            content: Gherkin feature file content
+            step_type: 'given', 'when' or 'then'
+            text: Step text (without keyword)
 
         Returns:
-            List of unique Step objects
+            First matching definition in scan order, or None
         """
-        steps: list[Step] = []
-        current_step_type: str | None = None
+        for position in self.matching_positions(step_type, text):
+            return self.catalog.steps[position]
+        return None
 
-        step_keywords = ("Given", "When", "Then", "And", "But", "*")
+    def matching_positions(self, step_type: str, text: str) -> Iterator[int]:
+        """
+        Find every definition that matches a step.
 
-        for line in content.split("\n"):
-            line = line.strip()
+        Args:
+            step_type: 'given', 'when' or 'then'
+            text: Step text (without keyword)
 
-            # Skip empty lines, comments, and non-step lines
-            if not line or line.startswith("#"):
+        Yields:
+            Catalog positions of matching definitions, in scan order
+        """
+        node = self.roots.get(step_type)
+        if node is None:
+            return
+
+        positions: list[int] = list(node["positions"])
+        for word in text.split():
+            node = node["children"].get(word)
+            if node is None:
+                break
+            positions.extend(node["positions"])
+
+        for position in sorted(positions):
+            matcher = self._compiled(position)
+            if matcher is None:
+                continue
+            try:
+                if matcher.check_match(text) is not None:
+                    yield position
+            except ValueError:
+                # Type converter rejected the text
                 continue
 
-            # Check if line starts with a step keyword
-            for keyword in step_keywords:
-                if line.startswith(f"{keyword} "):
-                    step_text = line[len(keyword) :].strip()
 
-                    # Determine step type
-                    if keyword == "Given":
-                        current_step_type = "given"
-                    elif keyword == "When":
-                        current_step_type = "when"
-                    elif keyword == "Then":
-                        current_step_type = "then"
-                    elif keyword in ("And", "But", "*"):
-                        if not current_step_type:
-                            current_step_type = "given"
-                    else:
-                        continue
+class IgnoreRules:
+    """Gitignore-style rules deciding which paths the step walker skips.
 
-                    # Extract parameters and create pattern
-                    pattern, params = self._extract_parameters(step_text)
+    Each rule is scoped to a base directory: patterns without a slash match
+    a name at any depth below it, patterns with one are anchored to it. As
+    in git, a trailing "/" matches directories only, "!" re-includes, and
+    the last matching rule wins. Rule sets are immutable; extended()
+    returns a new set, so sibling directories do not see each other's
+    .gitignore rules.
+    """
 
-                    # Infer parameter types
-                    param_types = {
-                        param: self.type_inferencer.infer_type(param, pattern)
-                        for param in params
-                    }
+    def __init__(
+        self, rules: tuple[tuple[str, re.Pattern[str], bool, bool], ...] = ()
+    ) -> None:
+        """
+        Initialize rule set.
 
-                    step = Step(
-                        step_type=current_step_type,
-                        text=step_text,
-                        pattern=pattern,
-                        params=params,
-                        param_types=param_types,
-                    )
+        Args:
+            rules: (base, regex, negated, dir_only) tuples, in precedence
+                order (later wins)
+        """
+        self.rules = rules
 
-                    steps.append(step)
-                    break
+    @staticmethod
+    def compile_pattern(pattern: str) -> tuple[re.Pattern[str], bool, bool]:
+        """
+        Translate a gitignore pattern.
 
-        return self._deduplicate_steps(steps)
+        Args:
+            pattern: Pattern line, already stripped
 
-    def _extract_parameters(self, text: str) -> tuple[str, list[str]]:
+        Returns:
+            (regex over the path relative to the rule base, negated, dir_only)
         """
-        Extract parameters from step text and create regex pattern.
+        negated = pattern.startswith("!")
+        if negated:
+            pattern = pattern[1:]
+        if pattern.startswith("\\"):
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+
+        regex = "" if anchored else "(?:.*/)?"
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                regex += ".*"
+                i += 2
+                continue
+            if char == "*":
+                regex += "[^/]*"
+            elif char == "?":
+                regex += "[^/]"
+            elif char == "[" and "]" in pattern[i + 2 :]:
+                end = pattern.index("]", i + 2)
+                members = pattern[i + 1 : end].replace("\\", "\\\\")
+                if members.startswith("!"):
+                    members = "^" + members[1:]
+                regex += f"[{members}]"
+                i = end
+            else:
+                regex += re.escape(char)
+            i += 1
+        return re.compile(regex + "$"), negated, dir_only
+
+    def extended(self, patterns: Iterable[str], base: str) -> "IgnoreRules":
+        """
+        Get a rule set with more patterns appended.
 
         Args:
-            text: Step text
+            patterns: Gitignore-style lines; blanks and comments are skipped
+            base: Directory the patterns are relative to, as a "/"-separated
+                path
 
         Returns:
-            Tuple of (regex_pattern, parameter_names)
+            New rule set
         """
-        pattern = text
-        params: list[str] = []
-        param_counter: dict[str, int] = {}
+        prefix = base.rstrip("/") + "/"
+        added = []
+        for line in patterns:
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            added.append((prefix, *self.compile_pattern(line)))
+        if not added:
+            return self
+        return IgnoreRules(self.rules + tuple(added))
+
+    def extended_from_file(self, gitignore: Path, base: str) -> "IgnoreRules":
+        """Get a rule set extended with the lines of a .gitignore file."""
+        try:
+            lines = gitignore.read_text(encoding="utf-8").splitlines()
+        except (OSError, UnicodeDecodeError):
+            return self
+        return self.extended(lines, base)
 
-        # Collect all matches first with their positions
-        all_matches: list[tuple[int, int, str, str, str]] = []
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """
+        Check whether a path is ignored.
 
-        for regex, param_type in self.PARAM_PATTERNS:
-            for match in re.finditer(regex, text):
-                # Store: (start_pos, end_pos, matched_text, full_match, param_type)
-                all_matches.append(
-                    (
-                        match.start(),
-                        match.end(),
-                        match.group(1),
-                        match.group(0),
-                        param_type,
-                    )
-                )
+        Args:
+            path: "/"-separated absolute path
+            is_dir: Whether path is a directory
 
-        # Remove overlapping matches (keep first match)
-        all_matches.sort(key=lambda x: x[0])
-        filtered_matches: list[tuple[int, int, str, str, str]] = []
-        last_end = -1
+        Returns:
+            True if the last matching rule ignores the path
+        """
+        ignored = False
+        for base, regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if path.startswith(base) and regex.match(path, len(base)):
+                ignored = not negated
+        return ignored
 
-        for match in all_matches:
-            start, end, matched_text, full_match, param_type = match
-            if start >= last_end:
-                filtered_matches.append(match)
-                last_end = end
 
-        # Process matches from right to left to preserve positions
-        for start, end, matched_text, full_match, param_type in reversed(
-            filtered_matches
-        ):
-            # Generate unique parameter name
-            if param_type not in param_counter:
-                param_counter[param_type] = 0
+class ExistingStepScanner:
+    """Scans for existing step definitions in Python files."""
 
-            param_counter[param_type] += 1
+    # Below this many files, worker start-up costs more than it saves
+    MIN_PARALLEL_FILES = 64
+
+    # A given/when/then name after "@", past any whitespace, parentheses,
+    # line continuations and comments: a file without one cannot define a
+    # step. Looser than the AST, so "@(given)(...)" is never skipped.
+    STEP_DECORATOR_RE = re.compile(rb"@(?:[\s\\(]|#[^\n]*)*(?:given|when|then)\b")
+
+    # Never step code: virtualenvs, caches, VCS metadata and build output
+    DEFAULT_IGNORE = (
+        ".git/",
+        ".hg/",
+        ".venv/",
+        "venv/",
+        "__pycache__/",
+        "node_modules/",
+        "site-packages/",
+        ".tox/",
+        ".nox/",
+        ".eggs/",
+        "*.egg-info/",
+        ".mypy_cache/",
+        ".pytest_cache/",
+        ".bdd-cache/",
+        "build/",
+        "dist/",
+    )
 
-            # Use descriptive names when possible
-            if matched_text and not self._is_numeric(matched_text):
-                # Clean up parameter name
-                param_name = re.sub(r"[^a-z0-9_]", "_", matched_text.lower())
-                param_name = re.sub(r"_+", "_", param_name).strip("_")
-                if not param_name or param_name[0].isdigit():
-                    param_name = f"{param_type}{param_counter[param_type]}"
-            else:
-                param_name = f"{param_type}{param_counter[param_type]}"
+    # "lexer" extracts decorators with a regex state machine and falls back
+    # to "ast" for anything it does not handle. It cannot detect syntax
+    # errors, so a file that does not compile can still yield its steps
+    # there; that is why "ast" is the default.
+    BACKENDS = ("ast", "lexer")
+
+    # A string literal body, without prefix
+    STRING_LITERAL = "|".join(
+        (
+            r"'''(?:[^'\\]|\\.|'(?!''))*'''",
+            r'"""(?:[^"\\]|\\.|"(?!""))*"""',
+            r"'(?:[^'\\\n]|\\.)*'",
+            r'"(?:[^"\\\n]|\\.)*"',
+        )
+    )
 
-            params.insert(0, param_name)  # Insert at beginning to maintain order
+    STRING_RE = re.compile(STRING_LITERAL, re.S)
 
-            # Create replacement pattern
-            if param_type == "number":
-                # Determine if int or float
-                if "." in matched_text:
-                    replacement = f"{{{param_name}:f}}"
-                else:
-                    replacement = f"{{{param_name}:d}}"
-            elif param_type == "param":
-                # Already has <> or {}, just use param name
-                replacement = f"{{{param_name}}}"
-            else:
-                # Quoted string - keep quotes in pattern
-                replacement = f'"{{{param_name}}}"'
+    # Characters that start a lexer event; the text in between (names,
+    # operators, string prefixes) needs no attention
+    LEX_EVENT_RE = re.compile(r"""["'#()\[\]{}@\\]""")
 
-            # Replace in pattern using position
-            pattern = pattern[:start] + replacement + pattern[end:]
+    STEP_NAME_RE = re.compile(r"@[ \t\f]*(?:given|when|then)\b")
 
-        return pattern, params
+    # A decorator starting with a name; any other, such as "@(given('x'))"
+    # or an "@" continued onto the next line, is left to the AST
+    NAMED_DECORATOR_RE = re.compile(r"@[ \t\f]*[^\W\d]")
 
-    def _is_numeric(self, text: str) -> bool:
-        """Check if text is numeric."""
-        try:
-            float(text)
-            return True
-        except ValueError:
-            return False
+    # The only step decorator shape the lexer accepts: one plain string
+    STEP_LINE_RE = re.compile(
+        r"@[ \t]*(?P<type>given|when|then)[ \t]*\(\s*"
+        rf"(?P<prefix>(?<!\w)[rRuU]?)(?P<literal>{STRING_LITERAL})"
+        r"\s*\)[ \t]*(?:#[^\n]*)?(?:\n|\Z)",
+        re.S,
+    )
 
-    def _deduplicate_steps(self, steps: list[Step]) -> list[Step]:
+    # Any other single-line decorator between step decorators and the def
+    OTHER_DECORATOR_RE = re.compile(
+        r"""@[ \t]*[\w.]+(?:\([^()'"\n#]*\))?[ \t]*(?:#[^\n]*)?(?:\n|\Z)"""
+    )
+
+    BLANK_LINES_RE = re.compile(r"(?:[ \t]*(?:#[^\n]*)?\n)*")
+
+    DEFINITION_RE = re.compile(r"(?P<async>async[ \t]+)?def[ \t]+(?P<name>\w+)|class\b")
+
+    def __init__(
+        self,
+        backend: str = "ast",
+        ignore: Iterable[str] = (),
+        use_gitignore: bool = True,
+    ) -> None:
         """
-        Remove duplicate steps based on pattern.
+        Initialize scanner.
 
         Args:
-            steps: List of steps
+            backend: How step files are parsed, one of BACKENDS
+            ignore: Extra gitignore-style patterns, relative to the scanned
+                directory, on top of DEFAULT_IGNORE
+            use_gitignore: Also honor .gitignore files in the scanned tree
+                and in its parents up to the repository root
+
+        Raises:
+            ValueError: If backend is unknown
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown scanner backend: {backend}")
+        self.backend = backend
+        self.ignore = tuple(ignore)
+        self.use_gitignore = use_gitignore
+        # Files ruled out by the decorator prefilter in the last scan
+        self.skipped_files = 0
+        # (list, its length, catalog) of the last plain list looked up, so
+        # repeated lookups against one list do not rebuild its catalog
+        self.wrapped: tuple[list[ExistingStepDef], int, StepCatalog] | None = None
+
+    def scan_directory(
+        self, steps_dir: Path, jobs: int = 1, index: "StepIndex | None" = None
+    ) -> list[ExistingStepDef]:
+        """
+        Scan all Python files in steps directory.
+
+        Args:
+            steps_dir: Directory containing step definition files
+            jobs: Number of worker processes for parsing
+            index: Persistent step index; only files changed since the
+                last scan are parsed
 
         Returns:
-            List of unique steps
+            List of existing step definitions (see iter_step_definitions)
         """
-        seen: set[tuple[str, str]] = set()
-        unique_steps: list[Step] = []
+        return list(self.iter_step_definitions(steps_dir, jobs=jobs, index=index))
 
-        for step in steps:
-            key = (step.step_type, step.pattern)
-            if key not in seen:
-                seen.add(key)
-                unique_steps.append(step)
+    def iter_step_definitions(
+        self, steps_dir: Path, jobs: int = 1, index: "StepIndex | None" = None
+    ) -> Iterator[ExistingStepDef]:
+        """
+        Stream the step definitions of all Python files in steps directory.
 
-        return unique_steps
+        Definitions are yielded as each file is parsed, so consumers such as
+        StepCatalog build up while later files are still being read. Files
+        are visited in sorted path order, so results are the same whether
+        they are parsed serially, in worker processes or taken from the
+        index.
 
+        Args:
+            steps_dir: Directory containing step definition files
+            jobs: Number of worker processes for parsing; trees smaller
+                than MIN_PARALLEL_FILES are always parsed serially
+            index: Persistent step index; only files changed since the
+                last scan are parsed (the index is refreshed as a whole
+                before the first definition is yielded)
+
+        Yields:
+            Existing step definitions
+        """
+        self.skipped_files = 0
+        if not steps_dir.exists() or not steps_dir.is_dir():
+            return
 
-class StubGenerator:
-    """Generates Python step definition stubs from steps."""
+        py_files = self.list_step_files(steps_dir)
 
-    TEMPLATE = '''"""Step definitions for {feature_name}."""
-from decimal import Decimal
+        if index is not None:
+            steps = index.refresh(
+                steps_dir,
+                py_files,
+                lambda changed: list(self.iter_scanned_files(changed, jobs)),
+            )
+            self.skipped_files = index.skipped_files
+            yield from steps
+        else:
+            yield from self.iter_parsed_files(py_files, jobs)
 
-from behave import given, when, then
-from behave.runner import Context
+    def list_step_files(self, steps_dir: Path) -> list[Path]:
+        """
+        List the files a scan of steps directory parses.
 
+        Args:
+            steps_dir: Directory containing step definition files
 
-# ============================================================================
-# Given Steps - Setup and Preconditions
-# ============================================================================
+        Returns:
+            Python files not starting with "_", in sorted path order
+        """
+        return sorted(
+            py_file
+            for py_file in self.iter_python_files(steps_dir)
+            if not py_file.name.startswith("_")
+        )
 
-{given_steps}
+    def iter_python_files(self, steps_dir: Path) -> Iterator[Path]:
+        """
+        Walk a directory for Python files, pruning ignored directories.
 
-# ============================================================================
-# When Steps - Actions and Events
-# ============================================================================
+        Ignored directories are never entered. Symlinked directories are
+        followed, but each real directory is visited once, so symlink loops
+        end.
 
-{when_steps}
+        Args:
+            steps_dir: Directory to walk
 
-# ============================================================================
-# Then Steps - Assertions and Verification
-# ============================================================================
+        Yields:
+            Paths of .py files, below steps_dir as given
+        """
+        root = os.path.abspath(steps_dir).replace(os.sep, "/")
+        rules = IgnoreRules().extended(self.DEFAULT_IGNORE + self.ignore, root)
+        if self.use_gitignore:
+            for parent in self._gitignore_parents(Path(root)):
+                rules = rules.extended_from_file(
+                    parent / ".gitignore", parent.as_posix()
+                )
 
-{then_steps}
-'''
+        visited: set[tuple[int, int]] = set()
+        stack = [(str(steps_dir), root, rules)]
+        while stack:
+            dir_path, abs_dir, rules = stack.pop()
+            try:
+                stat = os.stat(dir_path)
+                if (stat.st_dev, stat.st_ino) in visited:
+                    continue
+                visited.add((stat.st_dev, stat.st_ino))
+                with os.scandir(dir_path) as scan:
+                    entries = list(scan)
+            except OSError:
+                continue
 
-    STEP_TEMPLATE = '''
-@{decorator}('{pattern}')
-def {function_name}(context: Context{params}) -> None:
-    """TODO: Implement step: {original_text}
-{extra_docs}"""
-    raise NotImplementedError("Step not yet implemented")
-'''
+            if self.use_gitignore and any(e.name == ".gitignore" for e in entries):
+                rules = rules.extended_from_file(Path(dir_path) / ".gitignore", abs_dir)
 
-    STEP_WITH_SIMILAR_TEMPLATE = '''
-@{decorator}('{pattern}')
-def {function_name}(context: Context{params}) -> None:
-    """TODO: Implement step: {original_text}
+            for entry in entries:
+                abs_path = f"{abs_dir}/{entry.name}"
+                try:
+                    is_dir = entry.is_dir()
+                    if not is_dir and not (
+                        entry.name.endswith(".py") and entry.is_file()
+                    ):
+                        continue
+                except OSError:
+                    continue
+                if rules.ignored(abs_path, is_dir):
+                    continue
+                if is_dir:
+                    stack.append((entry.path, abs_path, rules))
+                else:
+                    yield Path(entry.path)
 
-    NOTE: Similar step exists in {similar_file}:{similar_line}
-    Pattern: {similar_pattern}
-    Consider reusing or refactoring.
-{extra_docs}"""
-    raise NotImplementedError("Step not yet implemented")
-'''
+    @staticmethod
+    def _gitignore_parents(root: Path) -> list[Path]:
+        """
+        Get the parents of root whose .gitignore applies to it.
 
-    def __init__(
-        self, existing_steps: list[ExistingStepDef] | None = None
-    ) -> None:
+        Args:
+            root: Absolute scanned directory
+
+        Returns:
+            Directories from the repository root down to root's parent, or
+            an empty list outside a git repository
         """
-        Initialize generator.
+        parents: list[Path] = []
+        for parent in root.parents:
+            parents.append(parent)
+            if (parent / ".git").exists():
+                return parents[::-1]
+        return []
+
+    def parse_files(self, py_files: list[Path], jobs: int = 1) -> list[ExistingStepDef]:
+        """
+        Parse step files, in worker processes if enabled.
 
         Args:
-            existing_steps: List of existing step definitions for reuse detection
+            py_files: Step definition files
+            jobs: Number of worker processes
+
+        Returns:
+            Step definitions of all files, in file order
         """
-        self.existing_steps = existing_steps or []
-        self.step_scanner = ExistingStepScanner()
-        self.used_function_names: set[str] = set()
+        return list(self.iter_parsed_files(py_files, jobs))
 
-    def generate(
-        self, steps: list[Step], feature_name: str = "feature"
-    ) -> str:
+    def iter_parsed_files(
+        self, py_files: list[Path], jobs: int = 1
+    ) -> Iterator[ExistingStepDef]:
         """
-        Generate Python step definition stubs.
+        Parse step files one at a time, in worker processes if enabled.
 
         Args:
-            steps: List of Step objects
-            feature_name: Name of the feature (for documentation)
+            py_files: Step definition files
+            jobs: Number of worker processes; fewer than MIN_PARALLEL_FILES
+                files are always parsed serially
+
+        Yields:
+            Step definitions of all files, in file order
+        """
+        yield from self._merge(self.iter_scanned_files(py_files, jobs))
+
+    def iter_scanned_files(
+        self, py_files: list[Path], jobs: int = 1
+    ) -> Iterator[tuple[list[ExistingStepDef], bool]]:
+        """
+        Scan step files one at a time, in worker processes if enabled.
+
+        Args:
+            py_files: Step definition files
+            jobs: Number of worker processes; fewer than MIN_PARALLEL_FILES
+                files are always scanned serially
+
+        Yields:
+            (step definitions, whether the file was skipped by the
+            prefilter) per file, in file order
+        """
+        if jobs <= 1 or len(py_files) < self.MIN_PARALLEL_FILES:
+            yield from map(self._scan_file, py_files)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        # A few chunks per worker keeps the pool balanced
+        chunk_size = max(1, -(-len(py_files) // (jobs * 4)))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(
+                _scan_step_file,
+                py_files,
+                [self.backend] * len(py_files),
+                chunksize=chunk_size,
+            )
+
+    def _merge(
+        self, per_file: Iterable[tuple[list[ExistingStepDef], bool]]
+    ) -> Iterator[ExistingStepDef]:
+        """Chain per-file scan results and count prefiltered files."""
+        for steps, skipped in per_file:
+            self.skipped_files += skipped
+            yield from steps
+
+    def _scan_file(self, file_path: Path) -> tuple[list[ExistingStepDef], bool]:
+        """
+        Parse a file unless the decorator prefilter rules it out.
+
+        The raw bytes are searched for STEP_DECORATOR_RE first, so helper
+        modules never reach ast.parse. Unreadable files count as having no
+        steps.
+
+        Args:
+            file_path: Path to Python file
 
         Returns:
-            Python code with step definition stubs
+            (step definitions, whether the file was skipped by the prefilter)
         """
-        # Reset function names for this generation
-        self.used_function_names = set()
+        try:
+            source = file_path.read_bytes()
+            if not self.STEP_DECORATOR_RE.search(source):
+                return [], True
+            return self._parse_source(source.decode("utf-8"), file_path), False
+        except Exception:
+            # Skip files that can't be parsed
+            return [], False
+
+    def _parse_file(self, file_path: Path) -> list[ExistingStepDef]:
+        """
+        Parse a Python file for step definitions using AST.
+
+        Args:
+            file_path: Path to Python file
+
+        Returns:
+            List of step definitions found in file
+        """
+        return self._parse_source(file_path.read_text(encoding="utf-8"), file_path)
+
+    def _parse_source(self, source: str, file_path: Path) -> list[ExistingStepDef]:
+        """
+        Parse Python source for step definitions using AST.
+
+        Args:
+            source: Python source code
+            file_path: Path the source was read from
+
+        Returns:
+            List of step definitions found in the source
+        """
+        if self.backend == "lexer":
+            extracted = self._extract_steps(source, file_path)
+            if extracted is not None:
+                return extracted
+
+        import ast
+
+        steps: list[ExistingStepDef] = []
+
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            return steps
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.FunctionDef):
+                # Look for @given/@when/@then decorators
+                for decorator in node.decorator_list:
+                    if isinstance(decorator, ast.Call):
+                        if hasattr(decorator.func, "id"):
+                            decorator_name = decorator.func.id
+                            if decorator_name in ("given", "when", "then"):
+                                # Extract pattern from first argument
+                                if decorator.args:
+                                    pattern_node = decorator.args[0]
+                                    if isinstance(pattern_node, ast.Constant):
+                                        pattern = pattern_node.value
+                                        steps.append(
+                                            ExistingStepDef(
+                                                step_type=decorator_name,
+                                                pattern=pattern,
+                                                function_name=node.name,
+                                                file_path=file_path,
+                                                line_number=node.lineno,
+                                            )
+                                        )
+
+        return steps
+
+    def _extract_steps(
+        self, source: str, file_path: Path
+    ) -> list[ExistingStepDef] | None:
+        """
+        Extract step definitions without building an AST.
+
+        A scan over the characters that matter tracks string literals,
+        comments, bracket depth and line continuations, so only real
+        decorators at the start of a logical line are looked at. Each block
+        of decorators that contains a step decorator is read up to its def
+        with anchored regexes. The records are the ones the AST path
+        produces, in the same order.
+
+        Args:
+            source: Python source code
+            file_path: Path the source was read from
+
+        Returns:
+            List of step definitions, or None if the source uses a construct
+            the lexer does not handle (the caller then parses the AST)
+        """
+        if "\r" in source:
+            return None
+
+        steps: list[ExistingStepDef] = []
+        depth = 0
+        continued_at = -1
+        line_pos, line_number = 0, 1
+        search = self.LEX_EVENT_RE.search
+        pos = 0
+
+        while match := search(source, pos):
+            start = match.start()
+            char = source[start]
+            pos = start + 1
+            if char in "([{":
+                depth += 1
+            elif char in ")]}":
+                depth -= 1
+                if depth < 0:
+                    return None
+            elif char == "#":
+                pos = source.find("\n", start)
+                if pos < 0:
+                    break
+            elif char == "\\":
+                if not source.startswith("\n", pos):
+                    return None
+                pos = continued_at = pos + 1
+            elif char != "@":
+                string = self.STRING_RE.match(source, start)
+                if string is None:
+                    return None
+                pos = string.end()
+                if "f" in source[
+                    start - 2 : start
+                ].lower() and not self._balanced_fstring(string.group()):
+                    return None
+            elif not depth:
+                line_start = source.rfind("\n", 0, start) + 1
+                if line_start == continued_at or source[line_start:start].strip(
+                    " \t\f"
+                ):
+                    # Matrix multiplication, not a decorator
+                    continue
+                if not self.STEP_NAME_RE.match(source, start):
+                    if not self.NAMED_DECORATOR_RE.match(source, start):
+                        return None
+                    continue
+                if start != line_start:
+                    # Methods and nested functions come later in ast.walk order
+                    return None
+
+                block = self._read_decorator_block(source, start)
+                if block is None:
+                    return None
+                decorators, definition = block
+                pos = definition.end()
+                if definition["name"] is None or definition["async"]:
+                    # Classes and async functions are not FunctionDef nodes
+                    continue
+
+                line_number += source.count("\n", line_pos, definition.start())
+                line_pos = definition.start()
+                steps.extend(
+                    ExistingStepDef(
+                        step_type=step_type,
+                        pattern=pattern,
+                        function_name=definition["name"],
+                        file_path=file_path,
+                        line_number=line_number,
+                    )
+                    for step_type, pattern in decorators
+                )
+
+        if depth:
+            return None
+        return steps
+
+    def _read_decorator_block(
+        self, source: str, pos: int
+    ) -> tuple[list[tuple[str, str]], re.Match[str]] | None:
+        """
+        Read decorators from pos up to the decorated definition.
+
+        Args:
+            source: Python source code
+            pos: Offset of the first "@" of the block
+
+        Returns:
+            ((step_type, pattern) per step decorator, definition match), or
+            None for decorators the lexer does not handle
+        """
+        decorators: list[tuple[str, str]] = []
+        while True:
+            step = self.STEP_LINE_RE.match(source, pos)
+            if step:
+                decorators.append(
+                    (step["type"], self._literal_value(step["prefix"], step["literal"]))
+                )
+                pos = step.end()
+            elif self.STEP_NAME_RE.match(source, pos):
+                return None
+            else:
+                other = self.OTHER_DECORATOR_RE.match(source, pos)
+                if other is None:
+                    return None
+                pos = other.end()
+
+            pos = self.BLANK_LINES_RE.match(source, pos).end()
+            if not source.startswith("@", pos):
+                break
+
+        definition = self.DEFINITION_RE.match(source, pos)
+        if definition is None:
+            return None
+        return decorators, definition
+
+    @staticmethod
+    def _literal_value(prefix: str, literal: str) -> str:
+        """Get the value of a str literal matched by STRING_LITERAL."""
+        if "\\" in literal:
+            import ast
+
+            return ast.literal_eval(prefix + literal)
+        quote = 3 if literal[:3] in ("'''", '"""') else 1
+        return literal[quote:-quote]
+
+    @staticmethod
+    def _balanced_fstring(literal: str) -> bool:
+        """
+        Check that an f-string's replacement fields were lexed whole.
+
+        Since Python 3.12 a replacement field may reuse the enclosing quote,
+        which STRING_LITERAL cannot see; the literal then ends inside an
+        unclosed field.
+        """
+        body = literal.replace("{{", "").replace("}}", "")
+        return body.count("{") == body.count("}")
+
+    def find_similar_steps(
+        self,
+        new_step: Step,
+        existing_steps: StepCatalog | list[ExistingStepDef],
+        threshold: float = 0.6,
+        index: "TrigramIndex | SimilarityEngine | None" = None,
+    ) -> list[tuple[float, ExistingStepDef]]:
+        """
+        Find existing steps similar to new step.
+
+        Args:
+            new_step: New step to match
+            existing_steps: Step catalog or list of existing step definitions
+            threshold: Similarity threshold (0.0-1.0)
+            index: Optional candidate source built over existing_steps
+                (a TrigramIndex or SimilarityEngine); when given, only its
+                candidates are scored
+
+        Returns:
+            List of (similarity, step) tuples, sorted by similarity
+
+        Raises:
+            ValueError: If index was built over a catalog of another size
+        """
+        from difflib import SequenceMatcher
+
+        similar: list[tuple[float, ExistingStepDef]] = []
+        query = StepCatalog.normalize(new_step.pattern)
+
+        for pattern, existing in self._candidates(new_step, existing_steps, index):
+            # Compare patterns
+            similarity = SequenceMatcher(None, query, pattern).ratio()
+
+            if similarity >= threshold:
+                similar.append((similarity, existing))
+
+        # Sort by similarity (highest first)
+        similar.sort(reverse=True, key=lambda x: x[0])
+        return similar
+
+    def find_best_matches(
+        self,
+        new_step: Step,
+        existing_steps: StepCatalog | list[ExistingStepDef],
+        k: int = 1,
+        threshold: float = 0.6,
+        index: "TrigramIndex | SimilarityEngine | None" = None,
+    ) -> list[tuple[float, ExistingStepDef]]:
+        """
+        Find the k existing steps most similar to new step.
+
+        Returns the same result as find_similar_steps(...)[:k], but rejects
+        candidates on the cheap real_quick_ratio() and quick_ratio() upper
+        bounds before computing the exact ratio, and keeps only a bounded
+        heap of the best k matches. Once the heap is full, candidates are
+        pruned against the current k-th best score instead of the threshold.
+
+        Args:
+            new_step: New step to match
+            existing_steps: Step catalog or list of existing step definitions
+            k: Maximum number of matches to return
+            threshold: Similarity threshold (0.0-1.0)
+            index: Optional candidate source built over existing_steps
+                (a TrigramIndex or SimilarityEngine); when given, only its
+                candidates are scored
+
+        Returns:
+            Up to k (similarity, step) tuples, sorted by similarity
+
+        Raises:
+            ValueError: If index was built over a catalog of another size
+        """
+        return self.rank_candidates(
+            new_step,
+            self._candidates(new_step, existing_steps, index),
+            k=k,
+            threshold=threshold,
+        )
+
+    def rank_candidates(
+        self,
+        new_step: Step,
+        candidates: list[tuple[str, ExistingStepDef]],
+        k: int = 1,
+        threshold: float = 0.6,
+    ) -> list[tuple[float, ExistingStepDef]]:
+        """
+        Score pre-selected candidates and keep the k best (see find_best_matches).
+
+        Args:
+            new_step: New step to match
+            candidates: (normalized_pattern, step) pairs of the same type, in
+                scan order
+            k: Maximum number of matches to return
+            threshold: Similarity threshold (0.0-1.0)
+
+        Returns:
+            Up to k (similarity, step) tuples, sorted by similarity
+        """
+        from difflib import SequenceMatcher
+
+        if k <= 0:
+            return []
+
+        # Min-heap of (similarity, -position, step); position breaks ties in
+        # favour of earlier steps, matching the stable sort above
+        best: list[tuple[float, int, ExistingStepDef]] = []
+
+        def rejected(bound: float) -> bool:
+            if bound < threshold:
+                return True
+            # Later positions lose ties, so equal to the k-th best is not enough
+            return len(best) == k and bound <= best[0][0]
+
+        query = StepCatalog.normalize(new_step.pattern)
+        matcher = SequenceMatcher(None)
+        matcher.set_seq1(query)
+
+        for position, (pattern, existing) in enumerate(candidates):
+            # Length bound, same value as real_quick_ratio() but computed
+            # before paying for set_seq2()
+            total = len(query) + len(pattern)
+            if total and rejected(2.0 * min(len(query), len(pattern)) / total):
+                continue
+
+            matcher.set_seq2(pattern)
+            if rejected(matcher.quick_ratio()):
+                continue
+
+            similarity = matcher.ratio()
+            if similarity < threshold:
+                continue
+
+            entry = (similarity, -position, existing)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+
+        best.sort(key=lambda entry: entry[:2], reverse=True)
+        return [(similarity, existing) for similarity, _, existing in best]
+
+    def _candidates(
+        self,
+        new_step: Step,
+        existing_steps: StepCatalog | list[ExistingStepDef],
+        index: "TrigramIndex | SimilarityEngine | None",
+    ) -> list[tuple[str, ExistingStepDef]]:
+        """Get the (normalized_pattern, step) pairs a lookup should score."""
+        if index is not None:
+            # Only the size is compared; comparing every step would cost a full scan
+            if existing_steps is not index.catalog and len(existing_steps) != len(
+                index.catalog
+            ):
+                raise ValueError("index was not built over existing_steps")
+            return index.candidates(new_step)
+        return self._catalog(existing_steps).bucket(new_step.step_type)
+
+    def _catalog(
+        self, existing_steps: StepCatalog | list[ExistingStepDef]
+    ) -> StepCatalog:
+        """Wrap existing_steps as a catalog, reusing the one built for the same list."""
+        if isinstance(existing_steps, StepCatalog):
+            return existing_steps
+        if (
+            self.wrapped is None
+            or self.wrapped[0] is not existing_steps
+            or self.wrapped[1] != len(existing_steps)
+        ):
+            self.wrapped = (
+                existing_steps,
+                len(existing_steps),
+                StepCatalog(existing_steps),
+            )
+        return self.wrapped[2]
+
+
+class SimilarityEngine:
+    """Base class for the backends that find existing steps similar to a new one.
+
+    The base engine scores every same-type step in the catalog; subclasses
+    narrow that down by overriding candidates().
+    """
+
+    name = ""
+
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
+        """
+        Initialize engine.
+
+        Args:
+            catalog: Existing step definitions to search
+        """
+        self.catalog = StepCatalog.wrap(catalog)
+        self.step_scanner = ExistingStepScanner()
+
+    def candidates(self, new_step: Step) -> list[tuple[str, ExistingStepDef]]:
+        """
+        Get the existing steps worth scoring against a new step.
+
+        Args:
+            new_step: New step to match
+
+        Returns:
+            (normalized_pattern, step) pairs of the same type, in scan order
+        """
+        return self.catalog.bucket(new_step.step_type)
+
+    def find_best_matches(
+        self, new_step: Step, k: int = 1, threshold: float = 0.6
+    ) -> list[tuple[float, ExistingStepDef]]:
+        """
+        Find the k existing steps most similar to new step.
+
+        Args:
+            new_step: New step to match
+            k: Maximum number of matches to return
+            threshold: Similarity threshold (0.0-1.0)
+
+        Returns:
+            Up to k (similarity, step) tuples, sorted by similarity
+        """
+        return self.step_scanner.find_best_matches(
+            new_step, self.catalog, k=k, threshold=threshold, index=self
+        )
+
+    def match_all(
+        self, steps: list[Step], threshold: float = 0.6
+    ) -> list[tuple[float, ExistingStepDef] | None]:
+        """
+        Find the best existing match for every step in one batch.
+
+        Args:
+            steps: New steps to match
+            threshold: Similarity threshold (0.0-1.0)
+
+        Returns:
+            (similarity, step) tuple or None for each step, in input order
+        """
+        results: list[tuple[float, ExistingStepDef] | None] = []
+        for step in steps:
+            matches = self.find_best_matches(step, k=1, threshold=threshold)
+            results.append(matches[0] if matches else None)
+        return results
+
+
+class ExactSimilarityEngine(SimilarityEngine):
+    """Scores every same-type step with SequenceMatcher.
+
+    Candidates are only skipped on the ratio upper bounds of
+    find_best_matches, so the best match is always found.
+    """
+
+    name = "exact"
+
+
+class TrigramSimilarityEngine(SimilarityEngine):
+    """Scores the trigram-index candidates with SequenceMatcher.
+
+    Approximate: see TrigramIndex.
+    """
+
+    name = "trigram"
+
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
+        """
+        Initialize engine.
+
+        Args:
+            catalog: Existing step definitions to search
+        """
+        super().__init__(catalog)
+        self.trigram_index = TrigramIndex(self.catalog)
+
+    def candidates(self, new_step: Step) -> list[tuple[str, ExistingStepDef]]:
+        """Get trigram-index candidates (see SimilarityEngine)."""
+        return self.trigram_index.candidates(new_step)
+
+
+class MinHashLSHEngine(SimilarityEngine):
+    """Approximate candidate retrieval with MinHash signatures and LSH banding.
+
+    Each pattern is reduced to a MinHash signature over its character
+    trigrams, and the signature is split into bands that are hashed into
+    buckets. A lookup only visits the buckets of the new pattern's bands, so
+    its cost does not grow with the catalog; the candidates found are then
+    re-ranked with the exact SequenceMatcher score.
+    """
+
+    name = "lsh"
+
+    NUM_PERM = 64
+    BANDS = 32  # 2 rows per band: pairs with ~18% trigram Jaccard collide
+
+    # Mersenne prime modulus for the (a * x + b) % p permutations
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
+        """
+        Initialize engine and index all existing steps.
+
+        Args:
+            catalog: Existing step definitions to search
+        """
+        import random
+
+        super().__init__(catalog)
+
+        # Fixed seed so signatures are stable across runs and processes
+        rng = random.Random(0x5EED)
+        self.permutations = [
+            (rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME))
+            for _ in range(self.NUM_PERM)
+        ]
+        self.rows = self.NUM_PERM // self.BANDS
+        self.shingle_hashes: dict[str, tuple[int, ...]] = {}
+        self.buckets: dict[tuple[str, int, tuple[int, ...]], list[int]] = {}
+
+        for step_type, bucket in self.catalog.buckets.items():
+            for position, (pattern, _) in enumerate(bucket):
+                for key in self._band_keys(step_type, pattern, memoize=True):
+                    self.buckets.setdefault(key, []).append(position)
+
+    def _shingle_hash(self, shingle: str, memoize: bool = False) -> tuple[int, ...]:
+        """Get the NUM_PERM permuted hash values of one shingle."""
+        hashes = self.shingle_hashes.get(shingle)
+        if hashes is None:
+            base = zlib.crc32(shingle.encode("utf-8"))
+            hashes = tuple((a * base + b) % self.PRIME for a, b in self.permutations)
+            if memoize:
+                self.shingle_hashes[shingle] = hashes
+        return hashes
+
+    def signature(self, text: str, memoize: bool = False) -> tuple[int, ...]:
+        """
+        Compute the MinHash signature of a normalized pattern.
+
+        Args:
+            text: Normalized step pattern
+            memoize: Keep the hashes of new shingles; only done for catalog
+                patterns, so lookups do not grow the table
+
+        Returns:
+            Tuple of NUM_PERM minimum hash values
+        """
+        shingles = {text[i : i + 3] for i in range(len(text) - 2)} or {text}
+        hashes = [self._shingle_hash(shingle, memoize) for shingle in shingles]
+        if len(hashes) == 1:
+            return hashes[0]
+        return tuple(map(min, *hashes))
+
+    def _band_keys(
+        self, step_type: str, text: str, memoize: bool = False
+    ) -> list[tuple[str, int, tuple[int, ...]]]:
+        """Get the LSH bucket keys of a normalized pattern, one per band."""
+        signature = self.signature(text, memoize)
+        return [
+            (step_type, band, signature[band * self.rows : (band + 1) * self.rows])
+            for band in range(self.BANDS)
+        ]
+
+    def candidates(self, new_step: Step) -> list[tuple[str, ExistingStepDef]]:
+        """Get the steps sharing an LSH bucket (see SimilarityEngine)."""
+        positions: set[int] = set()
+        query = StepCatalog.normalize(new_step.pattern)
+        for key in self._band_keys(new_step.step_type, query):
+            positions.update(self.buckets.get(key, ()))
+
+        bucket = self.catalog.bucket(new_step.step_type)
+        return [bucket[position] for position in sorted(positions)]
+
+
+class NumpySimilarityEngine(ExactSimilarityEngine):
+    """Batch engine scoring hashed trigram count vectors with NumPy.
+
+    match_all() turns every new and existing pattern into a trigram count
+    vector (hashed into FEATURES columns), computes the whole new-by-existing
+    cosine similarity matrix per step type with one matrix product, and only
+    re-ranks the TOP_N best columns of each row with the exact ratio. Single
+    lookups and runs without NumPy installed use the exact engine.
+    """
+
+    name = "numpy"
+
+    FEATURES = 1024
+    TOP_N = 8
+    CHUNK_ROWS = 512  # new steps per matrix product, bounds peak memory
+
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
+        """
+        Initialize engine and vectorize all existing steps.
+
+        Args:
+            catalog: Existing step definitions to search
+        """
+        super().__init__(catalog)
+
+        try:
+            import numpy
+        except ImportError:
+            print(
+                "Warning: numpy not installed, using exact similarity engine",
+                file=sys.stderr,
+            )
+            numpy = None
+
+        self.numpy = numpy
+        self.columns: dict[str, int] = {}
+        self.matrices: dict[str, Any] = {}
+
+        if numpy is not None:
+            for step_type, bucket in self.catalog.buckets.items():
+                if bucket:
+                    self.matrices[step_type] = self._vectorize(
+                        [pattern for pattern, _ in bucket]
+                    )
+
+    def _vectorize(self, texts: list[str]) -> Any:
+        """Build the L2-normalized trigram count matrix of normalized patterns."""
+        np = self.numpy
+        rows: list[int] = []
+        cols: list[int] = []
+
+        for row, text in enumerate(texts):
+            for i in range(len(text) - 2):
+                trigram = text[i : i + 3]
+                column = self.columns.get(trigram)
+                if column is None:
+                    column = zlib.crc32(trigram.encode("utf-8")) % self.FEATURES
+                    self.columns[trigram] = column
+                rows.append(row)
+                cols.append(column)
+
+        matrix = np.zeros((len(texts), self.FEATURES), dtype=np.float32)
+        np.add.at(matrix, (rows, cols), 1.0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def match_all(
+        self, steps: list[Step], threshold: float = 0.6
+    ) -> list[tuple[float, ExistingStepDef] | None]:
+        """Find the best existing match for every step (see SimilarityEngine)."""
+        if self.numpy is None:
+            return super().match_all(steps, threshold=threshold)
+
+        np = self.numpy
+        results: list[tuple[float, ExistingStepDef] | None] = [None] * len(steps)
+
+        indices_by_type: dict[str, list[int]] = {}
+        for i, step in enumerate(steps):
+            indices_by_type.setdefault(step.step_type, []).append(i)
+
+        for step_type, indices in indices_by_type.items():
+            existing_matrix = self.matrices.get(step_type)
+            if existing_matrix is None:
+                continue
+
+            bucket = self.catalog.bucket(step_type)
+            top_n = min(self.TOP_N, len(bucket))
+            queries = [StepCatalog.normalize(steps[i].pattern) for i in indices]
+
+            for start in range(0, len(indices), self.CHUNK_ROWS):
+                chunk = indices[start : start + self.CHUNK_ROWS]
+                scores = (
+                    self._vectorize(queries[start : start + self.CHUNK_ROWS])
+                    @ existing_matrix.T
+                )
+                if top_n < len(bucket):
+                    top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+                else:
+                    top = np.broadcast_to(np.arange(len(bucket)), scores.shape)
+
+                for row, step_index in enumerate(chunk):
+                    step = steps[step_index]
+                    if len(queries[start + row]) < 3:
+                        # No trigrams to compare, fall back to the index
+                        candidates = self.candidates(step)
+                    else:
+                        candidates = [bucket[c] for c in sorted(top[row].tolist())]
+
+                    matches = self.step_scanner.rank_candidates(
+                        step, candidates, k=1, threshold=threshold
+                    )
+                    results[step_index] = matches[0] if matches else None
+
+        return results
+
+
+class TokenEditDistanceEngine(SimilarityEngine):
+    """Placeholder-aware edit distance over word tokens.
+
+    Patterns are split into words and punctuation, and every "{...}"
+    placeholder becomes the same wildcard token, so '{laptop}' and
+    '{headphones}' are equal. Similarity is 1 - distance / longer length,
+    where distance is the token-level Levenshtein distance computed with
+    Myers' bit-parallel algorithm (one pass of integer operations per
+    token of the existing pattern, with Python ints as bit vectors).
+    """
+
+    name = "token"
+
+    TOKEN_RE = re.compile(r"\{[^{}]*\}|\w+|[^\w\s]")
+
+    # Token ID shared by every placeholder
+    WILDCARD = 0
+
+    # Token ID of query words no catalog pattern contains; they never match,
+    # so they need no IDs of their own
+    UNKNOWN = -1
+
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
+        """
+        Initialize engine and tokenize all existing steps.
+
+        Args:
+            catalog: Existing step definitions to search
+        """
+        super().__init__(catalog)
+        self.token_ids: dict[str, int] = {}
+        self.buckets: dict[str, list[tuple[tuple[int, ...], ExistingStepDef]]] = {
+            step_type: [
+                (self.tokenize(normalized), existing)
+                for normalized, existing in self.catalog.bucket(step_type)
+            ]
+            for step_type in self.catalog.buckets
+        }
+
+    def tokenize(self, pattern: str, add: bool = True) -> tuple[int, ...]:
+        """
+        Convert a normalized pattern to token IDs.
+
+        Args:
+            pattern: Normalized step pattern
+            add: Assign IDs to new words; lookups pass False so they do not
+                grow the vocabulary, and get UNKNOWN for new words instead
+
+        Returns:
+            Token IDs, with WILDCARD for placeholders
+        """
+        token_ids = self.token_ids
+        if not add:
+            return tuple(
+                (
+                    self.WILDCARD
+                    if token.startswith("{")
+                    else token_ids.get(token, self.UNKNOWN)
+                )
+                for token in self.TOKEN_RE.findall(pattern)
+            )
+        return tuple(
+            (
+                self.WILDCARD
+                if token.startswith("{")
+                else token_ids.setdefault(token, len(token_ids) + 1)
+            )
+            for token in self.TOKEN_RE.findall(pattern)
+        )
+
+    @staticmethod
+    def distance(peq: dict[int, int], length: int, tokens: tuple[int, ...]) -> int:
+        """
+        Compute the Levenshtein distance with Myers' bit-parallel algorithm.
+
+        Args:
+            peq: Bit mask of positions per token ID in the query
+            length: Number of tokens in the query
+            tokens: Token IDs of the other sequence
+
+        Returns:
+            Edit distance in tokens
+        """
+        if not length:
+            return len(tokens)
+        full = (1 << length) - 1
+        high = 1 << (length - 1)
+        pv, mv, score = full, 0, length
+        for token in tokens:
+            eq = peq.get(token, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | (~(xh | pv) & full)
+            mh = pv & xh
+            if ph & high:
+                score += 1
+            elif mh & high:
+                score -= 1
+            ph = ((ph << 1) | 1) & full
+            mh = (mh << 1) & full
+            pv = mh | (~(xv | ph) & full)
+            mv = ph & xv
+        return score
+
+    def find_best_matches(
+        self, new_step: Step, k: int = 1, threshold: float = 0.6
+    ) -> list[tuple[float, ExistingStepDef]]:
+        """Rank same-type steps by token similarity (see SimilarityEngine)."""
+        if k <= 0:
+            return []
+
+        query = self.tokenize(StepCatalog.normalize(new_step.pattern), add=False)
+        length = len(query)
+        peq: dict[int, int] = {}
+        for position, token in enumerate(query):
+            peq[token] = peq.get(token, 0) | (1 << position)
+
+        best: list[tuple[float, int, ExistingStepDef]] = []
+        for position, (tokens, existing) in enumerate(
+            self.buckets.get(new_step.step_type, [])
+        ):
+            longest = max(length, len(tokens))
+            if not longest:
+                continue
+            # The distance is at least the length difference
+            bound = 1 - abs(length - len(tokens)) / longest
+            if bound < threshold or (len(best) == k and bound <= best[0][0]):
+                continue
+            similarity = 1 - self.distance(peq, length, tokens) / longest
+            if similarity < threshold:
+                continue
+            entry = (similarity, -position, existing)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:
+                heapq.heapreplace(best, entry)
+
+        best.sort(key=lambda entry: entry[:2], reverse=True)
+        return [(similarity, existing) for similarity, _, existing in best]
+
+
+class FtsSimilarityEngine(SimilarityEngine):
+    """Candidate retrieval through SqliteStepCatalog's FTS5 trigram index.
+
+    Each lookup is one indexed full-text query for the definitions sharing
+    the most trigrams with the new pattern (bm25 rank, capped at
+    SqliteStepCatalog.CANDIDATE_LIMIT); those are re-ranked with the exact
+    SequenceMatcher score. Approximate: bm25 ranks by shared trigrams, so the
+    best SequenceMatcher match can fall outside the cap and go unreported.
+    Uses the catalog's database when the catalog is a SqliteStepCatalog,
+    otherwise mirrors it into an in-memory one. Falls back to the trigram
+    engine's index if SQLite lacks FTS5.
+    """
+
+    name = "fts"
+
+    def __init__(self, catalog: StepCatalog | Iterable[ExistingStepDef]) -> None:
+        """
+        Initialize engine and build (or open) the full-text index.
+
+        Args:
+            catalog: Existing step definitions to search
+        """
+        import sqlite3
+
+        super().__init__(catalog)
+        self.trigram_index: TrigramIndex | None = None
+        self.search_catalog: SqliteStepCatalog | None = (
+            self.catalog
+            if isinstance(self.catalog, SqliteStepCatalog)
+            else SqliteStepCatalog(self.catalog.steps)
+        )
+
+        try:
+            self.search_catalog.database()
+        except (OSError, sqlite3.Error) as e:
+            print(
+                f"Warning: SQLite full-text index unavailable ({e}), "
+                "using trigram similarity engine",
+                file=sys.stderr,
+            )
+            self.search_catalog = None
+            self.trigram_index = TrigramIndex(self.catalog)
+
+    def candidates(self, new_step: Step) -> list[tuple[str, ExistingStepDef]]:
+        """Get the best-ranked full-text matches (see SimilarityEngine)."""
+        if self.search_catalog is None:
+            return self.trigram_index.candidates(new_step)
+
+        bucket = self.catalog.bucket(new_step.step_type)
+        positions = self.search_catalog.candidate_positions(
+            new_step.step_type, StepCatalog.normalize(new_step.pattern)
+        )
+        return [bucket[position] for position in positions]
+
+
+SIMILARITY_ENGINES: dict[str, type[SimilarityEngine]] = {
+    ExactSimilarityEngine.name: ExactSimilarityEngine,
+    TrigramSimilarityEngine.name: TrigramSimilarityEngine,
+    MinHashLSHEngine.name: MinHashLSHEngine,
+    NumpySimilarityEngine.name: NumpySimilarityEngine,
+    TokenEditDistanceEngine.name: TokenEditDistanceEngine,
+    FtsSimilarityEngine.name: FtsSimilarityEngine,
+}
+
+
+class StepIndex:
+    """Persistent SQLite index of the step definitions found per file.
+
+    Files are tracked by path, mtime, size and content hash. A refresh
+    reuses the stored definitions of every file whose mtime and size are
+    unchanged (or whose content hash still matches after a touch), parses
+    only the rest and drops the entries of deleted files. Whether the
+    decorator prefilter skipped a file is stored with it, so warm scans
+    report the same skipped count as cold ones.
+    """
+
+    FILENAME = "steps.sqlite3"
+
+    # Bump when the parser's output or the table layout changes
+    VERSION = 3
+
+    def __init__(self, cache_dir: Path) -> None:
+        """
+        Open (or create) the index database.
+
+        Args:
+            cache_dir: Directory holding the index file
+
+        Raises:
+            sqlite3.Error: If the database cannot be opened
+            OSError: If cache_dir cannot be created
+        """
+        import sqlite3
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(cache_dir / self.FILENAME)
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            with self.connection:
+                self.connection.execute("DROP TABLE IF EXISTS files")
+                self.connection.execute("DROP TABLE IF EXISTS steps")
+                self.connection.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "root TEXT, path TEXT, mtime_ns INTEGER, size INTEGER, digest TEXT, "
+            "skipped INTEGER, PRIMARY KEY (root, path))"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS steps ("
+            "root TEXT, path TEXT, position INTEGER, step_type TEXT, "
+            "pattern TEXT, function_name TEXT, line_number INTEGER, "
+            "PRIMARY KEY (root, path, position))"
+        )
+        self.parsed_files = 0
+        self.skipped_files = 0
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
+
+    @staticmethod
+    def digest(file_path: Path) -> str:
+        """Get the content hash of a file."""
+        import hashlib
+
+        return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+    def refresh(
+        self,
+        root: Path,
+        py_files: list[Path],
+        parse: Callable[[list[Path]], list[tuple[list[ExistingStepDef], bool]]],
+    ) -> list[ExistingStepDef]:
+        """
+        Bring the index for a directory up to date and return its steps.
+
+        Args:
+            root: Scanned directory
+            py_files: Current step files under root, in scan order
+            parse: Scans a list of files into (step definitions, whether
+                the prefilter skipped the file) per file
+
+        Returns:
+            Step definitions of all files, in file order
+        """
+        key = str(root)
+        known = {
+            path: (mtime_ns, size, digest)
+            for path, mtime_ns, size, digest in self.connection.execute(
+                "SELECT path, mtime_ns, size, digest FROM files WHERE root = ?", (key,)
+            )
+        }
+
+        touched: list[tuple[int, int, str, str]] = []
+        changed: list[tuple[Path, int, int, str]] = []
+        for py_file in py_files:
+            path = str(py_file)
+            try:
+                stat = py_file.stat()
+            except OSError:
+                continue
+            stored = known.get(path)
+            if stored and stored[:2] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                digest = self.digest(py_file)
+            except OSError:
+                digest = ""
+            if stored and digest and stored[2] == digest:
+                touched.append((stat.st_mtime_ns, stat.st_size, key, path))
+            else:
+                changed.append((py_file, stat.st_mtime_ns, stat.st_size, digest))
+
+        current = {str(py_file) for py_file in py_files}
+        deleted = [(key, path) for path in known if path not in current]
+
+        scanned = parse([py_file for py_file, *_ in changed]) if changed else []
+        self.parsed_files = len(changed)
+
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE files SET mtime_ns = ?, size = ? WHERE root = ? AND path = ?",
+                touched,
+            )
+            stale = deleted + [(key, str(py_file)) for py_file, *_ in changed]
+            self.connection.executemany(
+                "DELETE FROM files WHERE root = ? AND path = ?", stale
+            )
+            self.connection.executemany(
+                "DELETE FROM steps WHERE root = ? AND path = ?", stale
+            )
+            self.connection.executemany(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key, str(py_file), mtime_ns, size, digest, skipped)
+                    for (py_file, mtime_ns, size, digest), (_, skipped) in zip(
+                        changed, scanned
+                    )
+                ],
+            )
+            self.connection.executemany(
+                "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        key,
+                        str(py_file),
+                        position,
+                        existing.step_type,
+                        existing.pattern,
+                        existing.function_name,
+                        existing.line_number,
+                    )
+                    for (py_file, *_), (steps, _) in zip(changed, scanned)
+                    for position, existing in enumerate(steps)
+                ],
+            )
+
+        self.skipped_files = self.connection.execute(
+            "SELECT COUNT(*) FROM files WHERE root = ? AND skipped", (key,)
+        ).fetchone()[0]
+
+        rows = self.connection.execute(
+            "SELECT path, step_type, pattern, function_name, line_number "
+            "FROM steps WHERE root = ? ORDER BY path, position",
+            (key,),
+        )
+        by_path: dict[str, list[ExistingStepDef]] = {}
+        for path, step_type, pattern, function_name, line_number in rows:
+            by_path.setdefault(path, []).append(
+                ExistingStepDef(
+                    step_type, pattern, function_name, Path(path), line_number
+                )
+            )
+        return [
+            existing
+            for py_file in py_files
+            for existing in by_path.get(str(py_file), [])
+        ]
+
+
+class CompiledStepIndex:
+    """Read-only binary index of a step library, loaded with mmap.
+
+    A shared step library is compiled once (--compile-index) and loaded by
+    every project that uses it (--step-library), instead of each project
+    re-scanning its sources. The file holds a string table, one record per
+    definition and the TrigramIndex postings of every step type. Opening
+    it only reads the header; definitions and postings are decoded from the
+    mapping when they are used. A StepCatalog built on the index decodes
+    every definition up front, so the index saves the scan and the trigram
+    postings, not the per-definition cost of the catalog.
+
+    Layout, little-endian: HEADER, string bytes, string offsets (u32 per
+    string plus one), a RECORD per definition, then per step type in
+    StepCatalog.STEP_TYPES order: SECTION, trigram counts (u32 per bucket
+    position), short positions (u32), a TRIGRAM per trigram and a POSTING
+    per posting.
+    """
+
+    MAGIC = b"BDDSTEPS"
+
+    # Bump when the layout, StepCatalog.normalize or the trigram scheme change
+    VERSION = 1
+
+    # magic, version, strings, definitions, offsets, records and sections position
+    HEADER = struct.Struct("<8sIIIQQQ")
+    # step type code, pattern, function name, file path (string ids), line number
+    RECORD = struct.Struct("<BIIII")
+    # bucket length, trigrams, short positions, postings
+    SECTION = struct.Struct("<IIII")
+    # trigram (string id), first posting, posting count
+    TRIGRAM = struct.Struct("<III")
+    # bucket position, trigram count
+    POSTING = struct.Struct("<II")
+    SPAN = struct.Struct("<II")
+
+    def __init__(self, path: Path) -> None:
+        """
+        Map a compiled index.
+
+        Args:
+            path: Index file written by write()
+
+        Raises:
+            OSError: If the file cannot be read
+            ValueError: If the file is not a step index of this VERSION, or
+                is truncated
+        """
+        self.path = path
+        with open(path, "rb") as index_file:
+            try:
+                self.buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path} is empty, not a step index") from None
+
+        # step type -> (bucket length, counts, short, trigrams and postings
+        # position, trigrams, postings)
+        self.sections: dict[str, tuple[int, int, int, int, int, int]] = {}
+        try:
+            self._read_layout()
+        except ValueError:
+            self.buffer.close()
+            raise
+
+        self.trigram_tables: dict[str, dict[str, tuple[int, int]]] = {}
+        self.posting_lists: dict[tuple[str, str], list[tuple[int, int]]] = {}
+
+    def _read_layout(self) -> None:
+        """Read the header and section table, checking every part fits the file."""
+        try:
+            header = self.HEADER.unpack_from(self.buffer, 0)
+        except struct.error:
+            header = (b"", 0, 0, 0, 0, 0, 0)
+        (
+            magic,
+            version,
+            strings,
+            self.size,
+            self.offsets_pos,
+            self.records_pos,
+            position,
+        ) = header
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"{self.path} is not a version {self.VERSION} step index")
+
+        truncated = ValueError(f"{self.path} is truncated or corrupt; recompile it")
+        if (
+            self.offsets_pos < self.HEADER.size
+            or self.records_pos != self.offsets_pos + 4 * (strings + 1)
+            or position != self.records_pos + self.RECORD.size * self.size
+        ):
+            raise truncated
+        for step_type in StepCatalog.STEP_TYPES:
+            if position + self.SECTION.size > len(self.buffer):
+                raise truncated
+            length, trigrams, shorts, postings = self.SECTION.unpack_from(
+                self.buffer, position
+            )
+            counts_pos = position + self.SECTION.size
+            short_pos = counts_pos + 4 * length
+            trigrams_pos = short_pos + 4 * shorts
+            postings_pos = trigrams_pos + self.TRIGRAM.size * trigrams
+            self.sections[step_type] = (
+                length,
+                counts_pos,
+                shorts,
+                trigrams_pos,
+                trigrams,
+                postings_pos,
+            )
+            position = postings_pos + self.POSTING.size * postings
+        if position != len(self.buffer):
+            raise truncated
+
+    def close(self) -> None:
+        """Unmap the index; definitions and postings cannot be read afterwards."""
+        self.buffer.close()
+
+    def __enter__(self) -> CompiledStepIndex:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    @classmethod
+    def write(cls, existing_steps: Iterable[ExistingStepDef], output: Path) -> int:
+        """
+        Compile step definitions into an index file.
+
+        Args:
+            existing_steps: Step definitions, in scan order
+            output: Index file to (over)write
+
+        Returns:
+            Number of definitions written
+        """
+        catalog = StepCatalog(
+            existing
+            for existing in existing_steps
+            if existing.step_type in StepCatalog.STEP_TYPES
+        )
+        trigram_index = TrigramIndex(catalog)
+
+        strings: dict[str, int] = {}
+
+        def intern(text: str) -> int:
+            return strings.setdefault(text, len(strings))
+
+        records = b"".join(
+            cls.RECORD.pack(
+                StepCatalog.STEP_TYPES.index(existing.step_type),
+                intern(existing.pattern),
+                intern(existing.function_name),
+                intern(str(existing.file_path)),
+                existing.line_number,
+            )
+            for existing in catalog
+        )
+
+        sections = bytearray()
+        for step_type in StepCatalog.STEP_TYPES:
+            counts = trigram_index.trigram_counts[step_type]
+            shorts = trigram_index.short_positions[step_type]
+            postings = trigram_index.postings[step_type]
+            trigrams = bytearray()
+            entries = bytearray()
+            first = 0
+            for trigram, matches in postings.items():
+                trigrams += cls.TRIGRAM.pack(intern(trigram), first, len(matches))
+                for match in matches:
+                    entries += cls.POSTING.pack(*match)
+                first += len(matches)
+            sections += cls.SECTION.pack(len(counts), len(postings), len(shorts), first)
+            sections += struct.pack(f"<{len(counts)}I", *counts)
+            sections += struct.pack(f"<{len(shorts)}I", *shorts)
+            sections += trigrams + entries
+
+        encoded = [text.encode("utf-8") for text in strings]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        string_data = b"".join(encoded)
+        offset_data = struct.pack(f"<{len(offsets)}I", *offsets)
+
+        offsets_pos = cls.HEADER.size + len(string_data)
+        records_pos = offsets_pos + len(offset_data)
+        header = cls.HEADER.pack(
+            cls.MAGIC,
+            cls.VERSION,
+            len(strings),
+            len(catalog),
+            offsets_pos,
+            records_pos,
+            records_pos + len(records),
+        )
+
+        # Write next to the target and rename, so readers never see half a file
+        partial = output.with_name(output.name + ".tmp")
+        partial.write_bytes(header + string_data + offset_data + records + sections)
+        os.replace(partial, output)
+        return len(catalog)
+
+    def string(self, string_id: int) -> str:
+        """Decode an entry of the string table."""
+        start, end = self.SPAN.unpack_from(
+            self.buffer, self.offsets_pos + 4 * string_id
+        )
+        base = self.HEADER.size
+        return self.buffer[base + start : base + end].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[ExistingStepDef]:
+        paths: dict[int, Path] = {}
+        records = self.buffer[
+            self.records_pos : self.records_pos + self.RECORD.size * self.size
+        ]
+        for type_code, pattern, function_name, file_id, line in self.RECORD.iter_unpack(
+            records
+        ):
+            if file_id not in paths:
+                paths[file_id] = Path(self.string(file_id))
+            yield ExistingStepDef(
+                step_type=StepCatalog.STEP_TYPES[type_code],
+                pattern=self.string(pattern),
+                function_name=self.string(function_name),
+                file_path=paths[file_id],
+                line_number=line,
+            )
+
+    def bucket_length(self, step_type: str) -> int:
+        """Get the number of definitions of a step type."""
+        return self.sections[step_type][0]
+
+    def trigram_counts(self, step_type: str) -> tuple[int, ...]:
+        """Get the trigram count of each definition of a step type."""
+        length, counts_pos = self.sections[step_type][:2]
+        return struct.unpack_from(f"<{length}I", self.buffer, counts_pos)
+
+    def short_positions(self, step_type: str) -> tuple[int, ...]:
+        """Get the bucket positions of patterns too short for trigrams."""
+        length, counts_pos, shorts = self.sections[step_type][:3]
+        return struct.unpack_from(f"<{shorts}I", self.buffer, counts_pos + 4 * length)
+
+    def postings(self, step_type: str, trigram: str) -> list[tuple[int, int]]:
+        """
+        Get the (bucket_position, count) postings of a trigram.
+
+        The trigram table of a step type is decoded on first use, and each
+        posting list when it is first asked for.
+
+        Args:
+            step_type: 'given', 'when' or 'then'
+            trigram: Normalized trigram
+
+        Returns:
+            Postings in bucket order
+        """
+        cached = self.posting_lists.get((step_type, trigram))
+        if cached is not None:
+            return cached
+        if step_type not in self.sections:
+            return []
+
+        table = self.trigram_tables.get(step_type)
+        if table is None:
+            _, _, _, trigrams_pos, trigrams, _ = self.sections[step_type]
+            entries = self.buffer[
+                trigrams_pos : trigrams_pos + self.TRIGRAM.size * trigrams
+            ]
+            table = self.trigram_tables[step_type] = {
+                self.string(string_id): (first, count)
+                for string_id, first, count in self.TRIGRAM.iter_unpack(entries)
+            }
+
+        span = table.get(trigram)
+        postings: list[tuple[int, int]] = []
+        if span is not None:
+            first, count = span
+            start = self.sections[step_type][5] + self.POSTING.size * first
+            postings = list(
+                self.POSTING.iter_unpack(
+                    self.buffer[start : start + self.POSTING.size * count]
+                )
+            )
+        self.posting_lists[(step_type, trigram)] = postings
+        return postings
+
+
+def _scan_step_file(
+    file_path: Path, backend: str
+) -> tuple[list[ExistingStepDef], bool]:
+    """Scan one step file in a --jobs worker process."""
+    return ExistingStepScanner(backend)._scan_file(file_path)
+
+
+def _parse_feature_file(
+    file_path: Path, content: bytes, backend: str
+) -> tuple[list[Step] | None, str | None]:
+    """Parse one feature file in a --jobs worker process."""
+    return GherkinParser(backend)._try_parse_file(file_path, content)
+
+
+# Similarity engine of a --jobs worker process and the catalog position of
+# each of its steps, built once by the initializer
+_worker_engine: SimilarityEngine | None = None
+_worker_positions: dict[int, int] = {}
+
+
+def _init_similarity_worker(
+    existing_steps: list[ExistingStepDef], similarity_engine: str
+) -> None:
+    """Build the worker's similarity engine from the shipped catalog."""
+    global _worker_engine, _worker_positions
+    _worker_engine = SIMILARITY_ENGINES[similarity_engine](StepCatalog(existing_steps))
+    _worker_positions = {id(existing): i for i, existing in enumerate(existing_steps)}
+
+
+def _match_steps_in_worker(
+    steps: list[Step], threshold: float
+) -> list[tuple[float, int] | None]:
+    """
+    Match a chunk of steps with the worker's similarity engine.
+
+    Matches are returned as catalog positions; pickled copies of the
+    definitions would not be the parent's catalog objects.
+    """
+    return [
+        (match[0], _worker_positions[id(match[1])]) if match else None
+        for match in _worker_engine.match_all(steps, threshold=threshold)
+    ]
+
+
+class SimilarityCache:
+    """Persistent SQLite cache of best similar-step matches.
+
+    Entries are keyed on a hash of the new step's type and pattern together
+    with the catalog fingerprint, the similarity engine and the threshold,
+    so any change to the existing steps misses instead of returning stale
+    matches. A hit stores the catalog position of the matched definition.
+    The least recently used entries are evicted beyond MAX_ENTRIES.
+    """
+
+    FILENAME = "similarity.sqlite3"
+
+    # Bump when the key or row format changes
+    VERSION = 1
+
+    MAX_ENTRIES = 100_000
+
+    # Keys per SELECT; stays under SQLite's bound-parameter limit
+    BATCH_SIZE = 500
+
+    def __init__(self, cache_dir: Path, max_entries: int = MAX_ENTRIES) -> None:
+        """
+        Open (or create) the cache database.
+
+        Args:
+            cache_dir: Directory holding the cache file
+            max_entries: Number of entries kept after eviction
+
+        Raises:
+            sqlite3.Error: If the database cannot be opened
+            OSError: If cache_dir cannot be created
+        """
+        import sqlite3
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(cache_dir / self.FILENAME)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            "key TEXT PRIMARY KEY, score REAL, position INTEGER, last_used REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS matches_last_used ON matches (last_used)"
+        )
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
+
+    def scope(
+        self, catalog: StepCatalog, similarity_engine: str, threshold: float
+    ) -> str:
+        """
+        Get the key prefix shared by all lookups of one run.
+
+        Args:
+            catalog: Existing step catalog
+            similarity_engine: Similarity engine name
+            threshold: Similarity threshold
+
+        Returns:
+            Key prefix
+        """
+        return (
+            f"{self.VERSION}:{catalog.fingerprint()}:{similarity_engine}:{threshold!r}"
+        )
+
+    @staticmethod
+    def key(scope: str, step: Step) -> str:
+        """Get the cache key of a step within a scope."""
+        import hashlib
+
+        return hashlib.sha256(
+            f"{scope}\0{step.step_type}\0{step.pattern}".encode()
+        ).hexdigest()
+
+    def get_many(
+        self, keys: list[str], catalog: StepCatalog
+    ) -> dict[str, tuple[float, ExistingStepDef] | None]:
+        """
+        Look up cached matches and mark them as recently used.
+
+        Args:
+            keys: Cache keys
+            catalog: Catalog the keys were scoped to
+
+        Returns:
+            Cached match (or None for "no similar step") per key found
+        """
+        found: dict[str, tuple[float, ExistingStepDef] | None] = {}
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[start : start + self.BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            rows = self.connection.execute(
+                "SELECT key, score, position FROM matches "
+                f"WHERE key IN ({placeholders})",
+                batch,
+            )
+            for key, score, position in rows:
+                if position is None:
+                    found[key] = None
+                elif position < len(catalog.steps):
+                    found[key] = (score, catalog.steps[position])
+
+        if found:
+            now = time.time()
+            with self.connection:
+                self.connection.executemany(
+                    "UPDATE matches SET last_used = ? WHERE key = ?",
+                    ((now, key) for key in found),
+                )
+        return found
+
+    def put_many(
+        self,
+        entries: list[tuple[str, tuple[float, ExistingStepDef] | None]],
+        catalog: StepCatalog,
+    ) -> None:
+        """
+        Store matches, then evict the least recently used overflow.
+
+        Args:
+            entries: (key, match) pairs; match is None for "no similar step"
+            catalog: Catalog the matched definitions belong to
+        """
+        positions = {id(existing): i for i, existing in enumerate(catalog.steps)}
+        now = time.time()
+        rows = [
+            (
+                key,
+                *((match[0], positions[id(match[1])]) if match else (None, None)),
+                now,
+            )
+            for key, match in entries
+        ]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?)", rows
+            )
+            self.connection.execute(
+                "DELETE FROM matches WHERE key IN ("
+                "SELECT key FROM matches ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+
+class FeatureCache:
+    """Persistent cache of parsed feature files, one marshal file per entry.
+
+    Entries are content-addressed: the key digests the feature file's bytes
+    together with the parser backend and the GherkinParser and
+    TypeInferencer versions, so an edited file or a changed parser misses
+    instead of returning stale steps. Unlike the other caches this is a
+    plain directory, not SQLite, and the digest is zlib's CRC-32 and
+    Adler-32 plus the size instead of a hashlib hash, so a plain run imports
+    neither sqlite3 nor hashlib. Values are the deduplicated Step lists,
+    marshal-serialized as tuples of their fields.
+    flush() writes new entries, marks hits as used through their mtime, and
+    evicts the least recently used entries beyond MAX_BYTES.
+    """
+
+    DIRNAME = "features"
+
+    # Bump when the key or entry format changes
+    VERSION = 3
+
+    MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, cache_dir: Path, max_bytes: int = MAX_BYTES) -> None:
+        """
+        Open (or create) the cache directory.
+
+        Args:
+            cache_dir: Directory holding the cache directory
+            max_bytes: Size of stored entries kept after eviction
+
+        Raises:
+            OSError: If the directory cannot be created
+        """
+        self.directory = cache_dir / self.DIRNAME
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.pending: dict[str, bytes] = {}
+        self.used: set[str] = set()
+
+    def close(self) -> None:
+        """Write pending entries."""
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"Warning: feature cache not updated ({e})", file=sys.stderr)
+
+    def scope(self, parser: GherkinParser) -> str:
+        """
+        Get the key prefix of everything a parser's output depends on.
+
+        Args:
+            parser: Parser whose results are cached
+
+        Returns:
+            Key prefix
+        """
+        import marshal
+
+        backend = parser.backend
+        if backend == "behave":
+            try:
+                from behave.version import VERSION as behave_version
+            except ImportError:
+                behave_version = "fallback"
+            backend = f"{backend} {behave_version}"
+        return (
+            f"{self.VERSION}:{backend}:{GherkinParser.VERSION}:"
+            f"{TypeInferencer.VERSION}:{parser.STRIP_TRAILING_COLON}:{marshal.version}"
+        )
+
+    @staticmethod
+    def key(scope: str, content: bytes) -> str:
+        """Get the cache key of a feature file's contents within a scope."""
+        prefix = scope.encode() + b"\0"
+        crc = zlib.crc32(content, zlib.crc32(prefix))
+        adler = zlib.adler32(content, zlib.adler32(prefix))
+        return f"{crc:08x}{adler:08x}{len(content):x}"
+
+    def get(self, key: str) -> list[Step] | None:
+        """
+        Look up the steps of a feature file.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached steps, or None on a miss
+        """
+        import marshal
+
+        blob = self.pending.get(key)
+        if blob is None:
+            try:
+                blob = (self.directory / f"{key}.marshal").read_bytes()
+            except OSError:
+                return None
+            self.used.add(key)
+        try:
+            steps = marshal.loads(blob)
+        except (EOFError, ValueError, TypeError):
+            return None  # Written by a run that was interrupted
+        return [
+            Step(
+                step_type,
+                text,
+                pattern,
+                list(params),
+                dict(param_types),
+                has_table,
+                has_docstring,
+                docstring_content_type,
+            )
+            for (
+                step_type,
+                text,
+                pattern,
+                params,
+                param_types,
+                has_table,
+                has_docstring,
+                docstring_content_type,
+            ) in steps
+        ]
+
+    def put(self, key: str, steps: list[Step]) -> None:
+        """
+        Stage the steps of a feature file until the next flush().
+
+        Args:
+            key: Cache key
+            steps: Parsed steps
+        """
+        import marshal
+
+        self.pending[key] = marshal.dumps(
+            tuple(
+                (
+                    step.step_type,
+                    step.text,
+                    step.pattern,
+                    tuple(step.params),
+                    tuple(step.param_types.items()),
+                    step.has_table,
+                    step.has_docstring,
+                    step.docstring_content_type,
+                )
+                for step in steps
+            )
+        )
+
+    def flush(self) -> None:
+        """
+        Store pending entries and hits, then evict the overflow.
+
+        Raises:
+            OSError: If an entry cannot be written
+        """
+        now = time.time()
+        for key in self.used:
+            try:
+                os.utime(self.directory / f"{key}.marshal", (now, now))
+            except FileNotFoundError:
+                pass  # Evicted by a concurrent run
+        self.used.clear()
+        if not self.pending:
+            return
+
+        # Written next to the target and renamed, so readers never see half an entry
+        for key, blob in self.pending.items():
+            partial = self.directory / f"{key}.{os.getpid()}.tmp"
+            partial.write_bytes(blob)
+            os.utime(partial, (now, now))
+            os.replace(partial, self.directory / f"{key}.marshal")
+        self.pending.clear()
+
+        # Most recently used first
+        entries = sorted(
+            (-entry.stat().st_mtime, entry.name, entry.stat().st_size)
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".marshal")
+        )
+        total = 0
+        for _, filename, size in entries:
+            total += size
+            if total > self.max_bytes:
+                (self.directory / filename).unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.directory.glob("*.marshal"))
+
+
+class GherkinParser:
+    """Parses Gherkin feature files into Step records.
+
+    The default "native" backend is a line-oriented state machine that
+    follows behave's parser state for state, so it accepts and rejects the
+    same files and yields the same steps, without building behave's model
+    objects. The "behave" backend runs behave's own parser.
+    """
+
+    BACKENDS = ("native", "behave")
+
+    # Bump when the steps produced for the same file change (FeatureCache)
+    VERSION = 1
+
+    # parse_files() only starts worker processes for at least this many
+    # uncached files; below it, process startup costs more than it saves
+    MIN_PARALLEL_FILES = 32
+
+    # behave's i18n keywords for English; other languages need behave
+    KEYWORDS: dict[str, list[str]] = {
+        "feature": ["Feature", "Business Need", "Ability"],
+        "background": ["Background"],
+        "rule": ["Rule"],
+        "scenario": ["Example", "Scenario"],
+        "scenario_outline": ["Scenario Outline", "Scenario Template"],
+        "examples": ["Examples", "Scenarios"],
+        "given": ["* ", "Given "],
+        "when": ["* ", "When "],
+        "then": ["* ", "Then "],
+        "and": ["* ", "And "],
+        "but": ["* ", "But "],
+    }
+
+    # Table cells are split on pipes that are not escaped
+    CELL_SEPARATOR_RE = re.compile(r"(?<!\\)\|")
+
+    # Mirrors behave's BEHAVE_STRIP_STEPS_WITH_TRAILING_COLON switch
+    STRIP_TRAILING_COLON = (
+        os.environ.get("BEHAVE_STRIP_STEPS_WITH_TRAILING_COLON", "no") == "yes"
+    )
+
+    # Compiled keyword matchers by language
+    _grammars: dict[
+        str,
+        tuple[
+            dict[str, tuple[str, ...]],
+            re.Pattern[str],
+            dict[str, tuple[str, str]],
+        ],
+    ] = {}
+
+    PARAM_PATTERNS = [
+        (r'"([^"]*)"', "string"),  # Quoted strings
+        (r"'([^']*)'", "string"),  # Single quoted strings
+        (r"<([^>]+)>", "param"),  # Scenario outline parameters
+        (r"\{([^}]+)\}", "param"),  # Already parameterized steps
+        (r"\b(\d+(?:\.\d+)?)\b", "number"),  # Numbers (int or float)
+    ]
+
+    # PARAM_PATTERNS, compiled once
+    PARAM_RES = [
+        (re.compile(regex), param_type) for regex, param_type in PARAM_PATTERNS
+    ]
+
+    # Every PARAM_PATTERNS match contains one of these characters
+    PARAM_TRIGGER_RE = re.compile(r"[\"'<{\d]")
+
+    # Parameter name cleanup
+    NAME_INVALID_RE = re.compile(r"[^a-z0-9_]")
+    NAME_UNDERSCORES_RE = re.compile(r"_+")
+
+    def __init__(
+        self, backend: str = "native", cache: FeatureCache | None = None
+    ) -> None:
+        """
+        Initialize parser.
+
+        Args:
+            backend: "native" (streaming state machine) or "behave"
+            cache: Persistent cache of parsed feature files
+
+        Raises:
+            ValueError: If backend is not one of BACKENDS
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown Gherkin parser backend: {backend}")
+        self.backend = backend
+        self.type_inferencer = TypeInferencer()
+        self.cache = cache
+        self.cache_scope = cache.scope(self) if cache is not None else ""
+
+    def parse_file(self, file_path: Path) -> list[Step]:
+        """
+        Parse a feature file with the configured backend.
+
+        Args:
+            file_path: Path to the .feature file
+
+        Returns:
+            List of unique Step objects
+
+        Raises:
+            FileNotFoundError: If file doesn't exist
+            ValueError: If file is not a .feature file, or is not valid
+                Gherkin (native backend)
+        """
+        content = self._read_file(file_path)
+        if self.cache is None:
+            return self._parse_file(file_path, content)
+
+        key = self.cache.key(self.cache_scope, content)
+        steps = self.cache.get(key)
+        if steps is None:
+            steps = self._parse_file(file_path, content)
+            self.cache.put(key, steps)
+        return steps
+
+    def parse_files(
+        self, file_paths: list[Path], jobs: int = 1
+    ) -> list[tuple[list[Step] | None, str | None]]:
+        """
+        Parse feature files, in worker processes if enabled.
+
+        Every file is parsed even if others fail. Results are in input
+        order, so they do not depend on jobs. Cached files are answered by
+        this process, and only the others are sent to the workers.
+
+        Args:
+            file_paths: Paths to .feature files
+            jobs: Number of worker processes; fewer than MIN_PARALLEL_FILES
+                uncached files are always parsed serially
+
+        Returns:
+            (unique steps, None) or (None, error message) per file
+        """
+        results: list[tuple[list[Step] | None, str | None]] = []
+        misses: list[tuple[int, Path, bytes, str]] = []
+        for file_path in file_paths:
+            try:
+                content = self._read_file(file_path)
+            except (OSError, ValueError) as e:
+                results.append((None, str(e)))
+                continue
+            key = ""
+            steps = None
+            if self.cache is not None:
+                key = self.cache.key(self.cache_scope, content)
+                steps = self.cache.get(key)
+            if steps is None:
+                misses.append((len(results), file_path, content, key))
+            results.append((steps, None))
+
+        if jobs <= 1 or len(misses) < self.MIN_PARALLEL_FILES:
+            parsed: Iterable[tuple[list[Step] | None, str | None]] = (
+                self._try_parse_file(file_path, content)
+                for _, file_path, content, _ in misses
+            )
+            self._store_parsed(results, misses, parsed)
+            return results
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        # A few chunks per worker keeps the pool balanced
+        chunk_size = max(1, -(-len(misses) // (jobs * 4)))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = executor.map(
+                _parse_feature_file,
+                [file_path for _, file_path, _, _ in misses],
+                [content for _, _, content, _ in misses],
+                [self.backend] * len(misses),
+                chunksize=chunk_size,
+            )
+            self._store_parsed(results, misses, parsed)
+        return results
+
+    def _store_parsed(
+        self,
+        results: list[tuple[list[Step] | None, str | None]],
+        misses: list[tuple[int, Path, bytes, str]],
+        parsed: Iterable[tuple[list[Step] | None, str | None]],
+    ) -> None:
+        """Fill in the results of uncached files and cache the valid ones."""
+        for (position, _, _, key), result in zip(misses, parsed):
+            results[position] = result
+            if self.cache is not None and result[0] is not None:
+                self.cache.put(key, result[0])
+
+    @staticmethod
+    def _read_file(file_path: Path) -> bytes:
+        """Read a feature file, rejecting missing and non-.feature paths."""
+        if not file_path.exists():
+            raise FileNotFoundError(f"Feature file not found: {file_path}")
+
+        if file_path.suffix != ".feature":
+            raise ValueError(f"Expected .feature file, got: {file_path.suffix}")
+
+        return file_path.read_bytes()
+
+    def _try_parse_file(
+        self, file_path: Path, content: bytes
+    ) -> tuple[list[Step] | None, str | None]:
+        """Parse a feature file's contents; errors are returned, not raised."""
+        try:
+            return self._parse_file(file_path, content), None
+        except Exception as e:
+            return None, str(e)
+
+    def _parse_file(self, file_path: Path, content: bytes) -> list[Step]:
+        """Parse a feature file's contents with the configured backend."""
+        if self.backend == "native":
+            # Decoded like behave does: strict UTF-8, BOM kept
+            steps = self.iter_steps(content.decode("utf-8"))
+            return self._deduplicate_steps(list(steps))
+
+        try:
+            from behave.parser import parse_file as behave_parse_file
+
+            feature = behave_parse_file(str(file_path))
+        except ImportError:
+            # Fallback to regex-based parsing if behave not available
+            print(
+                "Warning: behave not installed, using fallback parser",
+                file=sys.stderr,
+            )
+            return self._parse_file_fallback(file_path)
+
+        return self._extract_steps_from_feature(feature)
+
+    def _extract_steps_from_feature(self, feature: Any) -> list[Step]:
+        """
+        Extract steps from Behave feature object.
+
+        Args:
+            feature: Behave Feature object
+
+        Returns:
+            List of Step objects
+        """
+        steps: list[Step] = []
+
+        # Process Background steps
+        if hasattr(feature, "background") and feature.background:
+            previous_step_type: str | None = None
+            for behave_step in feature.background.steps:
+                step = self._convert_behave_step(behave_step, previous_step_type)
+                steps.append(step)
+                previous_step_type = step.step_type
+
+        # Process Scenario steps (top-level scenarios)
+        if hasattr(feature, "scenarios"):
+            for scenario in feature.scenarios:
+                if hasattr(scenario, "steps"):
+                    # Reset previous_step_type for each scenario
+                    previous_step_type = None
+                    for behave_step in scenario.steps:
+                        step = self._convert_behave_step(
+                            behave_step, previous_step_type
+                        )
+                        steps.append(step)
+                        previous_step_type = step.step_type
+
+        # Process Rule blocks (scenarios nested under rules)
+        if hasattr(feature, "rules"):
+            for rule in feature.rules:
+                # Process Rule background (if any)
+                if hasattr(rule, "background") and rule.background:
+                    previous_step_type = None
+                    for behave_step in rule.background.steps:
+                        step = self._convert_behave_step(
+                            behave_step, previous_step_type
+                        )
+                        steps.append(step)
+                        previous_step_type = step.step_type
+
+                # Process scenarios in the rule
+                if hasattr(rule, "scenarios"):
+                    for scenario in rule.scenarios:
+                        if hasattr(scenario, "steps"):
+                            # Reset previous_step_type for each scenario
+                            previous_step_type = None
+                            for behave_step in scenario.steps:
+                                step = self._convert_behave_step(
+                                    behave_step, previous_step_type
+                                )
+                                steps.append(step)
+                                previous_step_type = step.step_type
+
+        return self._deduplicate_steps(steps)
+
+    def _convert_behave_step(
+        self, behave_step: Any, previous_step_type: str | None = None
+    ) -> Step:
+        """
+        Convert Behave step to our Step record.
+
+        Args:
+            behave_step: Behave Step object
+            previous_step_type: Step type from previous step (for And/But/* inheritance)
+
+        Returns:
+            Step object
+        """
+        # Normalize step type
+        step_type = behave_step.keyword.lower().strip()
+        if step_type in ("and", "but", "*"):
+            # And/But/* inherit step type from previous step
+            # If no previous step, default to 'given'
+            step_type = previous_step_type if previous_step_type else "given"
+
+        # Check for data table
+        has_table = hasattr(behave_step, "table") and behave_step.table is not None
+
+        # Check for doc string
+        has_docstring = hasattr(behave_step, "text") and behave_step.text is not None
+        docstring_content_type = None
+        if has_docstring:
+            docstring_content_type = getattr(behave_step.text, "content_type", None)
+
+        return self._build_step(
+            step_type,
+            behave_step.name,
+            has_table=has_table,
+            has_docstring=has_docstring,
+            docstring_content_type=docstring_content_type,
+        )
+
+    def _build_step(
+        self,
+        step_type: str,
+        text: str,
+        has_table: bool = False,
+        has_docstring: bool = False,
+        docstring_content_type: str | None = None,
+    ) -> Step:
+        """
+        Create a Step, extracting its pattern and parameter types.
+
+        Args:
+            step_type: 'given', 'when' or 'then'
+            text: Step text (without keyword)
+            has_table: Step has a data table
+            has_docstring: Step has a doc string
+            docstring_content_type: Content type of the doc string
+
+        Returns:
+            Step object
+        """
+        # Extract parameters and create pattern
+        pattern, params = self._extract_parameters(text)
+
+        # Infer parameter types
+        param_types = {
+            param: self.type_inferencer.infer_type(param, pattern) for param in params
+        }
+
+        return Step(
+            step_type=step_type,
+            text=text,
+            pattern=pattern,
+            params=params,
+            param_types=param_types,
+            has_table=has_table,
+            has_docstring=has_docstring,
+            docstring_content_type=docstring_content_type,
+        )
+
+    @classmethod
+    def _grammar(
+        cls, language: str
+    ) -> tuple[dict[str, tuple[str, ...]], re.Pattern[str], dict[str, tuple[str, str]]]:
+        """
+        Get the keyword matchers of a language.
+
+        Args:
+            language: Gherkin language code
+
+        Returns:
+            (section kind -> "Keyword:" prefixes, step keyword regex, lowercased
+            step keyword -> (keyword, kind))
+
+        Raises:
+            ValueError: If the language is unknown, or not English without behave
+        """
+        grammar = cls._grammars.get(language)
+        if grammar is not None:
+            return grammar
+
+        keywords = cls.KEYWORDS
+        if language != "en":
+            try:
+                from behave.i18n import languages
+            except ImportError:
+                raise ValueError(
+                    f"language '{language}' needs behave installed"
+                ) from None
+            if language not in languages:
+                raise ValueError(f"unknown language '{language}'")
+            keywords = languages[language]
+
+        sections = {
+            kind: tuple(f"{alias}:" for alias in keywords[kind])
+            for kind in (
+                "feature",
+                "background",
+                "rule",
+                "scenario",
+                "scenario_outline",
+                "examples",
+            )
+        }
+        # Same precedence as behave: step kinds in this order, first alias wins
+        step_keywords: dict[str, tuple[str, str]] = {}
+        for kind in ("given", "when", "then", "and", "but"):
+            for keyword in keywords[kind]:
+                step_keywords.setdefault(keyword.lower(), (keyword, kind))
+        step_re = re.compile(
+            "|".join(re.escape(keyword) for keyword, _ in step_keywords.values()),
+            re.IGNORECASE,
+        )
+
+        grammar = cls._grammars[language] = (sections, step_re, step_keywords)
+        return grammar
+
+    def iter_steps(self, content: str) -> Iterator[Step]:
+        """
+        Stream the steps of a feature file in one pass (native backend).
+
+        States and transitions follow behave's parser: descriptions are
+        skipped, Background, Scenario, Scenario Outline and Rule blocks are
+        entered in file order (the order behave's model lists them in),
+        data tables and doc strings are attached to the step they follow,
+        and Examples tables are skipped. And/But/* steps take the type of
+        the previous step of their block, or 'given' on the first step.
+
+        Args:
+            content: Feature file content
+
+        Yields:
+            Steps in file order, not deduplicated; each step is yielded once
+            its data table or doc string (if any) has been read
+
+        Raises:
+            ValueError: Where behave would raise a ParserError, with the line
+        """
+        sections, step_re, step_keywords = self._grammar("en")
+        separator = self.CELL_SEPARATOR_RE
+
+        state = "initial"
+        tags = False
+        number = 0
+        line = ""
+
+        def error(message: str) -> ValueError:
+            return ValueError(f"line {number}: {message}: {line}")
+
+        # Current Background/Scenario/Scenario Outline
+        statement = ""
+        statement_has_steps = False
+        pending: Step | None = None  # last step, until its arguments are read
+        previous_step_type: str | None = None  # for our And/But/* typing
+        last_step_type: str | None = None  # behave's, only for its error check
+
+        # Background steps, for And/But as the first step of a block
+        in_rule = False
+        feature_background = False
+        feature_background_steps = False
+        rule_background = False
+        rule_background_steps = False
+
+        table_columns: int | None = None
+        examples = False
+        terminator = ""
+        leading = 0
+
+        for number, raw in enumerate(content.splitlines(), 1):
+            ended_table = False
+            if state == "multiline_text":
+                if raw.strip().startswith(terminator):
+                    pending.has_docstring = True
+                    pending.docstring_content_type = "text/plain"
+                    pending = self._strip_trailing_colon(pending)
+                    state = "steps"
+                elif raw[:leading].strip():
+                    line = raw
+                    raise error("BAD-INDENT in multiline text")
+                continue
+
+            line = raw.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                if state == "initial" and not tags:
+                    comment = line[1:].strip()
+                    if comment.lower().startswith("language:"):
+                        sections, step_re, step_keywords = self._grammar(
+                            comment[9:].strip()
+                        )
+                continue
+
+            if state == "table":
+                if line.startswith("|"):
+                    cells = len(separator.split(line[1:-1]))
+                    if table_columns is None:
+                        table_columns = cells
+                    elif cells != table_columns:
+                        raise error("Malformed table")
+                    continue
+                # End of table; behave hands the stripped line to the steps state
+                ended_table = True
+                if not examples:
+                    pending.has_table = True
+                    pending = self._strip_trailing_colon(pending)
+                examples = False
+                table_columns = None
+                state = "steps"
+
+            if state == "initial":
+                if line.startswith("@"):
+                    tags = self._check_tags(line, error)
+                    continue
+                if line.startswith(sections["feature"]):
+                    state = "feature"
+                    tags = False
+                    continue
+                raise error("Parser failure in state=initial")
+
+            # Step lines (steps state, and the first step of a block)
+            if state == "scenario":
+                last_step_type = None
+            if state in ("steps", "scenario"):
+                if state == "steps" and line.startswith(('"""', "'''")):
+                    if not statement_has_steps:
+                        raise error("Multi-line text before any step")
+                    state = "multiline_text"
+                    terminator = line[:3]
+                    # Opened on the line ending a table, the stripped line has no indent
+                    leading = 0 if ended_table else len(raw) - len(raw.lstrip())
+                    continue
+
+                match = step_re.match(line)
+                if match is not None:
+                    keyword, kind = step_keywords[match.group().lower()]
+                    text = line[len(keyword) :].strip()
+                    if keyword.startswith("*") and last_step_type:
+                        pass
+                    elif kind in ("and", "but"):
+                        if not last_step_type:
+                            has_background_steps = (
+                                rule_background
+                                and (rule_background_steps or feature_background_steps)
+                                if in_rule
+                                else feature_background_steps
+                            )
+                            if not has_background_steps:
+                                raise error(
+                                    f"{kind.upper()}-STEP REQUIRES: "
+                                    "An previous Given/When/Then step"
+                                )
+                            last_step_type = kind
+                    else:
+                        last_step_type = kind
+
+                    if kind in ("and", "but") or keyword.startswith("*"):
+                        step_type = previous_step_type or "given"
+                    else:
+                        step_type = kind
+                    previous_step_type = step_type
+
+                    if pending is not None:
+                        yield pending
+                    pending = self._build_step(step_type, text)
+                    statement_has_steps = True
+                    if statement == "background":
+                        if in_rule:
+                            rule_background_steps = True
+                        else:
+                            feature_background_steps = True
+                    state = "steps"
+                    continue
+
+            # Tags and the statements they may precede
+            if state in ("steps", "scenario", "feature", "rule", "taggable_statement"):
+                if line.startswith("@"):
+                    tags = self._check_tags(line, error)
+                    state = "taggable_statement"
+                    continue
+
+                kind = ""
+                for candidate in ("rule", "scenario", "scenario_outline", "examples"):
+                    if line.startswith(sections[candidate]):
+                        kind = candidate
+                        break
+
+                if kind == "examples":
+                    if statement != "scenario_outline":
+                        raise error("Examples must only appear inside scenario outline")
+                    state = "table"
+                    examples = True
+                    table_columns = None
+                    tags = False
+                    continue
+                if kind:
+                    if pending is not None:
+                        yield pending
+                        pending = None
+                    tags = False
+                    if kind == "rule":
+                        statement = "rule"
+                        in_rule = True
+                        # behave gives each rule a default background from the feature
+                        rule_background = feature_background
+                        rule_background_steps = False
+                        state = "rule"
+                    else:
+                        statement = kind
+                        statement_has_steps = False
+                        previous_step_type = None
+                        state = "scenario"
+                    continue
+
+            if state == "steps":
+                if line.startswith("|"):
+                    if not statement_has_steps:
+                        raise error("TABLE-START without step detected")
+                    state = "table"
+                    table_columns = len(separator.split(line[1:-1]))
+                    continue
+                raise error("Parser failure in state=steps")
+
+            if state == "taggable_statement":
+                raise error("Parser failure in state=taggable_statement")
+
+            if state in ("feature", "rule") and line.startswith(sections["background"]):
+                if pending is not None:
+                    yield pending
+                    pending = None
+                if in_rule:
+                    rule_background = True
+                else:
+                    feature_background = True
+                statement = "background"
+                statement_has_steps = False
+                previous_step_type = None
+                state = "scenario"
+                continue
+
+            # Anything else is description text
+
+        if state == "table" and not examples and table_columns is not None:
+            pending.has_table = True
+            pending = self._strip_trailing_colon(pending)
+        if pending is not None:
+            yield pending
+
+    def _strip_trailing_colon(self, step: Step) -> Step:
+        """Drop a trailing colon from a step with arguments, if behave would."""
+        if not (self.STRIP_TRAILING_COLON and step.text.endswith(":")):
+            return step
+        return self._build_step(
+            step.step_type,
+            step.text[:-1],
+            has_table=step.has_table,
+            has_docstring=step.has_docstring,
+            docstring_content_type=step.docstring_content_type,
+        )
+
+    @staticmethod
+    def _check_tags(line: str, error: Callable[[str], ValueError]) -> bool:
+        """Validate a tag line the way behave does."""
+        for word in line.split():
+            if word.startswith("#"):
+                break
+            if not word.startswith("@"):
+                raise error(f"tag: {word}")
+        return True
+
+    def _parse_file_fallback(self, file_path: Path) -> list[Step]:
+        """
+        Fallback parser using regex (when Behave not available).
+
+        Args:
+            file_path: Path to feature file
+
+        Returns:
+            List of Step objects
+        """
+        content = file_path.read_text(encoding="utf-8")
+        return self._parse_content_fallback(content)
+
+    def _parse_content_fallback(self, content: str) -> list[Step]:
+        """
+        Parse Gherkin content using regex fallback.
+
+        Args:
+            content: Gherkin feature file content
+
+        Returns:
+            List of unique Step objects
+        """
+        steps: list[Step] = []
+        current_step_type: str | None = None
+
+        step_keywords = ("Given", "When", "Then", "And", "But", "*")
+
+        for line in content.split("\n"):
+            line = line.strip()
+
+            # Skip empty lines, comments, and non-step lines
+            if not line or line.startswith("#"):
+                continue
+
+            # Check if line starts with a step keyword
+            for keyword in step_keywords:
+                if line.startswith(f"{keyword} "):
+                    step_text = line[len(keyword) :].strip()
+
+                    # Determine step type
+                    if keyword == "Given":
+                        current_step_type = "given"
+                    elif keyword == "When":
+                        current_step_type = "when"
+                    elif keyword == "Then":
+                        current_step_type = "then"
+                    elif keyword in ("And", "But", "*"):
+                        if not current_step_type:
+                            current_step_type = "given"
+                    else:
+                        continue
+
+                    # Extract parameters and create pattern
+                    pattern, params = self._extract_parameters(step_text)
+
+                    # Infer parameter types
+                    param_types = {
+                        param: self.type_inferencer.infer_type(param, pattern)
+                        for param in params
+                    }
+
+                    step = Step(
+                        step_type=current_step_type,
+                        text=step_text,
+                        pattern=pattern,
+                        params=params,
+                        param_types=param_types,
+                    )
+
+                    steps.append(step)
+                    break
+
+        return self._deduplicate_steps(steps)
+
+    def _extract_parameters(self, text: str) -> tuple[str, list[str]]:
+        """
+        Extract parameters from step text and create regex pattern.
+
+        Each PARAM_PATTERNS entry is scanned on its own; the matches are
+        merged by position, earlier patterns winning ties, and a match that
+        overlaps a kept one is dropped. The pattern is then built left to
+        right with one join. Parameters of each type are numbered from the
+        right, so the last number in the text is number1.
+
+        Args:
+            text: Step text
+
+        Returns:
+            Tuple of (regex_pattern, parameter_names)
+        """
+        if not self.PARAM_TRIGGER_RE.search(text):
+            return text, []
+
+        found = [
+            (match.start(), index, match)
+            for index, (regex, _) in enumerate(self.PARAM_RES)
+            for match in regex.finditer(text)
+        ]
+        found.sort(key=lambda entry: entry[:2])
+
+        # Remove overlapping matches (keep first match)
+        kept: list[tuple[re.Match[str], str]] = []
+        remaining: dict[str, int] = {}
+        last_end = -1
+        for start, index, match in found:
+            if start >= last_end:
+                param_type = self.PARAM_RES[index][1]
+                kept.append((match, param_type))
+                remaining[param_type] = remaining.get(param_type, 0) + 1
+                last_end = match.end()
+
+        pieces: list[str] = []
+        params: list[str] = []
+        position = 0
+        for match, param_type in kept:
+            number = remaining[param_type]
+            remaining[param_type] = number - 1
+
+            # Use descriptive names when possible
+            matched_text = match.group(1)
+            param_name = ""
+            if matched_text and not self._is_numeric(matched_text):
+                # Clean up parameter name
+                param_name = self.NAME_INVALID_RE.sub("_", matched_text.lower())
+                param_name = self.NAME_UNDERSCORES_RE.sub("_", param_name).strip("_")
+            if not param_name or param_name[0].isdigit():
+                param_name = f"{param_type}{number}"
+            params.append(param_name)
+
+            # Create replacement pattern
+            if param_type == "number":
+                # Determine if int or float
+                fmt = "f" if "." in matched_text else "d"
+                replacement = f"{{{param_name}:{fmt}}}"
+            elif param_type == "param":
+                # Already has <> or {}, just use param name
+                replacement = f"{{{param_name}}}"
+            else:
+                # Quoted string - keep quotes in pattern
+                replacement = f'"{{{param_name}}}"'
+
+            pieces.append(text[position : match.start()])
+            pieces.append(replacement)
+            position = match.end()
+
+        pieces.append(text[position:])
+        return "".join(pieces), params
+
+    def _is_numeric(self, text: str) -> bool:
+        """Check if text is numeric."""
+        try:
+            float(text)
+            return True
+        except ValueError:
+            return False
+
+    def _deduplicate_steps(self, steps: list[Step]) -> list[Step]:
+        """
+        Remove duplicate steps based on pattern.
+
+        Args:
+            steps: List of steps
+
+        Returns:
+            List of unique steps
+        """
+        seen: set[tuple[str, str]] = set()
+        unique_steps: list[Step] = []
+
+        for step in steps:
+            key = (step.step_type, step.pattern)
+            if key not in seen:
+                seen.add(key)
+                unique_steps.append(step)
+
+        return unique_steps
+
+
+class StubGenerator:
+    """Generates Python step definition stubs from steps."""
+
+    TEMPLATE = '''"""Step definitions for {feature_name}."""
+from decimal import Decimal
+
+from behave import given, when, then
+from behave.runner import Context
+
+
+# ============================================================================
+# Given Steps - Setup and Preconditions
+# ============================================================================
+
+{given_steps}
+
+# ============================================================================
+# When Steps - Actions and Events
+# ============================================================================
+
+{when_steps}
+
+# ============================================================================
+# Then Steps - Assertions and Verification
+# ============================================================================
+
+{then_steps}
+'''
+
+    STEP_TEMPLATE = '''
+@{decorator}('{pattern}')
+def {function_name}(context: Context{params}) -> None:
+    """TODO: Implement step: {original_text}
+{extra_docs}"""
+    raise NotImplementedError("Step not yet implemented")
+'''
+
+    STEP_WITH_SIMILAR_TEMPLATE = '''
+@{decorator}('{pattern}')
+def {function_name}(context: Context{params}) -> None:
+    """TODO: Implement step: {original_text}
+
+    NOTE: Similar step exists in {similar_file}:{similar_line}
+    Pattern: {similar_pattern}
+    Consider reusing or refactoring.
+{extra_docs}"""
+    raise NotImplementedError("Step not yet implemented")
+'''
+
+    # Minimum similarity for an existing step to be mentioned in a stub
+    SIMILARITY_THRESHOLD = 0.6
+
+    # Below this many steps, worker start-up costs more than it saves
+    MIN_PARALLEL_STEPS = 32
+
+    def __init__(
+        self,
+        existing_steps: StepCatalog | list[ExistingStepDef] | None = None,
+        similarity_engine: str = "exact",
+        jobs: int = 1,
+        skip_implemented: bool = True,
+        cache: SimilarityCache | None = None,
+    ) -> None:
+        """
+        Initialize generator.
+
+        Args:
+            existing_steps: Step catalog (or list of existing step
+                definitions) for reuse detection
+            similarity_engine: Name of the SIMILARITY_ENGINES backend used to
+                find similar existing steps
+            jobs: Number of worker processes for similarity scoring
+            skip_implemented: Leave out steps whose canonical pattern is
+                already defined by an existing step
+            cache: Persistent cache of similarity results, reused across runs
+
+        Raises:
+            ValueError: If similarity_engine is not a known engine
+        """
+        if similarity_engine not in SIMILARITY_ENGINES:
+            raise ValueError(f"Unknown similarity engine: {similarity_engine}")
+
+        self.jobs = jobs
+        self.skip_implemented = skip_implemented
+        self.similarity_engine_name = similarity_engine
+        self.cache = cache
+        self.catalog = StepCatalog.wrap(
+            existing_steps if existing_steps is not None else []
+        )
+        # Kept for callers of the pre-catalog API; same list as catalog.steps
+        self.existing_steps = self.catalog.steps
+        self.similarity_engine = SIMILARITY_ENGINES[similarity_engine](self.catalog)
+        self.used_function_names: set[str] = set()
+        self.similar_matches: dict[
+            tuple[str, str], tuple[float, ExistingStepDef] | None
+        ] = {}
+        self.implemented_steps: list[tuple[Step, ExistingStepDef]] = []
+
+        # behave's own matching catches steps whose placeholders differ from
+        # the generated pattern (e.g. a literal word matched by "{name}")
+        self.step_matcher: BehaveStepMatcher | None = None
+        if skip_implemented and self.catalog:
+            try:
+                self.step_matcher = BehaveStepMatcher(self.catalog)
+            except ImportError:
+                print(
+                    "Warning: behave not installed, "
+                    "detecting implemented steps by pattern only",
+                    file=sys.stderr,
+                )
+
+    def generate(self, steps: list[Step], feature_name: str = "feature") -> str:
+        """
+        Generate Python step definition stubs.
+
+        Args:
+            steps: List of Step objects
+            feature_name: Name of the feature (for documentation)
+
+        Returns:
+            Python code with step definition stubs
+        """
+        # Reset function names for this generation
+        self.used_function_names = set()
+
+        # Drop steps an existing definition already implements (O(1) each)
+        self.implemented_steps = []
+        if self.skip_implemented and self.catalog:
+            remaining: list[Step] = []
+            for step in steps:
+                existing = self.find_implementation(step)
+                if existing is None:
+                    remaining.append(step)
+                else:
+                    self.implemented_steps.append((step, existing))
+            steps = remaining
+
+        # Score all steps against existing steps in one batch
+        self.similar_matches = {}
+        if self.catalog and steps:
+            matches = self._cached_match_all(steps)
+            for step, match in zip(steps, matches):
+                self.similar_matches[(step.step_type, step.pattern)] = match
+
+        # Group steps by type
+        given_steps_list: list[Step] = []
+        when_steps_list: list[Step] = []
+        then_steps_list: list[Step] = []
+
+        for step in steps:
+            if step.step_type == "given":
+                given_steps_list.append(step)
+            elif step.step_type == "when":
+                when_steps_list.append(step)
+            elif step.step_type == "then":
+                then_steps_list.append(step)
+
+        # Generate stubs for each group
+        given_stubs = self._generate_stubs(given_steps_list)
+        when_stubs = self._generate_stubs(when_steps_list)
+        then_stubs = self._generate_stubs(then_steps_list)
+
+        # Fill template
+        code = self.TEMPLATE.format(
+            feature_name=feature_name,
+            given_steps=given_stubs or "# No Given steps found",
+            when_steps=when_stubs or "# No When steps found",
+            then_steps=then_stubs or "# No Then steps found",
+        )
+
+        return code
+
+    def _generate_stubs(self, steps: list[Step]) -> str:
+        """
+        Generate stubs for a list of steps.
+
+        Args:
+            steps: List of steps of the same type
+
+        Returns:
+            Python code with step definitions
+        """
+        if not steps:
+            return ""
+
+        stubs: list[str] = []
+
+        for step in steps:
+            # Generate unique function name
+            function_name = self._generate_unique_function_name(step)
+
+            # Generate parameter list with types
+            params_str = ""
+            if step.params:
+                params_str = ", " + ", ".join(
+                    f"{param}: {step.param_types.get(param, 'str')}"
+                    for param in step.params
+                )
+
+            # Build extra documentation
+            extra_docs_parts: list[str] = []
+            if step.has_table:
+                extra_docs_parts.append(
+                    "    This step expects a data table in context.table"
+                )
+            if step.has_docstring:
+                content_type = (
+                    f" ({step.docstring_content_type})"
+                    if step.docstring_content_type
+                    else ""
+                )
+                extra_docs_parts.append(
+                    f"    This step expects a doc string{content_type} in context.text"
+                )
+
+            extra_docs = "\n" + "\n".join(extra_docs_parts) if extra_docs_parts else ""
+
+            # Check for similar existing steps
+            similar_match = self._find_similar_match(step)
+
+            if similar_match:
+                # Use template with similarity warning
+                similarity, similar_step = similar_match
+                stub = self.STEP_WITH_SIMILAR_TEMPLATE.format(
+                    decorator=step.step_type,
+                    pattern=step.pattern,
+                    function_name=function_name,
+                    params=params_str,
+                    original_text=step.text,
+                    similar_file=similar_step.file_path.name,
+                    similar_line=similar_step.line_number,
+                    similar_pattern=similar_step.pattern,
+                    extra_docs=extra_docs,
+                )
+            else:
+                # Use regular template
+                stub = self.STEP_TEMPLATE.format(
+                    decorator=step.step_type,
+                    pattern=step.pattern,
+                    function_name=function_name,
+                    params=params_str,
+                    original_text=step.text,
+                    extra_docs=extra_docs,
+                )
+
+            stubs.append(stub.rstrip())
+
+        return "\n".join(stubs)
+
+    def find_implementation(self, step: Step) -> ExistingStepDef | None:
+        """
+        Find an existing definition that already implements a step.
+
+        Tries the canonical-pattern hash first, then behave's parse matcher
+        against the step text.
+
+        Args:
+            step: Step object
+
+        Returns:
+            Implementing step definition, or None
+        """
+        existing = self.catalog.find_exact(step)
+        if existing is None and self.step_matcher is not None:
+            existing = self.step_matcher.match(step.step_type, step.text)
+        return existing
+
+    def _cached_match_all(
+        self, steps: list[Step]
+    ) -> list[tuple[float, ExistingStepDef] | None]:
+        """
+        Match all steps, answering from the persistent cache where possible.
+
+        Args:
+            steps: Steps to match
+
+        Returns:
+            (similarity, step) tuple or None for each step, in input order
+        """
+        if self.cache is None:
+            return self._match_all(steps)
+
+        scope = self.cache.scope(
+            self.catalog, self.similarity_engine_name, self.SIMILARITY_THRESHOLD
+        )
+        keys = [self.cache.key(scope, step) for step in steps]
+        cached = self.cache.get_many(keys, self.catalog)
+
+        misses = [i for i, key in enumerate(keys) if key not in cached]
+        if misses:
+            computed = self._match_all([steps[i] for i in misses])
+            self.cache.put_many(
+                [(keys[i], match) for i, match in zip(misses, computed)],
+                self.catalog,
+            )
+            cached.update((keys[i], match) for i, match in zip(misses, computed))
+
+        return [cached[key] for key in keys]
+
+    def _match_all(
+        self, steps: list[Step]
+    ) -> list[tuple[float, ExistingStepDef] | None]:
+        """
+        Match all steps against the catalog, in worker processes if enabled.
+
+        The catalog is shipped to each worker once through the pool
+        initializer; results come back in input order, so the generated code
+        is identical to the serial path.
+
+        Args:
+            steps: Steps to match
+
+        Returns:
+            (similarity, step) tuple or None for each step, in input order
+        """
+        if self.jobs <= 1 or len(steps) < self.MIN_PARALLEL_STEPS:
+            return self.similarity_engine.match_all(
+                steps, threshold=self.SIMILARITY_THRESHOLD
+            )
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        # A few chunks per worker keeps the pool balanced
+        chunk_size = max(1, -(-len(steps) // (self.jobs * 4)))
+        chunks = [
+            steps[start : start + chunk_size]
+            for start in range(0, len(steps), chunk_size)
+        ]
+
+        with ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=_init_similarity_worker,
+            initargs=(self.catalog.steps, self.similarity_engine_name),
+        ) as executor:
+            results = executor.map(
+                _match_steps_in_worker,
+                chunks,
+                [self.SIMILARITY_THRESHOLD] * len(chunks),
+            )
+            return [
+                (match[0], self.catalog.steps[match[1]]) if match else None
+                for chunk in results
+                for match in chunk
+            ]
+
+    def _find_similar_match(self, step: Step) -> tuple[float, ExistingStepDef] | None:
+        """
+        Get the most similar existing step, preferring the batch result.
+
+        Args:
+            step: Step object
+
+        Returns:
+            (similarity, step) tuple, or None if nothing is similar enough
+        """
+        if not self.catalog:
+            return None
+
+        key = (step.step_type, step.pattern)
+        if key not in self.similar_matches:
+            matches = self.similarity_engine.find_best_matches(
+                step, k=1, threshold=self.SIMILARITY_THRESHOLD
+            )
+            self.similar_matches[key] = matches[0] if matches else None
+        return self.similar_matches[key]
+
+    def _generate_unique_function_name(self, step: Step) -> str:
+        """
+        Generate a unique valid Python function name from step pattern.
+
+        Args:
+            step: Step object
+
+        Returns:
+            Unique valid Python function name
+        """
+        base_name = self._generate_function_name_base(step)
+
+        # Ensure uniqueness
+        if base_name not in self.used_function_names:
+            self.used_function_names.add(base_name)
+            return base_name
+
+        # Add numeric suffix for conflicts
+        counter = 2
+        while f"{base_name}_{counter}" in self.used_function_names:
+            counter += 1
+
+        unique_name = f"{base_name}_{counter}"
+        self.used_function_names.add(unique_name)
+        return unique_name
+
+    def _generate_function_name_base(self, step: Step) -> str:
+        """
+        Generate base function name from step pattern.
+
+        Args:
+            step: Step object
+
+        Returns:
+            Valid Python function name base
+        """
+        # Remove parameter placeholders
+        text = re.sub(r"\{[^}]+\}", "", step.pattern)
+
+        # Remove quotes
+        text = text.replace('"', "").replace("'", "")
+
+        # Convert to snake_case
+        text = re.sub(r"[^a-z0-9]+", "_", text.lower())
+        text = re.sub(r"_+", "_", text).strip("_")
+
+        # Ensure it starts with a letter or underscore
+        if text and text[0].isdigit():
+            text = "step_" + text
+
+        # Limit length to prevent overly long names
+        if len(text) > 50:
+            text = text[:50].rstrip("_")
+
+        return text or "unnamed_step"
+
+
+def expand_feature_paths(paths: list[Path]) -> list[Path]:
+    """
+    Expand directories into the .feature files they contain.
+
+    Args:
+        paths: Feature files and/or directories
+
+    Returns:
+        Feature file paths; directory contents are sorted for stable output
+    """
+    feature_files: list[Path] = []
+    for path in paths:
+        if path.is_dir():
+            feature_files.extend(sorted(path.rglob("*.feature")))
+        else:
+            feature_files.append(path)
+    return feature_files
+
+
+def report_undefined_steps(
+    parsed_files: list[tuple[Path, list[Step]]], catalog: StepCatalog
+) -> int:
+    """
+    Print every step no existing definition matches.
+
+    Args:
+        parsed_files: (feature_file, steps) pairs
+        catalog: Existing step definitions
+
+    Returns:
+        Exit code: 0 if all steps are defined, 1 otherwise
+    """
+    try:
+        step_matcher: BehaveStepMatcher | None = BehaveStepMatcher(catalog)
+    except ImportError:
+        print(
+            "Warning: behave not installed, matching steps by pattern only",
+            file=sys.stderr,
+        )
+        step_matcher = None
+
+    undefined = 0
+    total = 0
+    for feature_file, steps in parsed_files:
+        for step in steps:
+            total += 1
+            if catalog.find_exact(step) is not None:
+                continue
+            if step_matcher and step_matcher.match(step.step_type, step.text):
+                continue
+            undefined += 1
+            print(
+                f"✗ Undefined step in {feature_file}: "
+                f"{step.step_type.capitalize()} {step.text}",
+                file=sys.stderr,
+            )
+
+    if undefined:
+        print(f"\n✗ {undefined} of {total} steps are undefined", file=sys.stderr)
+        return 1
+
+    print(f"\n✓ All {total} steps are defined", file=sys.stderr)
+    return 0
+
+
+def find_step_conflicts(catalog: StepCatalog) -> list[StepConflict]:
+    """
+    Find step definitions behave would reject with AmbiguousStep.
+
+    Duplicates are found by grouping definitions on their canonical
+    pattern. For ambiguity, each pattern is matched, as step text, against
+    the definitions BehaveStepMatcher's literal-prefix trie offers for it,
+    so only definitions sharing its leading words are ever compiled and
+    tested. Both directions are checked because behave's verdict depends on
+    the order it happens to import step modules in.
+
+    Args:
+        catalog: Existing step definitions
+
+    Returns:
+        Conflicts ordered by the catalog position of both definitions
+    """
+    keys = [
+        (existing.step_type, catalog.canonicalize(existing.pattern))
+        for existing in catalog.steps
+    ]
+    groups: dict[tuple[str, str], list[int]] = {}
+    for position, key in enumerate(keys):
+        groups.setdefault(key, []).append(position)
+
+    pairs: dict[tuple[int, int], str] = {}
+    for positions in groups.values():
+        for position in positions[1:]:
+            pairs[(positions[0], position)] = "duplicate"
+
+    try:
+        step_matcher: BehaveStepMatcher | None = BehaveStepMatcher(catalog)
+    except ImportError:
+        print(
+            "Warning: behave not installed, reporting duplicate patterns only",
+            file=sys.stderr,
+        )
+        step_matcher = None
+
+    if step_matcher is not None:
+        for position, existing in enumerate(catalog.steps):
+            for other in step_matcher.matching_positions(
+                existing.step_type, existing.pattern
+            ):
+                if keys[other] != keys[position]:
+                    pair = (min(position, other), max(position, other))
+                    pairs.setdefault(pair, "ambiguous")
+
+    return [
+        StepConflict(kind, catalog.steps[first], catalog.steps[second])
+        for (first, second), kind in sorted(pairs.items())
+    ]
+
+
+def report_step_conflicts(catalog: StepCatalog) -> int:
+    """
+    Print every duplicate or ambiguous pair of step definitions.
+
+    Args:
+        catalog: Existing step definitions
+
+    Returns:
+        Exit code: 0 if there are no conflicts, 1 otherwise
+    """
+    conflicts = find_step_conflicts(catalog)
+    for conflict in conflicts:
+        first, second = conflict.first, conflict.second
+        print(
+            f"✗ {conflict.kind.capitalize()} step: "
+            f"@{second.step_type}('{second.pattern}') "
+            f"at {second.file_path}:{second.line_number}\n"
+            f"  conflicts with @{first.step_type}('{first.pattern}') "
+            f"at {first.file_path}:{first.line_number}",
+            file=sys.stderr,
+        )
+
+    if conflicts:
+        print(
+            f"\n✗ {len(conflicts)} pairs of conflicting step definitions",
+            file=sys.stderr,
+        )
+        return 1
+
+    print(f"\n✓ No conflicts among {len(catalog)} step definitions", file=sys.stderr)
+    return 0
+
+
+def generate_from_features(
+    feature_paths: list[Path],
+    generator: StubGenerator,
+    list_undefined: bool = False,
+    parse_file: Callable[[Path], list[Step]] | None = None,
+    steps_dir: Path | None = None,
+    parser: GherkinParser | None = None,
+    jobs: int = 1,
+) -> tuple[int, str | None, str | None]:
+    """
+    Parse feature files and generate stubs for their steps.
+
+    Progress and errors are printed to stderr. Every file is parsed even if
+    others fail. Stubs are still generated from the files that parsed, and
+    the exit code is 1 if any file failed.
+
+    Args:
+        feature_paths: Feature files and/or directories
+        generator: Generator holding the existing step catalog
+        list_undefined: Report undefined steps instead of generating stubs
+        parse_file: Custom single-file parser, always called serially
+            (overrides parser)
+        steps_dir: Directory the catalog was scanned from, for messages
+        parser: Feature file parser (default: GherkinParser())
+        jobs: Number of worker processes for parsing
+
+    Returns:
+        (exit code, generated code or None, name of the first parsed feature
+        or None)
+    """
+    feature_files = expand_feature_paths(feature_paths)
+    if parse_file is not None:
+        results: list[tuple[list[Step] | None, str | None]] = []
+        for feature_file in feature_files:
+            try:
+                results.append((parse_file(feature_file), None))
+            except Exception as e:
+                results.append((None, str(e)))
+    else:
+        results = (parser or GherkinParser()).parse_files(feature_files, jobs)
+
+    all_steps: list[Step] = []
+    feature_names: list[str] = []
+    parsed_files: list[tuple[Path, list[Step]]] = []
+    errors = 0
+
+    # Results are in input order, so the merge is the same for any jobs
+    for feature_file, (steps, error) in zip(feature_files, results):
+        if steps is None:
+            errors += 1
+            print(f"✗ Error parsing {feature_file}: {error}", file=sys.stderr)
+            continue
+        all_steps.extend(steps)
+        feature_names.append(feature_file.stem)
+        parsed_files.append((feature_file, steps))
+        print(
+            f"✓ Parsed {len(steps)} unique steps from {feature_file}",
+            file=sys.stderr,
+        )
+
+    exit_code = 0
+    if errors:
+        print(
+            f"✗ {errors} of {len(feature_files)} feature files could not be parsed",
+            file=sys.stderr,
+        )
+        exit_code = 1
+        if not parsed_files:
+            return exit_code, None, None
+
+    if not all_steps:
+        print("No steps found in feature files", file=sys.stderr)
+        return 1, None, None
+
+    if list_undefined:
+        return (
+            report_undefined_steps(parsed_files, generator.catalog) or exit_code,
+            None,
+            None,
+        )
+
+    # Deduplicate across all files
+    seen: set[tuple[str, str]] = set()
+    unique_steps: list[Step] = []
+    for step in all_steps:
+        key = (step.step_type, step.pattern)
+        if key not in seen:
+            seen.add(key)
+            unique_steps.append(step)
+
+    print(
+        f"\n✓ Total {len(unique_steps)} unique steps across all files",
+        file=sys.stderr,
+    )
+
+    feature_name = "_".join(feature_names) if feature_names else "feature"
+    code = generator.generate(unique_steps, feature_name)
+
+    if generator.implemented_steps:
+        location = f" in {steps_dir}" if steps_dir else ""
+        print(
+            f"✓ Skipped {len(generator.implemented_steps)} steps "
+            f"already implemented{location}",
+            file=sys.stderr,
+        )
+
+    return exit_code, code, feature_names[0]
+
+
+class StubDaemon:
+    """Long-running generator that keeps the step catalog hot.
+
+    The daemon scans the steps directory once, then only re-parses step
+    files whose mtime or size changed; feature files are re-parsed the same
+    way per request. File-change events come from watchdog (inotify on
+    Linux) when it is installed, otherwise from a polling thread; both only
+    mark the catalog stale, and the next request refreshes it. Requests are
+    served one at a time over a Unix socket, one JSON line each way.
+    """
+
+    # Seconds between polls when watchdog is not installed
+    POLL_INTERVAL = 1.0
+
+    # Parsed feature files kept between requests, least recently used
+    # evicted first
+    MAX_FEATURES = 1024
+
+    def __init__(
+        self,
+        steps_dir: Path,
+        scanner: ExistingStepScanner | None = None,
+        similarity_engine: str = "exact",
+        jobs: int = 1,
+        cache: SimilarityCache | None = None,
+        gherkin_parser: GherkinParser | None = None,
+        step_libraries: Iterable[CompiledStepIndex] = (),
+    ) -> None:
+        """
+        Initialize daemon and scan the steps directory.
+
+        Args:
+            steps_dir: Directory containing existing step definitions
+            scanner: Scanner used for step files
+            similarity_engine: Name of the SIMILARITY_ENGINES backend
+            jobs: Number of worker processes for scanning and scoring
+            cache: Persistent similarity cache shared by all requests
+            gherkin_parser: Parser used for feature files
+            step_libraries: Compiled step libraries placed before the
+                scanned steps, as with --step-library
+        """
+        import threading
+
+        self.steps_dir = steps_dir
+        self.step_libraries = list(step_libraries)
+        self.scanner = scanner or ExistingStepScanner()
+        self.similarity_engine = similarity_engine
+        self.jobs = jobs
+        self.cache = cache
+        self.gherkin_parser = gherkin_parser or GherkinParser()
+        self.files: dict[Path, tuple[tuple[int, int], list[ExistingStepDef]]] = {}
+        self.features: dict[Path, tuple[tuple[int, int], list[Step]]] = {}
+        self.stale = threading.Event()
+        self.generator = StubGenerator()
+        self.refresh(force=True)
+
+    def snapshot(self) -> dict[Path, tuple[int, int]]:
+        """Get the (mtime_ns, size) of every step file."""
+        snapshot: dict[Path, tuple[int, int]] = {}
+        for py_file in self.scanner.list_step_files(self.steps_dir):
+            try:
+                stat = py_file.stat()
+            except OSError:
+                continue
+            snapshot[py_file] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Re-parse changed step files and rebuild the generator if needed.
+
+        Args:
+            force: Rebuild even if no file changed
+
+        Returns:
+            True if the catalog was rebuilt
+        """
+        self.stale.clear()
+        snapshot = self.snapshot()
+        changed = [
+            py_file
+            for py_file, stat in snapshot.items()
+            if py_file not in self.files or self.files[py_file][0] != stat
+        ]
+        deleted = [py_file for py_file in self.files if py_file not in snapshot]
+        if not (changed or deleted or force):
+            return False
+
+        for py_file in deleted:
+            del self.files[py_file]
+        parsed: dict[Path, list[ExistingStepDef]] = {py_file: [] for py_file in changed}
+        for existing in self.scanner.parse_files(changed, self.jobs):
+            parsed[existing.file_path].append(existing)
+        for py_file, steps in parsed.items():
+            self.files[py_file] = (snapshot[py_file], steps)
+
+        # Same order as a local run: libraries first, then the scanned steps
+        libraries = self.step_libraries
+        catalog = StepCatalog(
+            [existing for library in libraries[1:] for existing in library]
+            + [
+                existing
+                for py_file in sorted(self.files)
+                for existing in self.files[py_file][1]
+            ],
+            prebuilt=libraries[0] if libraries else None,
+        )
+        self.generator = StubGenerator(
+            existing_steps=catalog,
+            similarity_engine=self.similarity_engine,
+            jobs=self.jobs,
+            cache=self.cache,
+        )
+        print(
+            f"✓ Indexed {len(catalog)} existing step definitions "
+            f"({len(changed)} files parsed, {len(deleted)} removed)",
+            file=sys.stderr,
+        )
+        return True
+
+    def parse_feature(self, feature_file: Path) -> list[Step]:
+        """
+        Parse a feature file, reusing the last parse if it is unchanged.
+
+        Parses of deleted files are dropped when they are next requested;
+        beyond MAX_FEATURES, the least recently requested are dropped.
+
+        Args:
+            feature_file: Path to .feature file
+
+        Returns:
+            List of unique steps
+        """
+        cached = self.features.pop(feature_file, None)
+        stat = feature_file.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        if cached is None or cached[0] != key:
+            cached = (key, self.gherkin_parser.parse_file(feature_file))
+        self.features[feature_file] = cached
+        while len(self.features) > self.MAX_FEATURES:
+            del self.features[next(iter(self.features))]
+        return cached[1]
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Serve one generation request.
+
+        Args:
+            request: {"features": [paths], "include_implemented": bool,
+                "list_undefined": bool}
+
+        Returns:
+            {"exit": int, "code": str | None, "feature_name": str | None,
+            "log": str}, where log is what a local run prints to stderr
+        """
+        import contextlib
+        import io
+
+        if self.stale.is_set():
+            self.refresh()
+
+        log = io.StringIO()
+        with contextlib.redirect_stderr(log):
+            try:
+                self.generator.skip_implemented = not request.get("include_implemented")
+                exit_code, code, feature_name = generate_from_features(
+                    [Path(path) for path in request["features"]],
+                    self.generator,
+                    list_undefined=bool(request.get("list_undefined")),
+                    parse_file=self.parse_feature,
+                    steps_dir=self.steps_dir,
+                )
+            except Exception as e:
+                print(f"✗ Error: {e}", file=sys.stderr)
+                exit_code, code, feature_name = 1, None, None
+
+        return {
+            "exit": exit_code,
+            "code": code,
+            "feature_name": feature_name,
+            "log": log.getvalue(),
+        }
+
+    def watch(self) -> str:
+        """
+        Start watching the steps directory in the background.
+
+        Returns:
+            "watchdog" or "polling", whichever is used
+        """
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            import threading
+
+            threading.Thread(target=self._poll, daemon=True).start()
+            return "polling"
+
+        stale = self.stale
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event: Any) -> None:
+                stale.set()
+
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(Handler(), str(self.steps_dir), recursive=True)
+        observer.start()
+        return "watchdog"
+
+    def _poll(self) -> None:
+        """Mark the catalog stale whenever the step files' stats change."""
+        last = self.snapshot()
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+            current = self.snapshot()
+            if current != last:
+                self.stale.set()
+                last = current
+
+    def serve(self, socket_path: Path) -> None:
+        """
+        Serve requests on a Unix socket until interrupted.
+
+        Args:
+            socket_path: Socket file to listen on
+
+        Raises:
+            OSError: If the socket cannot be created or another daemon
+                already listens on it
+        """
+        import json
+        import socket
+        import socketserver
+
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("Unix sockets are not supported on this platform")
+
+        if socket_path.exists():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(str(socket_path))
+                except OSError:
+                    socket_path.unlink()  # left over from a dead daemon
+                else:
+                    raise OSError(f"A daemon is already listening on {socket_path}")
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                try:
+                    request = json.loads(self.rfile.readline())
+                except ValueError:
+                    return
+                response = daemon.handle(request)
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        with socketserver.UnixStreamServer(str(socket_path), Handler) as server:
+            try:
+                server.serve_forever()
+            finally:
+                socket_path.unlink(missing_ok=True)
+
 
-        # Group steps by type
-        given_steps_list: list[Step] = []
-        when_steps_list: list[Step] = []
-        then_steps_list: list[Step] = []
+def request_stub_daemon(
+    socket_path: Path, request: dict[str, Any]
+) -> tuple[int, str | None, str | None] | None:
+    """
+    Send a generation request to a running StubDaemon.
 
-        for step in steps:
-            if step.step_type == "given":
-                given_steps_list.append(step)
-            elif step.step_type == "when":
-                when_steps_list.append(step)
-            elif step.step_type == "then":
-                then_steps_list.append(step)
+    The daemon's log is printed to stderr as if the run were local.
 
-        # Generate stubs for each group
-        given_stubs = self._generate_stubs(given_steps_list)
-        when_stubs = self._generate_stubs(when_steps_list)
-        then_stubs = self._generate_stubs(then_steps_list)
+    Args:
+        socket_path: Socket the daemon listens on
+        request: Request (see StubDaemon.handle)
 
-        # Fill template
-        code = self.TEMPLATE.format(
-            feature_name=feature_name,
-            given_steps=given_stubs or "# No Given steps found",
-            when_steps=when_stubs or "# No When steps found",
-            then_steps=then_stubs or "# No Then steps found",
+    Returns:
+        (exit code, generated code or None, name of the first feature or
+        None), or None if no daemon answered
+    """
+    import json
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(5)
+            client.connect(str(socket_path))
+            client.settimeout(None)
+            client.sendall(json.dumps(request).encode() + b"\n")
+            with client.makefile("rb") as stream:
+                response = json.loads(stream.readline())
+    except (OSError, ValueError, AttributeError) as e:
+        print(
+            f"Warning: no stub daemon at {socket_path} ({e}), running locally",
+            file=sys.stderr,
         )
+        return None
 
-        return code
+    sys.stderr.write(response["log"])
+    return response["exit"], response["code"], response["feature_name"]
 
-    def _generate_stubs(self, steps: list[Step]) -> str:
-        """
-        Generate stubs for a list of steps.
 
-        Args:
-            steps: List of steps of the same type
+def open_similarity_cache(args: argparse.Namespace) -> SimilarityCache | None:
+    """Open the persistent similarity cache unless disabled."""
+    if args.no_cache:
+        return None
 
-        Returns:
-            Python code with step definitions
-        """
-        if not steps:
-            return ""
+    import sqlite3
 
-        stubs: list[str] = []
+    try:
+        return SimilarityCache(args.cache_dir)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: similarity cache disabled ({e})", file=sys.stderr)
+        return None
 
-        for step in steps:
-            # Generate unique function name
-            function_name = self._generate_unique_function_name(step)
 
-            # Generate parameter list with types
-            params_str = ""
-            if step.params:
-                params_str = ", " + ", ".join(
-                    f"{param}: {step.param_types.get(param, 'str')}"
-                    for param in step.params
-                )
+def open_feature_cache(args: argparse.Namespace) -> FeatureCache | None:
+    """Open the persistent parsed-feature cache unless disabled."""
+    if args.no_cache:
+        return None
 
-            # Build extra documentation
-            extra_docs_parts: list[str] = []
-            if step.has_table:
-                extra_docs_parts.append(
-                    "    This step expects a data table in context.table"
-                )
-            if step.has_docstring:
-                content_type = (
-                    f" ({step.docstring_content_type})"
-                    if step.docstring_content_type
-                    else ""
-                )
-                extra_docs_parts.append(
-                    f"    This step expects a doc string{content_type} in context.text"
-                )
+    try:
+        return FeatureCache(args.cache_dir)
+    except OSError as e:
+        print(f"Warning: feature cache disabled ({e})", file=sys.stderr)
+        return None
 
-            extra_docs = (
-                "\n" + "\n".join(extra_docs_parts) if extra_docs_parts else ""
-            )
 
-            # Check for similar existing steps
-            similar_steps = self.step_scanner.find_similar_steps(
-                step, self.existing_steps, threshold=0.6
+def load_step_libraries(args: argparse.Namespace) -> list[CompiledStepIndex] | None:
+    """
+    Map the --step-library indexes.
+
+    Args:
+        args: Parsed command-line arguments
+
+    Returns:
+        Compiled step libraries in command-line order, or None if one cannot
+        be loaded
+    """
+    libraries: list[CompiledStepIndex] = []
+    for library_path in args.step_library:
+        try:
+            libraries.append(CompiledStepIndex(library_path))
+        except (OSError, ValueError) as e:
+            print(f"✗ Error: {e}", file=sys.stderr)
+            for library in libraries:
+                library.close()
+            return None
+        print(
+            f"✓ Loaded {len(libraries[-1])} step definitions from {library_path}",
+            file=sys.stderr,
+        )
+    return libraries
+
+
+def build_catalog(args: argparse.Namespace, jobs: int) -> StepCatalog | None:
+    """
+    Load --step-library indexes and scan --check-existing into one catalog.
+
+    Args:
+        args: Parsed command-line arguments
+        jobs: Number of worker processes
+
+    Returns:
+        Catalog of existing steps, or None if a step library cannot be loaded;
+        close() it to release the first step library
+    """
+    # The first compiled step library seeds the trigram index
+    libraries = load_step_libraries(args)
+    if libraries is None:
+        return None
+    prebuilt = libraries[0] if libraries else None
+    library_steps: list[ExistingStepDef] = []
+    for library in libraries[1:]:
+        with library:
+            library_steps.extend(library)
+
+    # Full-text lookups need the SQLite-backed catalog
+    if args.similarity_engine == "fts" or args.search_steps:
+        database = (
+            None if args.no_cache else args.cache_dir / SqliteStepCatalog.FILENAME
+        )
+        catalog: StepCatalog = SqliteStepCatalog(
+            library_steps, prebuilt=prebuilt, path=database
+        )
+    else:
+        catalog = StepCatalog(library_steps, prebuilt=prebuilt)
+
+    # Scan for existing steps if requested
+    if args.check_existing:
+        scanner = ExistingStepScanner(ignore=args.ignore)
+        step_index: StepIndex | None = None
+        if not args.no_cache:
+            import sqlite3
+
+            try:
+                step_index = StepIndex(args.cache_dir)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: step index disabled ({e})", file=sys.stderr)
+        try:
+            for existing in scanner.iter_step_definitions(
+                args.check_existing, jobs=jobs, index=step_index
+            ):
+                catalog.add(existing)
+        finally:
+            if step_index is not None:
+                step_index.close()
+        found = len(catalog) - len(library_steps) - len(prebuilt or ())
+        if found:
+            print(
+                f"✓ Found {found} existing step definitions in {args.check_existing}",
+                file=sys.stderr,
+            )
+        if scanner.skipped_files:
+            print(
+                f"✓ Skipped {scanner.skipped_files} files without step decorators",
+                file=sys.stderr,
             )
+    return catalog
+
+
+def run_locally(
+    args: argparse.Namespace, jobs: int
+) -> tuple[int, str | None, str | None]:
+    """
+    Scan existing steps and generate stubs in this process.
+
+    Args:
+        args: Parsed command-line arguments
+        jobs: Number of worker processes
+
+    Returns:
+        (exit code, generated code or None, name of the first feature or None)
+    """
+    catalog = build_catalog(args, jobs)
+    if catalog is None:
+        return 1, None, None
+
+    # Similarity results are only worth caching against a catalog
+    cache = open_similarity_cache(args) if catalog else None
+    feature_cache = open_feature_cache(args)
+    gherkin_parser = GherkinParser(args.gherkin_parser, cache=feature_cache)
+    try:
+        generator = StubGenerator(
+            existing_steps=catalog,
+            similarity_engine=args.similarity_engine,
+            jobs=jobs,
+            skip_implemented=not args.include_implemented,
+            cache=cache,
+        )
+        return generate_from_features(
+            args.feature_files,
+            generator,
+            list_undefined=args.list_undefined,
+            steps_dir=args.check_existing,
+            parser=gherkin_parser,
+            jobs=jobs,
+        )
+    finally:
+        catalog.close()
+        if cache is not None:
+            cache.close()
+        if feature_cache is not None:
+            feature_cache.close()
 
-            if similar_steps:
-                # Use template with similarity warning
-                similarity, similar_step = similar_steps[0]
-                stub = self.STEP_WITH_SIMILAR_TEMPLATE.format(
-                    decorator=step.step_type,
-                    pattern=step.pattern,
-                    function_name=function_name,
-                    params=params_str,
-                    original_text=step.text,
-                    similar_file=similar_step.file_path.name,
-                    similar_line=similar_step.line_number,
-                    similar_pattern=similar_step.pattern,
-                    extra_docs=extra_docs,
-                )
-            else:
-                # Use regular template
-                stub = self.STEP_TEMPLATE.format(
-                    decorator=step.step_type,
-                    pattern=step.pattern,
-                    function_name=function_name,
-                    params=params_str,
-                    original_text=step.text,
-                    extra_docs=extra_docs,
-                )
 
-            stubs.append(stub.rstrip())
+def search_step_definitions(args: argparse.Namespace, jobs: int) -> int:
+    """
+    Print the existing step definitions mentioning --search-steps TEXT.
 
-        return "\n".join(stubs)
+    Args:
+        args: Parsed command-line arguments
+        jobs: Number of worker processes
 
-    def _generate_unique_function_name(self, step: Step) -> str:
-        """
-        Generate a unique valid Python function name from step pattern.
+    Returns:
+        Exit code: 0 if any definition matches, 1 otherwise
+    """
+    import sqlite3
 
-        Args:
-            step: Step object
+    catalog = build_catalog(args, jobs)
+    if not isinstance(catalog, SqliteStepCatalog):
+        return 1
 
-        Returns:
-            Unique valid Python function name
-        """
-        base_name = self._generate_function_name_base(step)
+    try:
+        matches = catalog.search(args.search_steps)
+    except (OSError, sqlite3.Error) as e:
+        print(f"✗ Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        catalog.close()
 
-        # Ensure uniqueness
-        if base_name not in self.used_function_names:
-            self.used_function_names.add(base_name)
-            return base_name
+    for existing in matches:
+        print(
+            f"{existing.file_path}:{existing.line_number}: "
+            f"@{existing.step_type}('{existing.pattern}')"
+        )
+    print(
+        f"\n✓ {len(matches)} step definitions mention '{args.search_steps}'",
+        file=sys.stderr,
+    )
+    return 0 if matches else 1
 
-        # Add numeric suffix for conflicts
-        counter = 2
-        while f"{base_name}_{counter}" in self.used_function_names:
-            counter += 1
 
-        unique_name = f"{base_name}_{counter}"
-        self.used_function_names.add(unique_name)
-        return unique_name
+def compile_step_library(args: argparse.Namespace, jobs: int) -> int:
+    """
+    Scan STEPS_DIR and write it as a CompiledStepIndex (--compile-index).
 
-    def _generate_function_name_base(self, step: Step) -> str:
-        """
-        Generate base function name from step pattern.
+    Args:
+        args: Parsed command-line arguments
+        jobs: Number of worker processes
 
-        Args:
-            step: Step object
+    Returns:
+        Exit code
+    """
+    scanner = ExistingStepScanner(ignore=args.ignore)
+    try:
+        count = CompiledStepIndex.write(
+            scanner.iter_step_definitions(args.check_existing, jobs=jobs),
+            args.compile_index,
+        )
+    except OSError as e:
+        print(f"✗ Error: {e}", file=sys.stderr)
+        return 1
+    print(
+        f"✓ Compiled {count} step definitions from {args.check_existing} "
+        f"into {args.compile_index}",
+        file=sys.stderr,
+    )
+    return 0
 
-        Returns:
-            Valid Python function name base
-        """
-        # Remove parameter placeholders
-        text = re.sub(r"\{[^}]+\}", "", step.pattern)
 
-        # Remove quotes
-        text = text.replace('"', "").replace("'", "")
+def run_daemon(args: argparse.Namespace, jobs: int) -> int:
+    """
+    Run the --watch daemon until interrupted.
 
-        # Convert to snake_case
-        text = re.sub(r"[^a-z0-9]+", "_", text.lower())
-        text = re.sub(r"_+", "_", text).strip("_")
+    Args:
+        args: Parsed command-line arguments
+        jobs: Number of worker processes
 
-        # Ensure it starts with a letter or underscore
-        if text and text[0].isdigit():
-            text = "step_" + text
+    Returns:
+        Exit code
+    """
+    socket_path = args.socket or args.cache_dir / "stubs.sock"
+    libraries = load_step_libraries(args)
+    if libraries is None:
+        return 1
 
-        # Limit length to prevent overly long names
-        if len(text) > 50:
-            text = text[:50].rstrip("_")
+    # The daemon reads the libraries on every refresh, so they stay mapped until exit
+    try:
+        daemon = StubDaemon(
+            args.check_existing,
+            scanner=ExistingStepScanner(ignore=args.ignore),
+            similarity_engine=args.similarity_engine,
+            jobs=jobs,
+            cache=open_similarity_cache(args),
+            gherkin_parser=GherkinParser(args.gherkin_parser),
+            step_libraries=libraries,
+        )
+        for feature_file in expand_feature_paths(args.feature_files):
+            daemon.parse_feature(feature_file)
 
-        return text or "unnamed_step"
+        import signal
+
+        # Exit through serve()'s cleanup, which removes the socket file
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        watcher = daemon.watch()
+        print(
+            f"✓ Watching {args.check_existing} ({watcher}), serving on {socket_path}",
+            file=sys.stderr,
+        )
+        try:
+            daemon.serve(socket_path)
+        except OSError as e:
+            print(f"✗ Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+    finally:
+        for library in libraries:
+            library.close()
 
 
 def main() -> int:
@@ -925,14 +5249,31 @@ Examples:
 
   # Print to stdout
   python generate_stubs.py features/login.feature --stdout
+
+  # Report undefined steps across a whole features directory
+  python generate_stubs.py features/ --check-existing features/steps/ --list-undefined
+
+  # Compile a shared step library once, then generate against it
+  python generate_stubs.py --check-existing shared/steps/ --compile-index shared.stepidx
+  python generate_stubs.py features/login.feature --step-library shared.stepidx
+
+  # Find duplicate or ambiguous step definitions before running behave
+  python generate_stubs.py --check-existing features/steps/ --list-ambiguous
+
+  # Which existing steps mention "cart"?
+  python generate_stubs.py --check-existing features/steps/ --search-steps cart
+
+  # Keep the step catalog hot in a daemon, then generate through it
+  python generate_stubs.py --watch --check-existing features/steps/ &
+  python generate_stubs.py features/login.feature --socket .bdd-cache/stubs.sock
         """,
     )
 
     parser.add_argument(
         "feature_files",
-        nargs="+",
+        nargs="*",
         type=Path,
-        help="Path to one or more .feature files",
+        help="Path to one or more .feature files or directories containing them",
     )
 
     parser.add_argument(
@@ -962,60 +5303,181 @@ Examples:
         help="Directory containing existing step definitions (enables reuse detection)",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--ignore",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Gitignore-style pattern of paths to skip when scanning STEPS_DIR "
+        "(repeatable; virtualenvs, caches and .gitignore'd paths are always skipped)",
+    )
 
-    try:
-        # Scan for existing steps if requested
-        existing_steps: list[ExistingStepDef] = []
-        if args.check_existing:
-            scanner = ExistingStepScanner()
-            existing_steps = scanner.scan_directory(args.check_existing)
-            if existing_steps:
-                print(
-                    f"✓ Found {len(existing_steps)} existing step definitions in {args.check_existing}",
-                    file=sys.stderr,
-                )
+    parser.add_argument(
+        "--similarity-engine",
+        choices=sorted(SIMILARITY_ENGINES),
+        default="exact",
+        help="Backend used to find similar existing steps (default: exact; "
+        "trigram only scores steps sharing enough trigrams, faster but "
+        "approximate; numpy scores all steps in one batch, also approximate; "
+        "lsh is approximate but sub-linear for very large step catalogs, token "
+        "compares words and treats all placeholders as equal, fts queries a "
+        "SQLite FTS5 trigram index kept in --cache-dir and only scores its "
+        "best-ranked candidates, so it is approximate too)",
+    )
+
+    parser.add_argument(
+        "--gherkin-parser",
+        choices=GherkinParser.BACKENDS,
+        default="native",
+        help="Feature file parser (default: native, a streaming tokenizer "
+        "that reads the same Gherkin as behave about twice as fast; behave "
+        "uses behave's own parser)",
+    )
 
-        # Parse all feature files
-        gherkin_parser = GherkinParser()
-        all_steps: list[Step] = []
-        feature_names: list[str] = []
+    parser.add_argument(
+        "--list-undefined",
+        action="store_true",
+        help="Only report steps no existing definition matches "
+        "(requires --check-existing, --step-library or --socket)",
+    )
 
-        for feature_file in args.feature_files:
-            try:
-                steps = gherkin_parser.parse_file(feature_file)
-                all_steps.extend(steps)
-                feature_names.append(feature_file.stem)
-                print(
-                    f"✓ Parsed {len(steps)} unique steps from {feature_file}",
-                    file=sys.stderr,
-                )
-            except Exception as e:
-                print(f"✗ Error parsing {feature_file}: {e}", file=sys.stderr)
-                return 1
+    parser.add_argument(
+        "--list-ambiguous",
+        action="store_true",
+        help="Only report existing step definitions that duplicate or are "
+        "ambiguous with each other, before behave would raise AmbiguousStep "
+        "(requires --check-existing or --step-library)",
+    )
 
-        if not all_steps:
-            print("No steps found in feature files", file=sys.stderr)
-            return 1
+    parser.add_argument(
+        "--search-steps",
+        metavar="TEXT",
+        help="Only list existing step definitions whose pattern contains TEXT, "
+        "through the SQLite full-text index "
+        "(requires --check-existing or --step-library)",
+    )
 
-        # Deduplicate across all files
-        seen: set[tuple[str, str]] = set()
-        unique_steps: list[Step] = []
-        for step in all_steps:
-            key = (step.step_type, step.pattern)
-            if key not in seen:
-                seen.add(key)
-                unique_steps.append(step)
+    parser.add_argument(
+        "--include-implemented",
+        action="store_true",
+        help="Also generate stubs for steps an existing definition already implements",
+    )
 
-        print(
-            f"\n✓ Total {len(unique_steps)} unique steps across all files",
-            file=sys.stderr,
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Worker processes for feature parsing, step scanning and "
+        "similarity scoring (default: 1, 0 = all CPUs)",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=Path(".bdd-cache"),
+        metavar="DIR",
+        help="Directory for the persistent step index, similarity cache and "
+        "parsed feature cache (default: .bdd-cache)",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the persistent caches",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run as a daemon that keeps STEPS_DIR indexed and serves requests "
+        "on --socket (requires --check-existing)",
+    )
+
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        metavar="PATH",
+        help="Unix socket of the --watch daemon (default for --watch: "
+        "CACHE_DIR/stubs.sock); without --watch, send the request to that "
+        "daemon and fall back to a local run if none answers",
+    )
+
+    parser.add_argument(
+        "--compile-index",
+        type=Path,
+        metavar="OUTPUT",
+        help="Compile STEPS_DIR into a binary step index at OUTPUT and exit "
+        "(requires --check-existing)",
+    )
+
+    parser.add_argument(
+        "--step-library",
+        type=Path,
+        action="append",
+        default=[],
+        metavar="INDEX",
+        help="Load a step index written by --compile-index alongside STEPS_DIR "
+        "(repeatable; memory-mapped, no scanning)",
+    )
+
+    args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 (all CPUs) or a positive number of workers")
+    jobs = args.jobs or os.cpu_count() or 1
+
+    has_steps = args.check_existing or args.step_library or args.socket
+    if args.list_undefined and not has_steps:
+        parser.error(
+            "--list-undefined requires --check-existing, --step-library or --socket"
         )
+    if args.watch and not args.check_existing:
+        parser.error("--watch requires --check-existing")
+    if args.compile_index and not args.check_existing:
+        parser.error("--compile-index requires --check-existing")
+    if args.list_ambiguous and not (args.check_existing or args.step_library):
+        parser.error("--list-ambiguous requires --check-existing or --step-library")
+    if args.search_steps and not (args.check_existing or args.step_library):
+        parser.error("--search-steps requires --check-existing or --step-library")
+    standalone = (
+        args.watch or args.compile_index or args.list_ambiguous or args.search_steps
+    )
+    if not standalone and not args.feature_files:
+        parser.error("the following arguments are required: feature_files")
 
-        # Generate stubs
-        generator = StubGenerator(existing_steps=existing_steps)
-        feature_name = "_".join(feature_names) if feature_names else "feature"
-        code = generator.generate(unique_steps, feature_name)
+    try:
+        if args.compile_index:
+            return compile_step_library(args, jobs)
+        if args.list_ambiguous:
+            catalog = build_catalog(args, jobs)
+            if catalog is None:
+                return 1
+            try:
+                return report_step_conflicts(catalog)
+            finally:
+                catalog.close()
+        if args.search_steps:
+            return search_step_definitions(args, jobs)
+        if args.watch:
+            return run_daemon(args, jobs)
+
+        result = None
+        if args.socket:
+            result = request_stub_daemon(
+                args.socket,
+                {
+                    "features": [str(path.resolve()) for path in args.feature_files],
+                    "include_implemented": args.include_implemented,
+                    "list_undefined": args.list_undefined,
+                },
+            )
+        if result is None:
+            result = run_locally(args, jobs)
+
+        exit_code, code, first_feature = result
+        if code is None:
+            return exit_code
 
         # Output
         if args.stdout:
@@ -1026,7 +5488,7 @@ Examples:
                 output_path = args.output
             else:
                 # Default: first_feature_name_steps.py
-                output_path = Path(f"{feature_names[0]}_steps.py")
+                output_path = Path(f"{first_feature}_steps.py")
 
             # Check if file exists
             if output_path.exists() and not args.force:
@@ -1058,11 +5520,10 @@ Examples:
                 f"  3. Implement the step logic (replace NotImplementedError)",
                 file=sys.stderr,
             )
-            print(
-                f"  4. Run: behave to test your implementation", file=sys.stderr
-            )
+            print(f"  4. Run: behave to test your implementation", file=sys.stderr)
 
-        return 0
+        # Non-zero when some feature files could not be parsed
+        return exit_code
 
     except KeyboardInterrupt:
         print("\n✗ Interrupted", file=sys.stderr)
@@ -1,18 +1,38 @@
 #!/usr/bin/env python3
 """Unit tests for generate_stubs.py."""
 
+import os
 import tempfile
 from pathlib import Path
 
 import pytest
 
 from generate_stubs import (
+    BehaveStepMatcher,
+    CompiledStepIndex,
+    ExactSimilarityEngine,
     ExistingStepDef,
     ExistingStepScanner,
+    FeatureCache,
+    FtsSimilarityEngine,
     GherkinParser,
+    MinHashLSHEngine,
+    NumpySimilarityEngine,
+    SimilarityCache,
+    SqliteStepCatalog,
     Step,
+    StepCatalog,
+    StepIndex,
+    StubDaemon,
     StubGenerator,
+    TokenEditDistanceEngine,
+    TrigramIndex,
+    TrigramSimilarityEngine,
     TypeInferencer,
+    find_step_conflicts,
+    generate_from_features,
+    load_step_libraries,
+    request_stub_daemon,
 )
 
 
@@ -22,7 +42,9 @@ class TestTypeInferencer:
     def test_infer_type_from_pattern_int(self):
         """Test type inference from pattern - integer."""
         inferencer = TypeInferencer()
-        assert inferencer.infer_type("count", "a database with {count:d} records") == "int"
+        assert (
+            inferencer.infer_type("count", "a database with {count:d} records") == "int"
+        )
 
     def test_infer_type_from_pattern_decimal(self):
         """Test type inference from pattern - Decimal for monetary values."""
@@ -104,9 +126,9 @@ class TestGherkinParser:
         )
 
         assert len(params) == 3
-        assert 'alice' in pattern
-        assert '{number1:d}' in pattern
-        assert 'alice_test_com' in pattern
+        assert "alice" in pattern
+        assert "{number1:d}" in pattern
+        assert "alice_test_com" in pattern
 
     def test_extract_parameters_scenario_outline(self):
         """Test parameter extraction - scenario outline parameters."""
@@ -116,6 +138,22 @@ class TestGherkinParser:
         assert pattern == "a value of {amount}"
         assert params == ["amount"]
 
+    def test_extract_parameters_overlapping_and_numbering(self):
+        """Test that overlapping parameters keep the first match; numbers count back."""
+        parser = GherkinParser()
+
+        pattern, params = parser._extract_parameters('"a <b" <c> d>')
+        assert pattern == '"{a_b}" <c> d>'
+        assert params == ["a_b"]
+
+        pattern, params = parser._extract_parameters("move 3 to 4.5")
+        assert pattern == "move {number2:d} to {number1:f}"
+        assert params == ["number2", "number1"]
+        assert parser._extract_parameters("no parameters here") == (
+            "no parameters here",
+            [],
+        )
+
     def test_deduplicate_steps(self):
         """Test step deduplication."""
         parser = GherkinParser()
@@ -207,6 +245,125 @@ Feature: Test And/But Inheritance
         assert steps[7].step_type == "then"  # But inherits from Then
         assert steps[7].text == "the notifications panel should be empty"
 
+    def test_native_backend_matches_behave(self, tmp_path):
+        """Test the native parser yields the same steps as behave's parser."""
+        pytest.importorskip("behave")
+        feature_file = tmp_path / "test.feature"
+        feature_file.write_text("""
+@checkout
+Feature: Checkout
+
+  Background:
+    Given a cart with 2 items
+
+  Rule: Discounts apply once
+
+    Scenario: Coupon
+      When the user applies coupon "SAVE10":
+        | code   | percent |
+        | SAVE10 | 10      |
+      Then the total should be 9.99
+      But the receipt reads:
+        \"\"\"json
+        {"total": 9.99}
+        \"\"\"
+      And the invoice lists:
+        | item |
+        | tea  |
+        \"\"\"
+     indented less than the opening quotes
+        \"\"\"
+
+  Scenario Outline: Shipping
+    * the user ships to <country>
+    Then shipping costs <cost>
+
+    Examples:
+      | country | cost |
+      | FR      | 5    |
+""")
+
+        native = GherkinParser("native").parse_file(feature_file)
+        behave = GherkinParser("behave").parse_file(feature_file)
+
+        assert native == behave
+        assert [step.step_type for step in native] == [
+            "given",
+            "when",
+            "then",
+            "then",
+            "then",
+            "given",
+            "then",
+        ]
+        assert native[1].has_table
+        assert native[3].has_docstring
+
+    def test_native_backend_rejects_invalid_gherkin(self, tmp_path):
+        """Test the native parser rejects what behave rejects."""
+        feature_file = tmp_path / "test.feature"
+        feature_file.write_text("""
+Feature: Broken
+
+  Scenario: Leading conjunction
+    And a step without a preceding step
+""")
+
+        with pytest.raises(ValueError, match="^line 5: "):
+            GherkinParser("native").parse_file(feature_file)
+        with pytest.raises(ValueError, match="Unknown Gherkin parser backend"):
+            GherkinParser("antlr")
+
+    def test_parallel_parsing_matches_serial_and_collects_errors(
+        self, tmp_path, capsys
+    ):
+        """Test that --jobs parsing keeps input order and reports every bad file."""
+        feature_files = []
+        for i in range(6):
+            feature_file = tmp_path / f"f{i}.feature"
+            feature_file.write_text(
+                f"Feature: F{i}\n  Scenario: S\n    Given step {i % 3}\n"
+            )
+            feature_files.append(feature_file)
+        feature_files[2].write_text(
+            "Feature: Broken\n  Scenario: S\n    And no step before\n"
+        )
+        feature_files.append(tmp_path / "missing.feature")
+
+        cache = FeatureCache(tmp_path / "cache")
+        parser = GherkinParser(cache=cache)
+        parser.MIN_PARALLEL_FILES = 1
+
+        serial = GherkinParser().parse_files(feature_files)
+        parallel = parser.parse_files(feature_files, jobs=2)
+
+        assert parallel == serial
+        assert [steps is None for steps, _ in serial] == [
+            False,
+            False,
+            True,
+            False,
+            False,
+            False,
+            True,
+        ]
+        assert "AND-STEP REQUIRES" in serial[2][1]
+        assert len(cache.pending) == 5
+
+        exit_code, code, feature_name = generate_from_features(
+            feature_files, StubGenerator(), parser=parser, jobs=2
+        )
+
+        # The valid files still get stubs, and the failures the exit code
+        assert (exit_code, feature_name) == (1, "f0")
+        assert code == StubGenerator().generate(
+            GherkinParser().parse_file(feature_files[0]), "f0_f1_f3_f4_f5"
+        )
+        assert len(cache.pending) == 5
+        stderr = capsys.readouterr().err
+        assert stderr.count("✗ Error parsing") == 2
+        assert "✗ 2 of 7 feature files could not be parsed" in stderr
+
 
 class TestExistingStepScanner:
     """Tests for ExistingStepScanner."""
@@ -217,7 +374,7 @@ class TestExistingStepScanner:
 
         # Create a test step file
         step_file = tmp_path / "test_steps.py"
-        step_file.write_text('''
+        step_file.write_text("""
 from behave import given, when, then
 
 @given('a user named "{name}"')
@@ -231,7 +388,7 @@ def step_user_login(context):
 @then('the user should see "{message}"')
 def step_user_see(context, message):
     pass
-''')
+""")
 
         steps = scanner._parse_file(step_file)
 
@@ -248,21 +405,21 @@ def step_user_see(context, message):
         scanner = ExistingStepScanner()
 
         # Create test step files
-        (tmp_path / "auth_steps.py").write_text('''
+        (tmp_path / "auth_steps.py").write_text("""
 from behave import given
 
 @given('a user exists')
 def step_user_exists(context):
     pass
-''')
+""")
 
-        (tmp_path / "api_steps.py").write_text('''
+        (tmp_path / "api_steps.py").write_text("""
 from behave import when
 
 @when('I call the API')
 def step_call_api(context):
     pass
-''')
+""")
 
         steps = scanner.scan_directory(tmp_path)
 
@@ -270,6 +427,283 @@ def step_call_api(context):
         assert any(s.pattern == "a user exists" for s in steps)
         assert any(s.pattern == "I call the API" for s in steps)
 
+    def test_lexer_backend_matches_ast_backend(self, tmp_path):
+        """Test that the lexer produces the AST records, line numbers included."""
+        source = (
+            '"""Steps.\n\n@given(\'in a docstring\')\n"""\n'
+            "from behave import given, when\n\n"
+            "# @when('in a comment')\n"
+            "@given('a user named \"{name}\"')\n"
+            "@when(r'I log in as {name} \\d')\n"
+            "def step_user(context, name):\n"
+            "    total = (context.a\n    @ context.b)\n\n"
+            "@staticmethod\n@given(\n    'split over lines'\n)\n\n"
+            "def step_split(context):\n    pass\n\n"
+            "@given('async')\nasync def step_async(context):\n    pass\n"
+        )
+        step_file = tmp_path / "mixed_steps.py"
+        step_file.write_text(source)
+
+        lexed = ExistingStepScanner("lexer")._extract_steps(source, step_file)
+
+        assert lexed is not None
+        assert lexed == ExistingStepScanner("ast")._parse_file(step_file)
+        assert [(s.pattern, s.line_number) for s in lexed] == [
+            ('a user named "{name}"', 10),
+            ("I log in as {name} \\d", 10),
+            ("split over lines", 19),
+        ]
+
+    def test_lexer_and_ast_backends_agree(self):
+        """Test both backends on a generated step module and unusual decorators."""
+        steps = [
+            Step(
+                "given",
+                'a user named "bob"',
+                'a user named "{name}"',
+                ["name"],
+                {"name": "str"},
+            ),
+            Step(
+                "when",
+                "I add 3 items",
+                "I add {number1:d} items",
+                ["number1"],
+                {"number1": "int"},
+            ),
+            Step("then", "the cart total is shown", "the cart total is shown", [], {}),
+        ]
+        sources = [
+            StubGenerator().generate(steps, "cart"),
+            "@(given('a parenthesized decorator'))\ndef step(context):\n    pass\n",
+            "@(given)('a parenthesized name')\ndef step(context):\n    pass\n",
+            "@\\\ngiven('a continued decorator')\ndef step(context):\n    pass\n",
+            "@\fgiven('a form feed')\ndef step(context):\n    pass\n",
+            "@other\n@given('x' 'y')\n@given(('z'))\ndef step(context):\n    pass\n",
+        ]
+        lexer, tree = ExistingStepScanner("lexer"), ExistingStepScanner("ast")
+
+        for source in sources:
+            assert lexer._parse_source(source, Path("s.py")) == tree._parse_source(
+                source, Path("s.py")
+            )
+        assert len(lexer._parse_source(sources[0], Path("s.py"))) == 3
+
+    def test_lexer_backend_falls_back_to_ast(self, tmp_path):
+        """Test that unsupported constructs are parsed with the AST."""
+        source = (
+            "class Steps:\n"
+            "    @given('a method step')\n"
+            "    def step(self, context):\n        pass\n"
+        )
+        step_file = tmp_path / "class_steps.py"
+        step_file.write_text(source)
+        scanner = ExistingStepScanner("lexer")
+
+        assert scanner._extract_steps(source, step_file) is None
+        assert [s.pattern for s in scanner._parse_file(step_file)] == ["a method step"]
+
+        with pytest.raises(ValueError, match="Unknown scanner backend"):
+            ExistingStepScanner("bogus")
+
+    def test_walker_prunes_ignored_directories(self, tmp_path):
+        """Test default, .gitignore and user ignore rules."""
+        for rel in (
+            "steps/auth_steps.py",
+            "steps/generated/gen_steps.py",
+            "steps/generated/keep_steps.py",
+            "steps/scratch_steps.py",
+            "steps/vendor/lib_steps.py",
+            ".venv/lib/site_steps.py",
+            "node_modules/pkg/x.py",
+            "steps/__pycache__/auth_steps.py",
+        ):
+            (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / rel).write_text("")
+        (tmp_path / ".gitignore").write_text("# project\nscratch_steps.py\n")
+        (tmp_path / "steps" / "generated" / ".gitignore").write_text(
+            "*_steps.py\n!keep_steps.py\n"
+        )
+
+        scanner = ExistingStepScanner(ignore=["vendor/"])
+        found = sorted(
+            p.relative_to(tmp_path).as_posix()
+            for p in scanner.iter_python_files(tmp_path)
+        )
+
+        assert found == ["steps/auth_steps.py", "steps/generated/keep_steps.py"]
+
+        everything = ExistingStepScanner(use_gitignore=False).iter_python_files(
+            tmp_path
+        )
+        assert len(list(everything)) == 5
+
+    def test_walker_follows_symlinks_without_looping(self, tmp_path):
+        """Test that symlinked directories are walked once."""
+        (tmp_path / "steps").mkdir()
+        (tmp_path / "steps" / "auth_steps.py").write_text("")
+        try:
+            (tmp_path / "steps" / "loop").symlink_to(
+                tmp_path / "steps", target_is_directory=True
+            )
+            (tmp_path / "shared").symlink_to(
+                tmp_path / "steps", target_is_directory=True
+            )
+        except OSError:
+            pytest.skip("symlinks not supported")
+
+        found = list(ExistingStepScanner().iter_python_files(tmp_path))
+
+        assert len(found) == 1
+
+    def test_scan_prefilter_skips_files_without_decorators(self, tmp_path):
+        """Test that helper modules are skipped and counted."""
+        (tmp_path / "helpers.py").write_text(
+            "def login(context):\n    return context.user\n"
+        )
+        (tmp_path / "spaced_steps.py").write_text(
+            "from behave import given\n\n"
+            "@ given (\n    'a spaced decorator'\n)\n"
+            "def step_spaced(context):\n    pass\n"
+        )
+        scanner = ExistingStepScanner()
+
+        steps = scanner.scan_directory(tmp_path)
+
+        assert [s.pattern for s in steps] == ["a spaced decorator"]
+        assert scanner.skipped_files == 1
+
+    @pytest.mark.parametrize("backend", ExistingStepScanner.BACKENDS)
+    def test_scan_prefilter_keeps_every_decorator_shape(self, tmp_path, backend):
+        """Test that no decorator form the AST accepts is skipped by the prefilter."""
+        decorators = {
+            "called_steps.py": "@(given)('a parenthesized name')",
+            "wrapped_steps.py": "@(given('a parenthesized call'))",
+            "commented_steps.py": "@(  # comment\n    given\n)('a commented name')",
+            "continued_steps.py": "@\\\ngiven('a continued decorator')",
+        }
+        for name, decorator in decorators.items():
+            (tmp_path / name).write_text(
+                f"from behave import given\n\n{decorator}\n"
+                "def step(context):\n    pass\n"
+            )
+        scanner = ExistingStepScanner(backend)
+
+        steps = scanner.scan_directory(tmp_path)
+
+        assert sorted(s.pattern for s in steps) == [
+            "a commented name",
+            "a continued decorator",
+            "a parenthesized call",
+            "a parenthesized name",
+        ]
+        assert scanner.skipped_files == 0
+
+    def test_iter_step_definitions_streams_per_file(self, tmp_path):
+        """Test that definitions are yielded before later files are read."""
+        for name in ("a", "b"):
+            (tmp_path / f"{name}_steps.py").write_text(
+                "from behave import given\n\n"
+                f"@given('step {name}')\n"
+                f"def step_{name}(context):\n    pass\n"
+            )
+        scanner = ExistingStepScanner()
+
+        definitions = scanner.iter_step_definitions(tmp_path)
+        assert next(definitions).pattern == "step a"
+
+        (tmp_path / "b_steps.py").unlink()
+        assert list(definitions) == []
+        assert [s.pattern for s in scanner.scan_directory(tmp_path)] == ["step a"]
+
+    def test_parallel_scan_matches_serial_scan(self, tmp_path):
+        """Test that parallel scanning returns the serial results, in order."""
+        for i in range(6):
+            (tmp_path / f"module_{i}_steps.py").write_text(
+                "from behave import given\n\n"
+                f"@given('step {i}')\n"
+                f"def step_{i}(context):\n    pass\n"
+            )
+        (tmp_path / "broken_steps.py").write_text("def broken(:\n")
+
+        scanner = ExistingStepScanner()
+        scanner.MIN_PARALLEL_FILES = 1
+
+        serial = scanner.scan_directory(tmp_path)
+        parallel = scanner.scan_directory(tmp_path, jobs=2)
+
+        assert parallel == serial
+        assert [s.pattern for s in serial] == [f"step {i}" for i in range(6)]
+
+    def test_step_index_reparses_only_changed_files(self, tmp_path):
+        """Test that an indexed rescan only parses new or modified files."""
+        steps_dir = tmp_path / "steps"
+        steps_dir.mkdir()
+        for name in ("a", "b", "c"):
+            (steps_dir / f"{name}_steps.py").write_text(
+                "from behave import given\n\n"
+                f"@given('step {name}')\n"
+                f"def step_{name}(context):\n    pass\n"
+            )
+        scanner = ExistingStepScanner()
+        index = StepIndex(tmp_path / "cache")
+
+        assert scanner.scan_directory(steps_dir, index=index) == scanner.scan_directory(
+            steps_dir
+        )
+        assert index.parsed_files == 3
+
+        scanner.scan_directory(steps_dir, index=index)
+        assert index.parsed_files == 0
+
+        (steps_dir / "b_steps.py").write_text(
+            "from behave import when\n\n"
+            "@when('step b changed')\n"
+            "def step_b(context):\n    pass\n"
+        )
+        (steps_dir / "c_steps.py").unlink()
+        steps = scanner.scan_directory(steps_dir, index=index)
+
+        assert index.parsed_files == 1
+        assert [s.pattern for s in steps] == ["step a", "step b changed"]
+        assert steps == scanner.scan_directory(steps_dir)
+
+    def test_step_index_keeps_prefilter_skips(self, tmp_path):
+        """Test that a warm indexed scan reports the skipped files of a cold one."""
+        (tmp_path / "auth_steps.py").write_text(
+            "from behave import given\n\n"
+            "@given('a user exists')\n"
+            "def step_user(context):\n    pass\n"
+        )
+        (tmp_path / "helpers.py").write_text("def helper():\n    pass\n")
+        scanner = ExistingStepScanner()
+        index = StepIndex(tmp_path / "cache")
+
+        scanner.scan_directory(tmp_path, index=index)
+        assert scanner.skipped_files == 1
+
+        scanner.scan_directory(tmp_path, index=index)
+        assert index.parsed_files == 0
+        assert scanner.skipped_files == 1
+
+    def test_step_index_skips_touched_but_unchanged_files(self, tmp_path):
+        """Test that a new mtime with the same content hash is not re-parsed."""
+        step_file = tmp_path / "auth_steps.py"
+        step_file.write_text(
+            "from behave import given\n\n"
+            "@given('a user exists')\n"
+            "def step_user(context):\n    pass\n"
+        )
+        scanner = ExistingStepScanner()
+        index = StepIndex(tmp_path / "cache")
+        scanner.scan_directory(tmp_path, index=index)
+
+        os.utime(step_file, ns=(0, 0))
+        steps = scanner.scan_directory(tmp_path, index=index)
+
+        assert index.parsed_files == 0
+        assert [s.pattern for s in steps] == ["a user exists"]
+
     def test_find_similar_steps(self):
         """Test finding similar steps."""
         scanner = ExistingStepScanner()
@@ -332,10 +766,723 @@ def step_call_api(context):
 
         assert len(similar) == 0
 
+    def test_find_best_matches_equals_sorted_prefix(self):
+        """Test that top-k results match the head of find_similar_steps."""
+        scanner = ExistingStepScanner()
+
+        existing_steps = [
+            ExistingStepDef("given", pattern, f"step_{i}", Path("steps.py"), i)
+            for i, pattern in enumerate(
+                [
+                    'a user named "{username}"',
+                    'a user named "{name}"',
+                    'a user named "{username}"',  # Ties with the first entry
+                    "the shopping cart is empty",
+                    'an admin user named "{username}"',
+                    'a user called "{username}"',
+                ]
+            )
+        ]
+        new_step = Step(
+            "given",
+            'a user named "bob"',
+            'a user named "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        full = scanner.find_similar_steps(new_step, existing_steps, threshold=0.5)
+
+        for k in (1, 2, 3, 10):
+            best = scanner.find_best_matches(
+                new_step, existing_steps, k=k, threshold=0.5
+            )
+            assert best == full[:k]
+
+    def test_find_best_matches_zero_k(self):
+        """Test that k=0 returns no matches."""
+        scanner = ExistingStepScanner()
+        new_step = Step("given", "a user exists", "a user exists", [], {})
+        existing_steps = [
+            ExistingStepDef("given", "a user exists", "step_user", Path("steps.py"), 1),
+        ]
+
+        assert scanner.find_best_matches(new_step, existing_steps, k=0) == []
+
+
+class TestStepCatalog:
+    """Tests for StepCatalog."""
+
+    def test_buckets_by_type_with_normalized_patterns(self):
+        """Test that steps are bucketed by type with lowercased patterns."""
+        catalog = StepCatalog(
+            [
+                ExistingStepDef(
+                    "given", "A User Exists", "step_user", Path("steps.py"), 1
+                ),
+                ExistingStepDef("when", "I Log In", "step_login", Path("steps.py"), 5),
+                ExistingStepDef(
+                    "given", "an admin exists", "step_admin", Path("steps.py"), 9
+                ),
+            ]
+        )
+
+        assert len(catalog) == 3
+        assert [pattern for pattern, _ in catalog.bucket("given")] == [
+            "a user exists",
+            "an admin exists",
+        ]
+        assert [pattern for pattern, _ in catalog.bucket("when")] == ["i log in"]
+        assert catalog.bucket("then") == []
+
+    def test_canonicalize_ignores_placeholder_names(self):
+        """Test that canonical patterns keep formats but drop names."""
+        assert StepCatalog.canonicalize(
+            'a user named "{name}"'
+        ) == StepCatalog.canonicalize('a user named "{username}"')
+        assert StepCatalog.canonicalize("{number1:d} records") == "{:d} records"
+        assert StepCatalog.canonicalize(
+            "{count:d} records"
+        ) != StepCatalog.canonicalize("{count} records")
+
+    def test_find_exact(self):
+        """Test exact lookup by step type and canonical pattern."""
+        catalog = StepCatalog(
+            [
+                ExistingStepDef(
+                    "given",
+                    'a user named "{username}"',
+                    "step_user",
+                    Path("steps.py"),
+                    1,
+                ),
+            ]
+        )
+
+        assert (
+            catalog.find_exact(
+                Step("given", 'a user named "bob"', 'a user named "{bob}"', ["bob"])
+            ).function_name
+            == "step_user"
+        )
+        assert (
+            catalog.find_exact(
+                Step("when", 'a user named "bob"', 'a user named "{bob}"', ["bob"])
+            )
+            is None
+        )
+
+    def test_catalog_is_shared_not_rebuilt(self):
+        """Test that passing a catalog reuses it instead of copying it."""
+        catalog = StepCatalog(
+            [
+                ExistingStepDef(
+                    "given", "a user exists", "step_user", Path("steps.py"), 1
+                ),
+            ]
+        )
+
+        assert StepCatalog.wrap(catalog) is catalog
+        assert StubGenerator(existing_steps=catalog).catalog is catalog
+
+
+class TestTrigramIndex:
+    """Tests for TrigramIndex."""
+
+    EXISTING_STEPS = [
+        ExistingStepDef(
+            "given",
+            'a user named "{username}"',
+            "step_user_named",
+            Path("auth_steps.py"),
+            10,
+        ),
+        ExistingStepDef(
+            "given",
+            "the shopping cart is empty",
+            "step_cart_empty",
+            Path("cart_steps.py"),
+            5,
+        ),
+        ExistingStepDef(
+            "when",
+            'a user named "{username}" logs in',
+            "step_user_login",
+            Path("auth_steps.py"),
+            15,
+        ),
+        ExistingStepDef(
+            "given",
+            'an admin user named "{username}"',
+            "step_admin_named",
+            Path("auth_steps.py"),
+            20,
+        ),
+    ]
+
+    def test_candidates_filter_by_type_and_trigrams(self):
+        """Test that only same-type steps sharing trigrams are candidates."""
+        index = TrigramIndex(self.EXISTING_STEPS)
+        new_step = Step(
+            "given",
+            'a user named "bob"',
+            'a user named "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        candidates = index.candidates(new_step)
+
+        assert [existing.function_name for _, existing in candidates] == [
+            "step_user_named",
+            "step_admin_named",
+        ]
+
+    def test_short_pattern_keeps_all_candidates(self):
+        """Test that patterns without trigrams fall back to all same-type steps."""
+        index = TrigramIndex(self.EXISTING_STEPS)
+        new_step = Step("given", "go", "go", [], {})
+
+        assert len(index.candidates(new_step)) == 3
+
+    def test_find_similar_steps_with_index_matches_full_scan(self):
+        """Test that indexed lookup returns the same results as a full scan."""
+        scanner = ExistingStepScanner()
+        index = TrigramIndex(self.EXISTING_STEPS)
+        new_step = Step(
+            "given",
+            'a user called "bob"',
+            'a user called "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        full = scanner.find_similar_steps(new_step, self.EXISTING_STEPS, threshold=0.6)
+        indexed = scanner.find_similar_steps(
+            new_step, self.EXISTING_STEPS, threshold=0.6, index=index
+        )
+
+        assert indexed == full
+        assert indexed
+
+    def test_index_over_other_catalog_is_rejected(self):
+        """Test that an index built over different steps is not silently used."""
+        scanner = ExistingStepScanner()
+        index = TrigramIndex(self.EXISTING_STEPS[:2])
+        new_step = Step(
+            "given",
+            'a user named "bob"',
+            'a user named "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        with pytest.raises(ValueError, match="index was not built over existing_steps"):
+            scanner.find_similar_steps(new_step, self.EXISTING_STEPS, index=index)
+
+    def test_list_lookups_reuse_one_catalog(self):
+        """Test that lookups against the same list build its catalog once."""
+        scanner = ExistingStepScanner()
+        existing_steps = list(self.EXISTING_STEPS[:2])
+        new_step = Step(
+            "given",
+            'a user named "bob"',
+            'a user named "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        first = scanner.find_similar_steps(new_step, existing_steps)
+        catalog = scanner.wrapped[2]
+        assert scanner.find_best_matches(new_step, existing_steps, k=1) == first[:1]
+        assert scanner.wrapped[2] is catalog
+
+        existing_steps.append(self.EXISTING_STEPS[2])
+        assert scanner.find_similar_steps(
+            new_step, existing_steps
+        ) == scanner.find_similar_steps(new_step, StepCatalog(existing_steps))
+        assert scanner.wrapped[2] is not catalog
+
+
+class TestBehaveStepMatcher:
+    """Tests for BehaveStepMatcher."""
+
+    EXISTING_STEPS = [
+        ExistingStepDef(
+            "given",
+            'product "{name}" has {count:d} units in stock',
+            "step_stock",
+            Path("s.py"),
+            3,
+        ),
+        ExistingStepDef(
+            "given", "the {role} dashboard is open", "step_dashboard", Path("s.py"), 8
+        ),
+        ExistingStepDef("when", "the user logs in", "step_login", Path("s.py"), 12),
+    ]
+
+    def test_literal_prefix_stops_at_first_placeholder(self):
+        """Test that the trie key is the whole words before the first placeholder."""
+        assert BehaveStepMatcher.literal_prefix("the {role} dashboard is open") == [
+            "the"
+        ]
+        assert BehaveStepMatcher.literal_prefix('product "{name}" has') == ["product"]
+        assert BehaveStepMatcher.literal_prefix("the user logs in") == [
+            "the",
+            "user",
+            "logs",
+            "in",
+        ]
+
+    def test_match_uses_behave_semantics(self):
+        """Test that step text is matched the way behave would match it."""
+        pytest.importorskip("behave")
+        matcher = BehaveStepMatcher(self.EXISTING_STEPS)
+
+        match = matcher.match("given", 'product "Laptop" has 10 units in stock')
+        assert match is not None and match.function_name == "step_stock"
+        assert matcher.match("given", 'product "Laptop" has ten units in stock') is None
+        assert (
+            matcher.match("given", "the admin dashboard is open").function_name
+            == "step_dashboard"
+        )
+        assert matcher.match("then", "the user logs in") is None
+
+    def test_generator_skips_steps_matched_by_text(self):
+        """Test that steps behave would match are skipped despite another pattern."""
+        pytest.importorskip("behave")
+        steps = [
+            Step(
+                "given",
+                "the admin dashboard is open",
+                "the admin dashboard is open",
+                [],
+                {},
+            )
+        ]
+
+        generator = StubGenerator(existing_steps=self.EXISTING_STEPS)
+        generator.generate(steps, "test")
+
+        assert [
+            existing.function_name for _, existing in generator.implemented_steps
+        ] == ["step_dashboard"]
+
+
+class TestSimilarityEngines:
+    """Tests for the SimilarityEngine backends."""
+
+    EXISTING_STEPS = [
+        ExistingStepDef(
+            "given",
+            'a user named "{username}"',
+            "step_user_named",
+            Path("auth_steps.py"),
+            10,
+        ),
+        ExistingStepDef(
+            "given",
+            "the shopping cart is empty",
+            "step_cart_empty",
+            Path("cart_steps.py"),
+            5,
+        ),
+        ExistingStepDef(
+            "when",
+            'a user named "{username}" logs in',
+            "step_user_login",
+            Path("auth_steps.py"),
+            15,
+        ),
+    ]
+
+    def test_exact_engine_matches_scanner(self):
+        """Test that the exact engine returns the full-scan best match."""
+        engine = ExactSimilarityEngine(self.EXISTING_STEPS)
+        new_step = Step(
+            "given",
+            'a user named "bob"',
+            'a user named "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        expected = ExistingStepScanner().find_similar_steps(
+            new_step, self.EXISTING_STEPS
+        )[:1]
+
+        assert engine.find_best_matches(new_step) == expected
+
+    def test_exact_engine_finds_matches_the_trigram_engine_drops(self):
+        """Test that the default engine is not limited by trigram overlap."""
+        existing_steps = [
+            ExistingStepDef("given", "a_b_c_d_e_f_g_h", "step_spread", Path("s.py"), 1)
+        ]
+        new_step = Step("given", "abcdefgh", "abcdefgh", [], {})
+
+        assert TrigramSimilarityEngine(existing_steps).find_best_matches(new_step) == []
+        assert ExactSimilarityEngine(existing_steps).find_best_matches(new_step) == (
+            ExistingStepScanner().find_similar_steps(new_step, existing_steps)
+        )
+        assert ExactSimilarityEngine(existing_steps).find_best_matches(new_step)
+
+    def test_lsh_engine_finds_near_duplicate(self):
+        """Test that the LSH engine retrieves and re-ranks a near duplicate."""
+        engine = MinHashLSHEngine(self.EXISTING_STEPS)
+        new_step = Step(
+            "given",
+            'a user named "bob"',
+            'a user named "{name}"',
+            ["name"],
+            {"name": "str"},
+        )
+
+        matches = engine.find_best_matches(new_step)
+
+        assert len(matches) == 1
+        assert matches[0][1].function_name == "step_user_named"
+
+    def test_lsh_signature_is_deterministic(self):
+        """Test that signatures do not depend on the engine instance."""
+        first = MinHashLSHEngine([])
+        second = MinHashLSHEngine([])
+
+        assert first.signature("the cart is empty") == second.signature(
+            "the cart is empty"
+        )
+        assert len(first.signature("go")) == MinHashLSHEngine.NUM_PERM
+
+    def test_lsh_lookups_do_not_grow_shingle_table(self):
+        """Test that only catalog shingles are memoized."""
+        engine = MinHashLSHEngine(self.EXISTING_STEPS)
+        size = len(engine.shingle_hashes)
+
+        engine.find_best_matches(
+            Step("given", "a brand new step", "a brand new step", [], {})
+        )
+
+        assert len(engine.shingle_hashes) == size
+
+    def test_match_all_aligns_with_input(self):
+        """Test that batch matching returns one result per step, in order."""
+        engine = ExactSimilarityEngine(self.EXISTING_STEPS)
+        steps = [
+            Step("then", "nothing similar", "nothing similar", [], {}),
+            Step(
+                "given",
+                'a user named "bob"',
+                'a user named "{bob}"',
+                ["bob"],
+                {"bob": "str"},
+            ),
+        ]
+
+        results = engine.match_all(steps)
+
+        assert results[0] is None
+        assert results[1][1].function_name == "step_user_named"
+
+    def test_numpy_engine_matches_exact_engine(self):
+        """Test that the NumPy batch engine agrees with the exact engine."""
+        pytest.importorskip("numpy")
+        steps = [
+            Step(
+                "given",
+                'a user named "bob"',
+                'a user named "{bob}"',
+                ["bob"],
+                {"bob": "str"},
+            ),
+            Step(
+                "given",
+                "the shopping cart is emptied",
+                "the shopping cart is emptied",
+                [],
+                {},
+            ),
+            Step(
+                "when",
+                'a user named "bob" logs in',
+                'a user named "{bob}" logs in',
+                ["bob"],
+                {"bob": "str"},
+            ),
+            Step("then", "go", "go", [], {}),
+        ]
+
+        expected = ExactSimilarityEngine(self.EXISTING_STEPS).match_all(steps)
+
+        assert NumpySimilarityEngine(self.EXISTING_STEPS).match_all(steps) == expected
+
+    def test_token_engine_treats_placeholders_as_equal(self):
+        """Test that placeholder names do not count as differences."""
+        engine = TokenEditDistanceEngine(self.EXISTING_STEPS)
+        new_step = Step(
+            "given",
+            'a user named "laptop"',
+            'a user named "{laptop}"',
+            ["laptop"],
+            {"laptop": "str"},
+        )
+
+        assert engine.find_best_matches(new_step) == [(1.0, self.EXISTING_STEPS[0])]
+
+    def test_token_engine_distance_counts_word_edits(self):
+        """Test the bit-parallel distance on word tokens."""
+        engine = TokenEditDistanceEngine([])
+        query = engine.tokenize("the shopping cart is empty")
+        peq: dict[int, int] = {}
+        for position, token in enumerate(query):
+            peq[token] = peq.get(token, 0) | (1 << position)
+
+        assert (
+            engine.distance(peq, len(query), engine.tokenize("the cart is empty")) == 1
+        )
+        assert (
+            engine.distance(
+                peq, len(query), engine.tokenize("the shopping basket was empty")
+            )
+            == 2
+        )
+        assert engine.distance(peq, len(query), ()) == 5
+
+    def test_token_engine_lookups_do_not_grow_vocabulary(self):
+        """Test that query words get no token IDs of their own."""
+        engine = TokenEditDistanceEngine(self.EXISTING_STEPS)
+        size = len(engine.token_ids)
+        new_step = Step(
+            "given",
+            'a brand new user named "bob"',
+            'a brand new user named "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        matches = engine.find_best_matches(new_step)
+
+        assert len(engine.token_ids) == size
+        assert matches == [(1 - 2 / 8, self.EXISTING_STEPS[0])]
+
+    def test_generator_rejects_unknown_engine(self):
+        """Test that an unknown engine name is rejected."""
+        with pytest.raises(ValueError, match="Unknown similarity engine"):
+            StubGenerator(similarity_engine="bogus")
+
+
+class TestStepConflicts:
+    """Tests for find_step_conflicts."""
+
+    def test_duplicates_ignore_placeholder_names(self):
+        """Test that patterns differing only in placeholder names are duplicates."""
+        catalog = StepCatalog(
+            [
+                ExistingStepDef(
+                    "given", 'a user named "{name}"', "step_a", Path("a.py"), 3
+                ),
+                ExistingStepDef(
+                    "given", 'a user named "{username}"', "step_b", Path("b.py"), 7
+                ),
+                ExistingStepDef(
+                    "when", 'a user named "{name}"', "step_c", Path("b.py"), 12
+                ),
+            ]
+        )
+
+        conflicts = find_step_conflicts(catalog)
+
+        assert [
+            (c.kind, c.first.function_name, c.second.function_name) for c in conflicts
+        ] == [("duplicate", "step_a", "step_b")]
+
+    def test_ambiguous_in_either_order(self):
+        """Test that a pattern matching another pattern's text is reported once."""
+        pytest.importorskip("behave")
+        catalog = StepCatalog(
+            [
+                ExistingStepDef(
+                    "given",
+                    'a user with email "{email}" and password "{password}"',
+                    "step_a",
+                    Path("a.py"),
+                    3,
+                ),
+                ExistingStepDef(
+                    "given", 'a user with email "{email}"', "step_b", Path("a.py"), 9
+                ),
+                ExistingStepDef(
+                    "given", "a user with no email", "step_c", Path("a.py"), 15
+                ),
+            ]
+        )
+
+        conflicts = find_step_conflicts(catalog)
+
+        assert [
+            (c.kind, c.first.function_name, c.second.function_name) for c in conflicts
+        ] == [("ambiguous", "step_a", "step_b")]
+
+
+class TestSimilarityCache:
+    """Tests for SimilarityCache."""
+
+    EXISTING_STEPS = [
+        ExistingStepDef(
+            "given",
+            'a user named "{username}"',
+            "step_user_named",
+            Path("auth_steps.py"),
+            10,
+        ),
+        ExistingStepDef(
+            "given",
+            "the shopping cart is empty",
+            "step_cart_empty",
+            Path("cart_steps.py"),
+            5,
+        ),
+    ]
+    STEPS = [
+        Step(
+            "given",
+            'a user called "bob"',
+            'a user called "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        ),
+        Step("given", "the weather is sunny", "the weather is sunny", [], {}),
+    ]
+
+    def test_warm_run_is_answered_from_cache(self, tmp_path):
+        """Test that a second run reuses cached matches and generates the same code."""
+        catalog = StepCatalog(self.EXISTING_STEPS)
+        cold = StubGenerator(
+            existing_steps=catalog, cache=SimilarityCache(tmp_path)
+        ).generate(self.STEPS)
+
+        cache = SimilarityCache(tmp_path)
+        assert len(cache) == 2
+        generator = StubGenerator(existing_steps=catalog, cache=cache)
+        generator.similarity_engine = None  # any engine call would fail
+        warm = generator.generate(self.STEPS)
+
+        assert warm == cold
+        assert "Similar step exists in auth_steps.py:10" in warm
+
+    def test_catalog_change_misses(self, tmp_path):
+        """Test that results are scoped to the catalog fingerprint."""
+        cache = SimilarityCache(tmp_path)
+        scope = cache.scope(StepCatalog(self.EXISTING_STEPS), "exact", 0.6)
+        edited = [
+            ExistingStepDef(
+                "given",
+                'a user named "{name}"',
+                "step_user_named",
+                Path("auth_steps.py"),
+                10,
+            )
+        ]
+
+        assert cache.scope(StepCatalog(edited), "exact", 0.6) != scope
+        assert cache.scope(StepCatalog(self.EXISTING_STEPS), "lsh", 0.6) != scope
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        """Test that the cache is bounded and keeps recently used keys."""
+        catalog = StepCatalog(self.EXISTING_STEPS)
+        cache = SimilarityCache(tmp_path, max_entries=2)
+
+        cache.put_many([("a", None), ("b", (0.7, self.EXISTING_STEPS[1]))], catalog)
+        assert cache.get_many(["a"], catalog) == {"a": None}
+        cache.put_many([("c", None)], catalog)
+
+        assert len(cache) == 2
+        assert set(cache.get_many(["a", "b", "c"], catalog)) == {"a", "c"}
+
+
+class TestFeatureCache:
+    """Tests for FeatureCache."""
+
+    FEATURE = """
+Feature: Checkout
+  Scenario: Pay
+    Given a cart with 2 items
+    When the user pays with "visa":
+      | amount |
+      | 9.99   |
+    Then a receipt is sent
+"""
+
+    def test_warm_parse_is_answered_from_cache(self, tmp_path):
+        """Test that cached steps equal a fresh parse and edits miss."""
+        feature_file = tmp_path / "checkout.feature"
+        feature_file.write_text(self.FEATURE)
+        cache = FeatureCache(tmp_path / "cache")
+        cold = GherkinParser(cache=cache).parse_file(feature_file)
+        cache.close()
+
+        cache = FeatureCache(tmp_path / "cache")
+        parser = GherkinParser(cache=cache)
+        key = cache.key(parser.cache_scope, feature_file.read_bytes())
+
+        assert len(cache) == 1
+        assert cache.get(key) == cold == GherkinParser().parse_file(feature_file)
+        assert cold[1].param_types == {"visa": "str"} and cold[1].has_table
+
+        cache.put(key, cold[:1])
+        assert parser.parse_file(feature_file) == cold[:1]
+
+        feature_file.write_text(self.FEATURE.replace("2 items", "3 items"))
+        assert parser.parse_file(feature_file)[0].text == "a cart with 3 items"
+        cache.close()
+        assert len(cache) == 2
+        assert cache.scope(GherkinParser("behave")) != parser.cache_scope
+
+    def test_entries_store_a_digest_not_the_file(self, tmp_path):
+        """Test that keys are fixed-size digests and entries hold only the steps."""
+        content = (self.FEATURE + "# A long comment line\n" * 100).encode()
+        steps = list(GherkinParser().iter_steps(content.decode()))
+        cache = FeatureCache(tmp_path)
+        key = cache.key("scope", content)
+        cache.put(key, steps)
+        cache.flush()
+
+        assert len(key) < 32
+        assert key != cache.key("other scope", content)
+        assert key != cache.key("scope", content.replace(b"2 items", b"3 items"))
+        assert (cache.directory / f"{key}.marshal").stat().st_size < len(content)
+        assert cache.get(key) == steps
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path, monkeypatch):
+        """Test that stored steps are bounded by size and keep recent hits."""
+        clock = iter(range(100))
+        monkeypatch.setattr("generate_stubs.time.time", lambda: next(clock))
+        steps = GherkinParser().iter_steps(self.FEATURE)
+        cache = FeatureCache(tmp_path)
+        cache.put("a", list(steps))
+        cache.flush()
+        cache.max_bytes = (cache.directory / "a.marshal").stat().st_size * 2
+
+        cache.put("", cache.get("a"))
+        cache.flush()
+        assert cache.get("a") is not None
+        cache.flush()
+        cache.put("c", cache.get("a"))
+        cache.flush()
+
+        assert len(cache) == 2
+        assert cache.get("a") is not None and cache.get("") is None
+
 
 class TestStubGenerator:
     """Tests for StubGenerator."""
 
+    def test_shared_catalog_is_not_rebuilt(self):
+        """Test that a shared catalog is used as is, even when empty."""
+        catalog = StepCatalog()
+        generator = StubGenerator(existing_steps=catalog)
+
+        assert generator.catalog is catalog
+        assert generator.existing_steps is catalog.steps
+
     def test_generate_function_name_base(self):
         """Test function name generation."""
         generator = StubGenerator()
@@ -415,7 +1562,7 @@ class TestStubGenerator:
         assert "from decimal import Decimal" in code
         assert "from behave import given, when, then" in code
         assert "from behave.runner import Context" in code
-        assert '@given(\'a user named "{name}"\')' in code
+        assert "@given('a user named \"{name}\"')" in code
         assert "def " in code
         assert "context: Context" in code
         assert "name: str" in code
@@ -490,6 +1637,80 @@ class TestStubGenerator:
         assert "auth_steps.py:42" in code
         assert "Consider reusing or refactoring" in code
 
+    def test_parallel_generation_is_identical_to_serial(self, tmp_path):
+        """Test that --jobs output is byte-identical to the serial path."""
+        existing_steps = [
+            ExistingStepDef(
+                "given",
+                f'user {i} named "{{name}}"',
+                f"step_user_{i}",
+                Path("auth_steps.py"),
+                i,
+            )
+            for i in range(20)
+        ]
+        steps = [
+            Step(
+                "given",
+                f'user {i} named "bob"',
+                f'user {i} named "{{bob}}"',
+                ["bob"],
+                {"bob": "str"},
+            )
+            for i in range(0, 80, 2)
+        ]
+
+        serial = StubGenerator(existing_steps=existing_steps).generate(steps, "test")
+        parallel = StubGenerator(existing_steps=existing_steps, jobs=2).generate(
+            steps, "test"
+        )
+
+        assert len(steps) >= StubGenerator.MIN_PARALLEL_STEPS
+        assert "Similar step exists" in serial
+        assert parallel == serial
+
+        cache = SimilarityCache(tmp_path)
+        generator = StubGenerator(existing_steps=existing_steps, jobs=2, cache=cache)
+
+        assert generator.generate(steps, "test") == serial
+        assert len(cache) == len(steps) - len(generator.implemented_steps)
+
+    def test_generate_skips_implemented_steps(self):
+        """Test that steps with an exact existing definition get no stub."""
+        existing_steps = [
+            ExistingStepDef(
+                "given",
+                'a user named "{username}"',
+                "step_user_named",
+                Path("auth_steps.py"),
+                3,
+            ),
+        ]
+        steps = [
+            Step(
+                "given",
+                'a user named "alice"',
+                'a user named "{alice}"',
+                ["alice"],
+                {"alice": "str"},
+            ),
+            Step("given", "the cart is empty", "the cart is empty", [], {}),
+        ]
+
+        generator = StubGenerator(existing_steps=existing_steps)
+        code = generator.generate(steps, "test")
+
+        assert "@given('a user named" not in code
+        assert "@given('the cart is empty')" in code
+        assert [
+            existing.function_name for _, existing in generator.implemented_steps
+        ] == ["step_user_named"]
+
+        code = StubGenerator(
+            existing_steps=existing_steps, skip_implemented=False
+        ).generate(steps, "test")
+        assert "@given('a user named \"{alice}\"')" in code
+
     def test_generate_with_multiple_step_types(self):
         """Test generating stubs with all step types."""
         generator = StubGenerator()
@@ -497,7 +1718,13 @@ class TestStubGenerator:
         steps = [
             Step("given", "a user exists", "a user exists", [], {}),
             Step("when", "the user logs in", "the user logs in", [], {}),
-            Step("then", "the user should be authenticated", "the user should be authenticated", [], {}),
+            Step(
+                "then",
+                "the user should be authenticated",
+                "the user should be authenticated",
+                [],
+                {},
+            ),
         ]
 
         code = generator.generate(steps, "test")
@@ -505,9 +1732,9 @@ class TestStubGenerator:
         assert "# Given Steps - Setup and Preconditions" in code
         assert "# When Steps - Actions and Events" in code
         assert "# Then Steps - Assertions and Verification" in code
-        assert '@given(' in code
-        assert '@when(' in code
-        assert '@then(' in code
+        assert "@given(" in code
+        assert "@when(" in code
+        assert "@then(" in code
 
     def test_generate_with_type_inference(self):
         """Test generating stubs with proper type inference."""
@@ -536,6 +1763,398 @@ class TestStubGenerator:
         assert "filename: str" in code
 
 
+class TestSqliteStepCatalog:
+    """Tests for SqliteStepCatalog and FtsSimilarityEngine."""
+
+    EXISTING_STEPS = [
+        ExistingStepDef(
+            "given",
+            'a user named "{username}"',
+            "step_user_named",
+            Path("auth_steps.py"),
+            10,
+        ),
+        ExistingStepDef(
+            "given",
+            "the shopping cart is empty",
+            "step_cart_empty",
+            Path("cart_steps.py"),
+            5,
+        ),
+        ExistingStepDef(
+            "when",
+            "I add {count:d} items to the Cart",
+            "step_add_items",
+            Path("cart_steps.py"),
+            12,
+        ),
+    ]
+
+    def test_search_is_case_insensitive_substring(self):
+        """Test that search finds every definition mentioning the text."""
+        catalog = SqliteStepCatalog(self.EXISTING_STEPS)
+
+        assert [e.function_name for e in catalog.search("cart")] == [
+            "step_cart_empty",
+            "step_add_items",
+        ]
+        assert [e.function_name for e in catalog.search("cart", step_type="when")] == [
+            "step_add_items"
+        ]
+        assert [e.function_name for e in catalog.search("{")] == [
+            "step_user_named",
+            "step_add_items",
+        ]
+
+    def test_database_is_shared_until_catalog_changes(self, tmp_path):
+        """Test that an up-to-date file is reused and a stale one rebuilt."""
+        path = tmp_path / SqliteStepCatalog.FILENAME
+        SqliteStepCatalog(self.EXISTING_STEPS, path=path).database()
+        built = path.stat().st_mtime_ns
+
+        SqliteStepCatalog(self.EXISTING_STEPS, path=path).database()
+        assert path.stat().st_mtime_ns == built
+
+        changed = SqliteStepCatalog(self.EXISTING_STEPS[:2], path=path)
+        assert len(changed.search("items")) == 0
+
+    def test_engine_finds_similar_step(self):
+        """Test that full-text candidates are re-ranked like the exact engine."""
+        engine = FtsSimilarityEngine(self.EXISTING_STEPS)
+        step = Step(
+            "given",
+            'a user called "bob"',
+            'a user called "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        matches = engine.find_best_matches(step, k=1, threshold=0.6)
+
+        assert matches and matches[0][1].function_name == "step_user_named"
+        assert matches == ExactSimilarityEngine(self.EXISTING_STEPS).find_best_matches(
+            step
+        )
+
+
+class TestCompiledStepIndex:
+    """Tests for CompiledStepIndex."""
+
+    EXISTING_STEPS = [
+        ExistingStepDef(
+            "given",
+            'a user named "{username}"',
+            "step_user_named",
+            Path("auth_steps.py"),
+            10,
+        ),
+        ExistingStepDef(
+            "given",
+            "the shopping cart is empty",
+            "step_cart_empty",
+            Path("cart_steps.py"),
+            5,
+        ),
+        ExistingStepDef(
+            "when",
+            "I add {count:d} items to the cart",
+            "step_add_items",
+            Path("cart_steps.py"),
+            12,
+        ),
+        ExistingStepDef("then", "ok", "step_ok", Path("misc_steps.py"), 3),
+    ]
+
+    def test_roundtrip(self, tmp_path):
+        """Test that definitions survive compiling and mapping the index."""
+        path = tmp_path / "library.stepidx"
+
+        assert CompiledStepIndex.write(self.EXISTING_STEPS, path) == 4
+        index = CompiledStepIndex(path)
+
+        assert len(index) == 4
+        assert sorted(index, key=lambda e: e.line_number) == sorted(
+            self.EXISTING_STEPS, key=lambda e: e.line_number
+        )
+
+    def test_prebuilt_postings_match_fresh_index(self, tmp_path):
+        """Test that a catalog seeded from the index scores like a scanned one."""
+        path = tmp_path / "library.stepidx"
+        CompiledStepIndex.write(self.EXISTING_STEPS[:3], path)
+        local = [
+            ExistingStepDef(
+                "given",
+                "a user named {name} logs in",
+                "step_login",
+                Path("local_steps.py"),
+                1,
+            )
+        ]
+
+        fresh = TrigramIndex(StepCatalog(self.EXISTING_STEPS[:3] + local))
+        mapped = TrigramIndex(StepCatalog(local, prebuilt=CompiledStepIndex(path)))
+        step = Step(
+            "given",
+            'a user named "bob"',
+            'a user named "{bob}"',
+            ["bob"],
+            {"bob": "str"},
+        )
+
+        assert mapped.trigram_counts == fresh.trigram_counts
+        assert mapped.candidates(step) == fresh.candidates(step)
+
+    def test_rejects_other_files(self, tmp_path):
+        """Test that files with no magic header or another version are refused."""
+        path = tmp_path / "library.stepidx"
+        path.write_bytes(b"not an index")
+
+        with pytest.raises(ValueError):
+            CompiledStepIndex(path)
+
+    def test_rejects_truncated_files(self, tmp_path, capsys):
+        """Test that an index cut short anywhere after its header is refused."""
+        import argparse
+
+        path = tmp_path / "library.stepidx"
+        CompiledStepIndex.write(self.EXISTING_STEPS, path)
+        data = path.read_bytes()
+
+        for end in range(CompiledStepIndex.HEADER.size, len(data)):
+            path.write_bytes(data[:end])
+            with pytest.raises(ValueError, match="truncated"):
+                CompiledStepIndex(path)
+
+        assert load_step_libraries(argparse.Namespace(step_library=[path])) is None
+        assert "truncated or corrupt" in capsys.readouterr().err
+
+    def test_close_unmaps_the_file(self, tmp_path):
+        """Test that the index and a catalog built on it release the mapping."""
+        path = tmp_path / "library.stepidx"
+        CompiledStepIndex.write(self.EXISTING_STEPS, path)
+
+        with CompiledStepIndex(path) as index:
+            assert len(list(index)) == 4
+        assert index.buffer.closed
+
+        catalog = StepCatalog(prebuilt=CompiledStepIndex(path))
+        catalog.close()
+        assert catalog.prebuilt.buffer.closed
+
+
+class TestStubDaemon:
+    """Tests for StubDaemon."""
+
+    STEP_FILE = (
+        "from behave import given\n\n"
+        "@given('a user named \"{username}\"')\n"
+        "def step_user(context, username):\n    pass\n"
+    )
+    FEATURE = (
+        "Feature: Login\n"
+        "  Scenario: Login\n"
+        '    Given a user named "alice"\n'
+        "    When the user logs in\n"
+    )
+
+    def test_handle_matches_local_run_and_tracks_changes(self, tmp_path):
+        """Test that requests see step file edits after the catalog goes stale."""
+        steps_dir = tmp_path / "steps"
+        steps_dir.mkdir()
+        (steps_dir / "auth_steps.py").write_text(self.STEP_FILE)
+        feature = tmp_path / "login.feature"
+        feature.write_text(self.FEATURE)
+
+        daemon = StubDaemon(steps_dir)
+        response = daemon.handle({"features": [str(feature)]})
+
+        local_generator = StubGenerator(
+            existing_steps=ExistingStepScanner().scan_directory(steps_dir)
+        )
+        assert response["exit"] == 0
+        assert response["code"] == generate_from_features([feature], local_generator)[1]
+        assert "@when('the user logs in')" in response["code"]
+        assert "Skipped 1 steps already implemented" in response["log"]
+
+        (steps_dir / "login_steps.py").write_text(
+            "from behave import when\n\n"
+            "@when('the user logs in')\n"
+            "def step_login(context):\n    pass\n"
+        )
+        daemon.stale.set()
+        response = daemon.handle({"features": [str(feature)], "list_undefined": True})
+
+        assert response["exit"] == 0
+        assert len(daemon.generator.catalog) == 2
+
+    def test_step_libraries_and_feature_eviction(self, tmp_path, monkeypatch):
+        """Test that compiled libraries join the catalog and parses stay bounded."""
+        library = tmp_path / "library.stepidx"
+        CompiledStepIndex.write(
+            [
+                ExistingStepDef(
+                    "when", "the user logs in", "step_login", Path("lib_steps.py"), 1
+                )
+            ],
+            library,
+        )
+        steps_dir = tmp_path / "steps"
+        steps_dir.mkdir()
+        (steps_dir / "auth_steps.py").write_text(self.STEP_FILE)
+        features = []
+        for i in range(3):
+            features.append(tmp_path / f"f{i}.feature")
+            features[-1].write_text(self.FEATURE)
+        monkeypatch.setattr(StubDaemon, "MAX_FEATURES", 2)
+
+        daemon = StubDaemon(steps_dir, step_libraries=[CompiledStepIndex(library)])
+        response = daemon.handle(
+            {"features": [str(features[0])], "list_undefined": True}
+        )
+
+        assert response["exit"] == 0
+        assert [e.function_name for e in daemon.generator.catalog] == [
+            "step_login",
+            "step_user",
+        ]
+
+        for feature in features:
+            daemon.parse_feature(feature)
+        features[2].unlink()
+        with pytest.raises(OSError):
+            daemon.parse_feature(features[2])
+        assert list(daemon.features) == [features[1]]
+
+    def test_serves_requests_over_unix_socket(self, tmp_path):
+        """Test a request/response round trip through the socket."""
+        import socket
+        import threading
+        import time
+
+        if not hasattr(socket, "AF_UNIX"):
+            pytest.skip("Unix sockets not supported")
+        (tmp_path / "auth_steps.py").write_text(self.STEP_FILE)
+        feature = tmp_path / "login.feature"
+        feature.write_text(self.FEATURE)
+        socket_path = tmp_path / "stubs.sock"
+
+        daemon = StubDaemon(tmp_path)
+        threading.Thread(target=daemon.serve, args=(socket_path,), daemon=True).start()
+        for _ in range(100):
+            if socket_path.exists():
+                break
+            time.sleep(0.01)
+
+        exit_code, code, feature_name = request_stub_daemon(
+            socket_path, {"features": [str(feature)]}
+        )
+
+        assert (exit_code, feature_name) == (0, "login")
+        assert "@when('the user logs in')" in code
+        assert request_stub_daemon(tmp_path / "missing.sock", {"features": []}) is None
+
+
+class TestStartupBudget:
+    """Startup cost of generate_stubs.py, which pre-commit hooks run per commit."""
+
+    # Cumulative `-X importtime` cost of importing generate_stubs, best of
+    # RUNS, in microseconds (about 26 ms when the budget was set). Wall-clock
+    # time depends on the machine, so the budget is only checked with
+    # STUBS_BENCHMARK=1 set.
+    IMPORT_BUDGET_US = 40_000
+    RUNS = 5
+
+    # Only the code paths that use these may import them
+    LAZY_MODULES = {
+        "ast",
+        "behave",
+        "concurrent.futures",
+        "dataclasses",
+        "difflib",
+        "hashlib",
+        "inspect",
+        "json",
+        "numpy",
+        "random",
+        "socket",
+        "sqlite3",
+        "typing",
+    }
+
+    def run_python(self, tmp_path, code, *args):
+        """Run code in a fresh interpreter in tmp_path with bytecode; return stderr."""
+        import subprocess
+        import sys
+
+        env = dict(
+            os.environ,
+            PYTHONPATH=str(Path(__file__).parent),
+            PYTHONPYCACHEPREFIX=str(tmp_path / "pycache"),
+        )
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        result = subprocess.run(
+            [sys.executable, *args, "-c", code],
+            cwd=tmp_path,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stderr
+
+    def test_import_skips_slow_modules(self, tmp_path):
+        """Test importing the script loads none of the lazily imported modules."""
+        code = (
+            "import sys, generate_stubs\n"
+            "print(*sorted(sys.modules), file=sys.stderr)"
+        )
+
+        loaded = set(self.run_python(tmp_path, code).splitlines()[-1].split())
+
+        assert loaded.isdisjoint(self.LAZY_MODULES), loaded & self.LAZY_MODULES
+
+    @pytest.mark.skipif(
+        not os.environ.get("STUBS_BENCHMARK"), reason="benchmark; set STUBS_BENCHMARK=1"
+    )
+    def test_import_stays_within_budget(self, tmp_path):
+        """Test importing the script meets the time budget."""
+        self.run_python(tmp_path, "import generate_stubs")  # Writes the bytecode cache
+
+        timings = []
+        for _ in range(self.RUNS):
+            stderr = self.run_python(
+                tmp_path, "import generate_stubs", "-X", "importtime"
+            )
+            timings.extend(
+                int(line.split("|")[1])
+                for line in stderr.splitlines()
+                if line.endswith("| generate_stubs")
+            )
+
+        assert min(timings) <= self.IMPORT_BUDGET_US
+
+    def test_stdout_run_skips_slow_modules(self, tmp_path):
+        """Test a run without existing steps imports none of the slow modules."""
+        feature = tmp_path / "login.feature"
+        feature.write_text(TestStubDaemon.FEATURE)
+        code = (
+            "import contextlib, io, sys, generate_stubs\n"
+            f"sys.argv = ['generate_stubs.py', {str(feature)!r}, '--stdout']\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            "    exit_code = generate_stubs.main()\n"
+            "print(exit_code, *sorted(sys.modules), file=sys.stderr)"
+        )
+
+        exit_code, *loaded = self.run_python(tmp_path, code).splitlines()[-1].split()
+
+        assert exit_code == "0"
+        assert set(loaded).isdisjoint(self.LAZY_MODULES), (
+            set(loaded) & self.LAZY_MODULES
+        )
+        # The feature cache is still written, without sqlite3 or hashlib
+        assert len(FeatureCache(tmp_path / ".bdd-cache")) == 1
+
+
 class TestIntegration:
     """Integration tests."""
 
@@ -543,7 +2162,7 @@ class TestIntegration:
         """Test complete workflow: parse feature file and generate stubs."""
         # Create a test feature file
         feature_file = tmp_path / "test.feature"
-        feature_file.write_text('''
+        feature_file.write_text("""
 Feature: User Authentication
 
   Background:
@@ -565,7 +2184,7 @@ Feature: User Authentication
       | username | password |
       | alice    | wrong    |
       | bob      | invalid  |
-''')
+""")
 
         # Parse the feature file
         parser = GherkinParser()
@@ -594,6 +2213,7 @@ Feature: User Authentication
 
         # Verify it's syntactically valid Python
         import ast
+
         try:
             ast.parse(code)
         except SyntaxError as e: